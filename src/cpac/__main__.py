@@ -3,17 +3,22 @@
 """Main module for cpac package."""
 
 import argparse
+from contextlib import contextmanager
 from itertools import chain
 import logging
+from math import ceil
 import os
 import sys
-
-from docker.errors import DockerException, NotFound
+from typing import Optional
 
 from cpac import __version__
-from cpac.backends import Backends
-from cpac.helpers import cpac_parse_resources as parse_resources, TODOs
+from cpac.helpers import (
+    cpac_parse_resources as parse_resources,
+    drop_extra_arg,
+    TODOs,
+)
 from cpac.utils.bare_wrap import add_bare_wrapper, call, WRAPPED
+from cpac.utils.profiling import profiled, PROFILER, span
 
 _logger = logging.getLogger(__name__)
 _CLARGS: set = {"group", "utils"}
@@ -37,11 +42,28 @@ def address(str_addy):
     return addr, port
 
 
+def positive_int(value: str) -> int:
+    """Parse a commandline argument that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        msg = f"must be at least 1, not {number}"
+        raise argparse.ArgumentTypeError(msg)
+    return number
+
+
+def _docker_exceptions() -> tuple:
+    """Import Docker's exceptions only once an exception needs matching."""
+    from docker.errors import DockerException, NotFound
+
+    return DockerException, NotFound
+
+
 def help_call(argument_list: list) -> bool:
     """Check if the helpstring is being called."""
     return "--help" in argument_list or "-h" in argument_list
 
 
+@profiled()
 def _parser():
     """Generate parser.
 
@@ -115,6 +137,197 @@ def _parser():
         "or any other command that does not start with - or --)\n",
     )
 
+    parser.add_argument(
+        "--bind_max_depth",
+        type=int,
+        help="deepest number of path components a directory\nautomatically "
+        "bound from the data configuration\nmay have. Deeper paths are "
+        "bound through their\nancestor at this depth.",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--bind_min_fanout",
+        type=positive_int,
+        default=2,
+        help="minimum number of subdirectories with data a\ndirectory needs "
+        "before it is bound in place of\nthose subdirectories when "
+        "automatically binding\npaths from the data configuration.",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--parallel_participants",
+        "--parallel-participants",
+        dest="parallel_participants",
+        type=int,
+        help="run each participant listed in the data\nconfiguration (or, "
+        "without one, each subject\nand session in the BIDS directory) in "
+        "its own\ncontainer, with up to N running at once. Each\n"
+        "participant's output goes to its own log file.",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--memory_budget",
+        type=float,
+        help="total memory in GB that participants run with\n"
+        "--parallel_participants may use at once\n(default: all of this "
+        "host's memory)",
+        metavar="GB",
+    )
+
+    parser.add_argument(
+        "--cpu_budget",
+        type=int,
+        help="total CPUs that participants run with\n--parallel_participants "
+        "may use at once\n(default: all CPUs available to cpac)",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--participant_log_dir",
+        help="directory for per-participant logs from\n"
+        "--parallel_participants (default:\nOUTPUT_DIR/participant_logs)",
+        metavar="PATH",
+    )
+
+    parser.add_argument(
+        "--plan_from",
+        help="output directory (or glob of callback.log\nfiles) of earlier "
+        "runs. With\n--parallel_participants, predict each\nparticipant's "
+        "peak memory and wall time from\nthose runs, start the longest "
+        "first, and set\neach participant's --mem_gb (and, with Docker,\n"
+        "its container's memory limit) to its\npredicted memory.",
+        metavar="PATH",
+    )
+
+    parser.add_argument(
+        "--limit_resources",
+        action="store_true",
+        help="limit each container's memory and CPUs to what\nthe pipeline "
+        "configuration's system_config\nallows (maximum_memory_per_participant "
+        "and\nmax_cores_per_participant times\nnum_participants_at_once) and "
+        "cap each process's\nthreads at max_cores_per_participant, so "
+        "several\ncontainers can share a host without\noversubscribing it. "
+        "Apptainer/Singularity needs\ncgroups support for --cpus and --memory.",
+    )
+
+    parser.add_argument(
+        "--pin_cpus",
+        action="store_true",
+        help="with --parallel_participants, run each\nparticipant's container "
+        "on its own CPUs, within\none NUMA node where they fit (Docker "
+        "cpusets;\nnumactl or taskset for Apptainer/Singularity)",
+    )
+
+    parser.add_argument(
+        "--share_host",
+        action="store_true",
+        help="wait to start each container until other cpac\ninvocations "
+        "on this host that also use\n--share_host leave free the memory and "
+        "CPUs\nthe pipeline configuration allows it\n(maximum_memory_per_"
+        "participant and\nmax_cores_per_participant times\n"
+        "num_participants_at_once). Invocations share\nlock files in "
+        "$CPAC_SLOT_DIR\n(default: /var/tmp/cpac-slots).",
+    )
+
+    parser.add_argument(
+        "--oom_retries",
+        type=int,
+        default=0,
+        help="times to run a participant again with more\nmemory if C-PAC "
+        "runs out of memory (the\ncontainer is OOM-killed or exits with "
+        "code 137)",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--oom_memory_factor",
+        type=float,
+        default=1.5,
+        help="factor to scale C-PAC's --mem_gb and any\ncontainer memory "
+        "limit by on each\n--oom_retries retry (default: 1.5)",
+        metavar="F",
+    )
+
+    parser.add_argument(
+        "--detach",
+        action="store_true",
+        help="with Docker, start C-PAC and return without\nwaiting for it. "
+        "The run keeps going if the\nterminal or SSH session closes; follow "
+        'it with\n"cpac attach", "cpac logs" and "cpac status".',
+    )
+
+    parser.add_argument(
+        "--tee_log",
+        help="also write C-PAC's output to this file, gzipping\nit to "
+        "PATH.1.gz (keeping 5) each time it\nreaches --tee_log_max_mb. With "
+        "\n--parallel_participants, each participant\nwrites its own file, "
+        "named after PATH.",
+        metavar="PATH",
+    )
+
+    parser.add_argument(
+        "--tee_log_max_mb",
+        type=float,
+        default=100,
+        help="size at which to rotate --tee_log (default: 100)",
+        metavar="MB",
+    )
+
+    parser.add_argument(
+        "--log_timestamps",
+        action="store_true",
+        help="prefix each line of C-PAC's output with a\ntimestamp. With "
+        "Docker, also send C-PAC's\nstandard error to standard error, "
+        "marked\n[stderr].",
+    )
+
+    parser.add_argument(
+        "--telemetry_interval",
+        type=float,
+        help="every this many seconds, record the running\ncontainer's CPU, "
+        "memory, block I/O and\nprocesses to telemetry/<participant>.csv "
+        "in\nthe output directory, and print peaks when it\nexits",
+        metavar="SECONDS",
+    )
+
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        help="while C-PAC runs, serve OpenMetrics (Prometheus)\nmetrics at "
+        "http://127.0.0.1:PORT/metrics:\nrunning containers, queued "
+        "participants, each\ncontainer's CPU and memory, passed and failed"
+        "\nparticipants, and seconds spent in each phase",
+        metavar="PORT",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="when cpac exits, print how long each of its\nsteps took "
+        "(e.g., connecting to Docker,\nreading the pipeline configuration and "
+        "\npreparing bindings), as a tree of phases",
+    )
+
+    parser.add_argument(
+        "--profile_json",
+        help="when cpac exits, write the --profile tree to\nthis JSON file",
+        metavar="PATH",
+    )
+
+    parser.add_argument(
+        "--helper_ttl",
+        type=int,
+        default=0,
+        help="seconds a Docker helper container used for\nin-container "
+        "queries (e.g., the C-PAC version)\nstays running while idle, so "
+        "later cpac calls\ncan reuse it. By default, each cpac call "
+        "stops\nits helper when it finishes.",
+        metavar="SECONDS",
+    )
+
     parser.add_argument(
         "--platform",
         choices=["docker", "singularity", "apptainer"],
@@ -242,6 +455,46 @@ def _parser():
         aliases=["bash", "shell"],
     )
 
+    status_parser = subparsers.add_parser(
+        "status",
+        add_help=True,
+        help="List C-PAC run containers (Docker) with their\nparticipant, "
+        "status and exit code.",
+    )
+    status_parser.add_argument("names", nargs="*", metavar="CONTAINER")
+
+    logs_parser = subparsers.add_parser(
+        "logs",
+        add_help=True,
+        help="Print the output of a C-PAC run container\n(Docker).",
+    )
+    logs_parser.add_argument("name", metavar="CONTAINER")
+    logs_parser.add_argument(
+        "--since",
+        help="only print output since a Unix timestamp or a\nduration ago "
+        "(e.g., 10m, 2h)",
+    )
+    logs_parser.add_argument(
+        "-f", "--follow", action="store_true", help="keep printing new output"
+    )
+
+    attach_parser = subparsers.add_parser(
+        "attach",
+        add_help=True,
+        help="Follow new output of a C-PAC run container\n(Docker) until it exits.",
+    )
+    attach_parser.add_argument("name", metavar="CONTAINER")
+
+    gc_parser = subparsers.add_parser(
+        "gc",
+        add_help=True,
+        help="Remove exited cpac containers and runs left\nbehind by cpac "
+        "processes that are gone (Docker).",
+    )
+    gc_parser.add_argument(
+        "--dry_run", action="store_true", help="only list what would be removed"
+    )
+
     parse_resources.set_args(
         subparsers.add_parser(
             "parse-resources",
@@ -328,6 +581,188 @@ def setup_logging(loglevel):
     )
 
 
+def _run_participants(arg_vars: dict) -> None:
+    """Run each participant in its own container, several at a time."""
+    from subprocess import CalledProcessError
+
+    from cpac.backends import Backends
+    from cpac.utils.metrics import REGISTRY
+    from cpac.utils.planner import planned_flags
+    from cpac.utils.scheduler import (
+        ParticipantJob,
+        participants_from_bids,
+        participants_from_data_config,
+        ParticipantScheduler,
+    )
+
+    data_config = arg_vars.get("data_config_file")
+    if data_config and os.path.isfile(data_config):
+        labels = participants_from_data_config(data_config)
+    elif arg_vars.get("bids_dir") and os.path.isdir(arg_vars["bids_dir"]):
+        labels = participants_from_bids(arg_vars["bids_dir"])
+    else:
+        msg = (
+            "--parallel_participants needs a data configuration file or BIDS "
+            "directory on this host to list participants."
+        )
+        raise FileNotFoundError(msg)
+    if arg_vars.get("detach"):
+        msg = "--detach cannot be combined with --parallel_participants."
+        raise ValueError(msg)
+    flags = drop_extra_arg(arg_vars["extra_args"], "participant_ndx")
+    config = Backends(**arg_vars).config
+    memory_gb = config.get(
+        "pipeline_setup", "system_config", "maximum_memory_per_participant"
+    )
+    cpus = config.get("pipeline_setup", "system_config", "max_cores_per_participant")
+    log_dir = arg_vars.get("participant_log_dir") or os.path.join(
+        arg_vars.get("output_dir") or os.getcwd(), "participant_logs"
+    )
+
+    placer = None
+    if arg_vars.get("pin_cpus"):
+        from cpac.utils.placement import CpuPlacer
+
+        placer = CpuPlacer()
+
+    def launch(job: ParticipantJob):
+        with REGISTRY.timed("setup"):
+            backend = Backends(**arg_vars)
+        if job.memory_limit_gb and hasattr(backend, "docker_kwargs"):
+            backend.docker_kwargs["mem_limit"] = f"{ceil(job.memory_limit_gb * 1024)}m"
+        placement = placer.acquire(job.cpus) if placer is not None else None
+        if placement is not None:
+            print(f"Running {job.label} on CPUs {placement.cpuset_cpus}")
+            backend.pin(placement)
+        run_vars = arg_vars
+        if arg_vars.get("tee_log"):
+            root, ext = os.path.splitext(arg_vars["tee_log"])
+            run_vars = {
+                **arg_vars,
+                "tee_log": f"{root}_{job.index:05d}_{job.label}{ext}",
+            }
+        try:
+            backend.run_with_retries(
+                flags=planned_flags(job, [*flags, "--participant_ndx", str(job.index)]),
+                **run_vars,
+            )
+        except CalledProcessError as process_error:
+            return process_error.returncode
+        finally:
+            if placer is not None:
+                placer.release(placement)
+        return backend.exit_code
+
+    jobs = [
+        ParticipantJob(
+            index,
+            label,
+            float(memory_gb or 1),
+            int(cpus or 1),
+            os.path.join(log_dir, f"{index:05d}_{label}.log"),
+        )
+        for index, label in enumerate(labels)
+    ]
+    if arg_vars.get("plan_from"):
+        from cpac.helpers.cpac_parse_resources import find_callback_logs
+        from cpac.utils.planner import (
+            input_bytes_from_bids,
+            input_bytes_from_data_config,
+            plan,
+            RunHistory,
+        )
+
+        history = RunHistory.from_callback_logs(
+            find_callback_logs(arg_vars["plan_from"])
+        )
+        if not history.runs:
+            print(f"No earlier runs found in {arg_vars['plan_from']}; not planning.")
+        else:
+            jobs = plan(
+                jobs,
+                history,
+                input_bytes_from_data_config(data_config)
+                if data_config and os.path.isfile(data_config)
+                else input_bytes_from_bids(arg_vars["bids_dir"], labels),
+            )
+    scheduler = ParticipantScheduler(
+        jobs,
+        launch,
+        arg_vars["parallel_participants"],
+        arg_vars.get("memory_budget"),
+        arg_vars.get("cpu_budget"),
+    )
+    scheduler.run()
+    print(scheduler.summary())
+    if not scheduler.passed:
+        sys.exit(1)
+
+
+def _run_participant(arg_vars: dict) -> None:
+    """Run C-PAC once, counting the run in the participant metrics."""
+    from subprocess import CalledProcessError
+
+    from cpac.backends import Backends
+    from cpac.utils.metrics import REGISTRY
+
+    with REGISTRY.timed("setup"):
+        backend = Backends(**arg_vars)
+    try:
+        backend.run_with_retries(flags=arg_vars["extra_args"], **arg_vars)
+    except CalledProcessError:
+        REGISTRY.add("cpac_participants_failed")
+        raise
+    REGISTRY.add(
+        "cpac_participants_completed"
+        if backend.exit_code in (0, None)
+        else "cpac_participants_failed"
+    )
+
+
+@contextmanager
+def _serve_metrics(port: Optional[int]):
+    """Serve metrics at ``/metrics`` on ``port`` while the block runs."""
+    if port is None:
+        yield
+        return
+    from cpac.utils.metrics import MetricsServer
+
+    server = MetricsServer(port)
+    print(f"Serving metrics at http://127.0.0.1:{server.port}/metrics")
+    try:
+        yield
+    finally:
+        server.stop()
+
+
+def _manage_runs(args, arg_vars: dict) -> None:
+    """List, follow and clean up C-PAC run containers."""
+    import time
+
+    from cpac.backends import Backends
+    from cpac.backends.docker import parse_since
+
+    if arg_vars.get("platform") not in (None, "docker"):
+        print(f'"cpac {args.command}" is only available with Docker.')
+        sys.exit(1)
+    backend = Backends(**arg_vars)
+    if args.command == "status":
+        backend.status(args.names)
+    elif args.command == "gc":
+        backend.collect_garbage(dry_run=args.dry_run)
+    else:
+        if args.command == "attach":
+            exit_code = backend.attach(args.name)
+        else:
+            exit_code = backend.logs(
+                args.name,
+                since=parse_since(args.since, time.time()) if args.since else None,
+                follow=args.follow,
+            )
+        if exit_code:
+            sys.exit(exit_code)
+
+
 def main(args):
     """Connect to C-PAC container and perform specified action.
 
@@ -339,6 +774,14 @@ def main(args):
     -------
     None
     """
+    if args.command in {"parse-resources", "parse_resources"}:
+        # runs entirely on the host, so skip loading any container backend
+        setup_logging(args.loglevel)
+        parse_resources.main(args)
+        return
+
+    from cpac.backends import Backends
+
     if any("--data_config_file" in arg for arg in args.extra_args):
         try:
             args.data_config_file = args.extra_args[
@@ -379,7 +822,12 @@ def main(args):
             ]
         ):
             arg_vars = setup_help(arg_vars, "participant")
-        Backends(**arg_vars).run(flags=args.extra_args, **arg_vars)
+        elif arg_vars.get("parallel_participants"):
+            with _serve_metrics(arg_vars.get("metrics_port")):
+                _run_participants(arg_vars)
+            return
+        with _serve_metrics(arg_vars.get("metrics_port")):
+            _run_participant(arg_vars)
 
     if args.command == "gradients":
         arg_vars.update(
@@ -407,6 +855,9 @@ def main(args):
             run_type=args.command, flags=args.extra_args, **arg_vars
         )
 
+    elif args.command in ["attach", "gc", "logs", "status"]:
+        _manage_runs(args, arg_vars)
+
     elif args.command in ["pull", "upgrade"]:
         Backends(**arg_vars).pull(force=True, **arg_vars)
 
@@ -421,8 +872,13 @@ def main(args):
     elif args.command == "crash":
         Backends(**arg_vars).read_crash(flags=args.extra_args, **arg_vars)
 
-    elif args.command == "parse-resources":
-        parse_resources.main(args)
+
+def _report_profile(parsed) -> None:
+    """Print or write the timing tree, with ``--profile`` or ``--profile_json``."""
+    if getattr(parsed, "profile", False):
+        print(PROFILER.render(), file=sys.stderr)
+    if getattr(parsed, "profile_json", None):
+        PROFILER.write_json(parsed.profile_json)
 
 
 def run():
@@ -457,6 +913,12 @@ def run():
     options = set(
         chain.from_iterable([o.option_strings for o in parser._get_optional_actions()])
     )
+    # options that take no value do not consume the argument after them
+    switches = set(
+        chain.from_iterable(
+            [o.option_strings for o in parser._get_optional_actions() if o.nargs == 0]
+        )
+    )
     # keep help option with specific command
     for option in ("-h", "--help"):
         options.discard(option)
@@ -471,38 +933,42 @@ def run():
         if not help_call(args):
             # directly call external package and exit on completion or failure
             call(command, args)
-    reordered_args = []
-    option_value_setting = False
-    for i, arg in enumerate(args.copy()):
-        if i == command_index:
-            option_value_setting = False
-        if arg in options:
-            reordered_args.append(args.pop(args.index(arg)))
-            option_value_setting = True
-        elif any(arg.startswith(f"{option}=") for option in options):
-            reordered_args.append(args.pop(args.index(arg)))
-            option_value_setting = True
-        elif option_value_setting:
-            if arg.startswith("-"):
+    with span("reorder arguments"):
+        reordered_args = []
+        option_value_setting = False
+        for i, arg in enumerate(args.copy()):
+            if i == command_index:
                 option_value_setting = False
-            else:
+            if arg in options:
+                reordered_args.append(args.pop(args.index(arg)))
+                option_value_setting = arg not in switches
+            elif any(arg.startswith(f"{option}=") for option in options):
                 reordered_args.append(args.pop(args.index(arg)))
-    args = [*reordered_args, command, *args]
+                option_value_setting = True
+            elif option_value_setting:
+                if arg.startswith("-"):
+                    option_value_setting = False
+                else:
+                    reordered_args.append(args.pop(args.index(arg)))
+        args = [*reordered_args, command, *args]
     # parse args
     parsed = parse_args(args)
-    if not parsed.platform and "--platform" not in args:
-        if parsed.image and os.path.exists(parsed.image):
-            parsed.platform = "singularity"
+    try:
+        if not parsed.platform and "--platform" not in args:
+            if parsed.image and os.path.exists(parsed.image):
+                parsed.platform = "singularity"
+            else:
+                parsed.platform = "docker"
+            try:
+                main(parsed)
+            # fall back on Singularity if Docker not found
+            except _docker_exceptions():  # pragma: no cover
+                parsed.platform = "singularity"
+                main(parsed)
         else:
-            parsed.platform = "docker"
-        try:
-            main(parsed)
-        # fall back on Singularity if Docker not found
-        except (DockerException, NotFound):  # pragma: no cover
-            parsed.platform = "singularity"
             main(parsed)
-    else:
-        main(parsed)
+    finally:
+        _report_profile(parsed)
 
 
 if __name__ == "__main__":
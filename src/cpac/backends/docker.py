@@ -1,27 +1,275 @@
+from hashlib import sha256
+import io
+import json
+from math import ceil
 import os
-from typing import Optional
+import re
+import shlex
+import socket
+import tarfile
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
 
 import docker
 from docker.errors import ImageNotFound
 import dockerpty
 
-from cpac.backends.platform import Backend, PlatformMeta
+from cpac.backends.platform import Backend, OOM_EXIT_CODE, PlatformMeta
+from cpac.utils import cache
+from cpac.utils.cache import VERSION_PATH
+from cpac.utils.configuration import ContainerLimits, memory_mb, PRECONFIG_DIR
+from cpac.utils.log_sink import LogSink
+from cpac.utils.profiling import profiled, span
+from cpac.utils.telemetry import docker_samples
+
+LABEL_PREFIX = "org.fcp-indi.cpac"
+"""prefix of the labels on containers cpac creates"""
+HELPER_IDLE = 300
+"""seconds an unused helper container waits before exiting on its own"""
+HELPER_STAMP = "/tmp/.cpac-helper-last-used"
+"""in-container file touched by every command run in a helper container"""
+HELPER_SCRIPT = (
+    'touch "$0"; '
+    'while [ $(( $(date +%s) - $(stat -c %Y "$0") )) -lt "$1" ]; do sleep 1; done'
+)
+"""keeps a helper container alive until :py:data:`HELPER_STAMP` goes stale"""
+RUN_LABELS = (
+    "participant",
+    "config_hash",
+    "output_dir",
+    "detached",
+    "host",
+    "pid",
+    "started",
+)
+"""labels (after :py:data:`LABEL_PREFIX`) on every C-PAC run container"""
+RUN_COMMANDS = ("attach", "gc", "logs", "status")
+"""cpac commands that manage run containers rather than start them"""
+
+
+def parse_since(since: str, now: float) -> int:
+    """Convert a ``--since`` value to a Unix timestamp.
+
+    Parameters
+    ----------
+    since : str
+        a Unix timestamp, or a duration ago in seconds, minutes, hours or
+        days (e.g., ``"90s"``, ``"10m"``, ``"2h"``, ``"1d"``)
+
+    now : float
+
+    Returns
+    -------
+    int
+
+    Examples
+    --------
+    >>> parse_since("10m", 1_700_000_000)
+    1699999400
+    >>> parse_since("1699999999", 1_700_000_000)
+    1699999999
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if since[-1:] in units:
+        return int(now - float(since[:-1]) * units[since[-1]])
+    return int(float(since))
+
+
+def _pid_alive(pid: int) -> bool:
+    """Return whether a process is running on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def run_record(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize a C-PAC run container from its labels and state.
+
+    Parameters
+    ----------
+    summary : dict
+        a container as listed by the Docker API's ``GET /containers/json``
+
+    Returns
+    -------
+    dict
+        ``name``, ``id``, ``status``, ``exit_code``, ``orphaned`` and each of
+        :py:data:`RUN_LABELS`
+
+    Examples
+    --------
+    >>> record = run_record({
+    ...     "Id": "0123456789abcdef", "Names": ["/cpac-run"], "State": "exited",
+    ...     "Status": "Exited (137) 2 hours ago",
+    ...     "Labels": {"org.fcp-indi.cpac.participant": "sub-01",
+    ...                "org.fcp-indi.cpac.detached": "true"}})
+    >>> record["name"], record["participant"], record["exit_code"]
+    ('cpac-run', 'sub-01', 137)
+    >>> record["orphaned"]
+    False
+    """
+    labels = summary.get("Labels") or {}
+    names = summary.get("Names") or [summary.get("Id", "")[:12]]
+    exit_code = re.match(r"Exited \((-?\d+)\)", summary.get("Status") or "")
+    record = {
+        "name": names[0].lstrip("/"),
+        "id": summary.get("Id", ""),
+        "status": summary.get("State", ""),
+        **{label: labels.get(f"{LABEL_PREFIX}.{label}", "") for label in RUN_LABELS},
+        "exit_code": int(exit_code.group(1)) if exit_code else None,
+    }
+    # an attached run whose cpac process is gone has nobody to clean it up
+    record["orphaned"] = (
+        record["status"] == "running"
+        and record["detached"] != "true"
+        and record["host"] == socket.gethostname()
+        and record["pid"].isdigit()
+        and not _pid_alive(int(record["pid"]))
+    )
+    return record
+
+
+class DockerSession:
+    """A Docker client connected with a single handshake.
+
+    The daemon's version is fetched once and used both to report the
+    version and to pin the client's API version, which would otherwise be
+    negotiated in a separate round-trip. Image lookups are memoized for
+    the lifetime of the session.
+
+    Parameters
+    ----------
+    version_ttl : int, optional
+        seconds to reuse the daemon version persisted in the cpac cache
+        from an earlier invocation, skipping the handshake entirely;
+        defaults to ``$CPAC_DOCKER_VERSION_TTL`` or 0 (never reuse)
+    """
+
+    def __init__(self, version_ttl: Optional[int] = None) -> None:
+        if version_ttl is None:
+            try:
+                version_ttl = int(os.environ.get("CPAC_DOCKER_VERSION_TTL", 0))
+            except ValueError:
+                version_ttl = 0
+        self._images: Dict[str, Any] = {}
+        daemon = self._load_daemon_version(version_ttl) if version_ttl > 0 else None
+        if daemon is None:
+            daemon = self._handshake()
+            if version_ttl > 0:
+                self._store_daemon_version(daemon)
+        self.version = daemon.get("Version", "unknown")
+        self.client = docker.from_env(version=daemon["ApiVersion"])
+
+    @staticmethod
+    @profiled("Docker handshake")
+    def _handshake() -> dict:
+        """Fetch the daemon's version, failing if the daemon is unreachable."""
+        probe = docker.from_env(version=docker.constants.MINIMUM_DOCKER_API_VERSION)
+        try:
+            daemon = probe.version(api_version=False)
+        except Exception as exception:
+            raise docker.errors.DockerException(
+                f"Could not connect to Docker. Is Docker running? {exception}"
+            ) from exception
+        finally:
+            probe.close()
+        if "ApiVersion" not in daemon:
+            raise docker.errors.DockerException(
+                'Invalid response from Docker daemon: key "ApiVersion" is missing.'
+            )
+        return daemon
+
+    @staticmethod
+    def _daemon_version_path() -> str:
+        host = os.environ.get("DOCKER_HOST", "")
+        return os.path.join(
+            cache.CACHE_DIR,
+            "docker",
+            f"daemon-{sha256(host.encode()).hexdigest()[:16]}.json",
+        )
+
+    def _load_daemon_version(self, ttl: int) -> Optional[dict]:
+        try:
+            with open(self._daemon_version_path(), encoding="utf-8") as cached:
+                daemon = json.load(cached)
+        except (OSError, ValueError):
+            return None
+        if (
+            not isinstance(daemon, dict)
+            or "ApiVersion" not in daemon
+            or time.time() - daemon.get("cached_at", 0) > ttl
+        ):
+            return None
+        return daemon
+
+    def _store_daemon_version(self, daemon: dict) -> None:
+        path = self._daemon_version_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            descriptor, staging = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(descriptor, "w", encoding="utf-8") as staged:
+                json.dump(
+                    {
+                        "Version": daemon.get("Version", "unknown"),
+                        "ApiVersion": daemon["ApiVersion"],
+                        "cached_at": time.time(),
+                    },
+                    staged,
+                )
+            os.replace(staging, path)
+        except OSError:
+            pass
+
+    @profiled()
+    def image(self, name: str):
+        """Return a local image, or None if it has not been pulled.
+
+        Parameters
+        ----------
+        name : str
+            image name and tag
+
+        Returns
+        -------
+        docker.models.images.Image or None
+        """
+        if name not in self._images:
+            try:
+                self._images[name] = self.client.images.get(name)
+            except docker.errors.ImageNotFound:
+                self._images[name] = None
+        return self._images[name]
+
+    def image_digest(self, name: str) -> Optional[str]:
+        """Return a local image's repository digest, if it has one."""
+        image = self.image(name)
+        if image is None:
+            return None
+        digests = image.attrs.get("RepoDigests") or []
+        return digests[0].split("@", 1)[-1] if digests else None
+
+    def forget_image(self, name: str) -> None:
+        """Look an image up again next time, e.g. after pulling it."""
+        self._images.pop(name, None)
 
 
 class Docker(Backend):
+    @profiled()
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.container = None
+        self.helper_ttl = kwargs.get("helper_ttl") or 0
+        self._helper = None
         self.platform = PlatformMeta("Docker", "🐳")
         self._print_loading_with_symbol(self.platform.name)
-        self.client = docker.from_env()
-        self.platform.version = self.client.version().get("Version", "unknown")
-        try:
-            self.client.ping()
-        except (docker.errors.APIError, ConnectionError):  # pragma: no cover
-            raise OSError(
-                f"Could not connect to {self.platform.name}. " "Is Docker running?"
-            )
+        self.session = DockerSession()
+        self.client = self.session.client
+        self.platform.version = self.session.version
 
         image = kwargs["image"] if kwargs.get("image") is not None else "fcpindi/c-pac"
 
@@ -45,36 +293,137 @@ class Docker(Backend):
                             self.docker_kwargs[k] = [self.docker_kwargs[k], v]
                     else:
                         self.docker_kwargs[k] = v
+        limits = self.container_limits(**kwargs)
+        if limits is not None:
+            self._set_limits(limits)
+
+    def _set_limits(self, limits: ContainerLimits) -> None:
+        """Limit containers' memory, CPUs and threads.
+
+        Limits already given with ``--container_option`` are kept.
+        """
+        if limits.memory_mb:
+            self.docker_kwargs.setdefault("mem_limit", f"{limits.memory_mb}m")
+        if limits.cpus:
+            self.docker_kwargs.setdefault("nano_cpus", int(limits.cpus * 1e9))
+        environment = self.docker_kwargs.get("environment") or []
+        if isinstance(environment, dict):
+            environment = [f"{key}={value}" for key, value in environment.items()]
+        elif isinstance(environment, str):
+            environment = [environment]
+        given = {variable.split("=", 1)[0] for variable in environment}
+        environment += [
+            f"{key}={value}"
+            for key, value in limits.environment.items()
+            if key not in given
+        ]
+        if environment:
+            self.docker_kwargs["environment"] = environment
+
+    def pin(self, placement):
+        """Run this backend's containers on a placement's CPUs and NUMA nodes.
 
+        Parameters
+        ----------
+        placement : ~cpac.utils.placement.Placement
+        """
+        self.docker_kwargs["cpuset_cpus"] = placement.cpuset_cpus
+        if placement.cpuset_mems is not None:
+            self.docker_kwargs["cpuset_mems"] = placement.cpuset_mems
+        else:
+            self.docker_kwargs.pop("cpuset_mems", None)
+
+    def _scale_memory_limit(self, factor):
+        """Scale the containers' ``mem_limit``, if one is set."""
+        if self.docker_kwargs.get("mem_limit"):
+            self.docker_kwargs["mem_limit"] = (
+                f"{ceil(memory_mb(self.docker_kwargs['mem_limit']) * factor)}m"
+            )
+
+    @profiled()
     def _collect_config(self, **kwargs):
-        if kwargs.get("command") not in {"pull", "upgrade", None}:
-            if isinstance(self.pipeline_config, str):
-                container_kwargs = {"image": self.image}
-                if os.path.exists(self.pipeline_config):
-                    container_kwargs["volumes"] = {
-                        self.pipeline_config: {
-                            "bind": self.pipeline_config,
-                            "mode": "ro",
-                        }
-                    }
-                try:
-                    container = self.client.containers.create(**container_kwargs)
-                except ImageNotFound:  # pragma: no cover
-                    self.pull(**kwargs)
-                    container = self.client.containers.create(**container_kwargs)
-                stream = container.get_archive(path=self.pipeline_config)[0]
-                self.config = (
-                    b"".join(list(stream))
-                    .split(b"\x000000000")[-1]
-                    .replace(b"\x00", b"")
-                    .decode()
-                )
-                container.remove()
-            else:
-                self.config = self.pipeline_config
+        if kwargs.get("command") not in {*RUN_COMMANDS, "pull", "upgrade", None}:
+            self.config = self.resolve_config(
+                self._read_config_file(self.pipeline_config)
+                if isinstance(self.pipeline_config, str)
+                else self.pipeline_config
+            )
             kwargs = self.collect_config_bindings(self.config, **kwargs)
             self._set_bindings(**kwargs)
 
+    def _dump_image_metadata(self):
+        """Read the C-PAC version and preconfigs without starting a container."""
+        try:
+            container = self.client.containers.create(image=self.image)
+        except docker.errors.DockerException:
+            return None
+        prefix = f"{os.path.basename(PRECONFIG_DIR)}/"
+        try:
+            version = _read_tar(container.get_archive(path=VERSION_PATH)[0])
+            configs = _read_tar(
+                container.get_archive(path=PRECONFIG_DIR)[0],
+                lambda name: name.startswith(prefix)
+                and name.endswith((".yml", ".yaml")),
+            )
+        except docker.errors.DockerException:
+            return None
+        finally:
+            container.remove()
+        return next(iter(version.values()), ""), {
+            name[len(prefix) :]: text for name, text in configs.items()
+        }
+
+    def _image_key(self):
+        try:
+            image = self.session.image(self.image)
+        except docker.errors.DockerException:
+            return None
+        return None if image is None else image.id
+
+    def _read_container_file(self, path):
+        """Return the text of a file in the image without starting a container."""
+        return self._read_container_files([path])[path]
+
+    def _read_container_files(self, paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Return the text of files in the image in a single archive request.
+
+        The archive of the files' deepest common directory is streamed and
+        only the requested members are extracted.
+
+        Parameters
+        ----------
+        paths : iterable of str
+            absolute in-container paths
+
+        Returns
+        -------
+        dict
+            text of each path, or None if it is not a file in the image
+        """
+        paths = list(paths)
+        root = os.path.commonpath(paths)
+        # archive members are named relative to the archived path's parent
+        members = {
+            os.path.normpath(
+                os.path.join(os.path.basename(root), os.path.relpath(path, root))
+            ): path
+            for path in paths
+        }
+        try:
+            container = self.client.containers.create(image=self.image)
+        except ImageNotFound:  # pragma: no cover
+            self.pull()
+            container = self.client.containers.create(image=self.image)
+        try:
+            texts = _read_tar(
+                container.get_archive(path=root)[0], members.__contains__, len(members)
+            )
+        except docker.errors.NotFound:
+            texts = {}
+        finally:
+            container.remove()
+        return {path: texts.get(member) for member, path in members.items()}
+
     def pull(self, **kwargs):
         image, tag = self.image.split(":")
         [
@@ -85,6 +434,7 @@ class Docker(Backend):
             for k in layer
             if k in {"id", "status", "progress"}
         ]
+        self.session.forget_image(self.image)
 
     def _read_crash(self, read_crash_command, **kwargs):
         return self._execute(command=read_crash_command, run_type="exec", **kwargs)
@@ -124,9 +474,7 @@ class Docker(Backend):
 
     def _execute(self, command, run_type="run", **kwargs):
         container_return = None
-        try:
-            self.client.images.get(self.image)
-        except docker.errors.ImageNotFound:  # pragma: no cover
+        if self.session.image(self.image) is None:  # pragma: no cover
             self.pull(**kwargs)
 
         if run_type != "version":
@@ -141,28 +489,57 @@ class Docker(Backend):
         }
 
         if run_type == "run":
-            self.container = self.client.containers.run(
-                **shared_kwargs,
-                command=command,
-                detach=True,
-                stderr=True,
-                stdout=True,
-                remove=True,
-            )
-            self._run = DockerRun(self.container)
+            labels = shared_kwargs.pop("labels", None) or {}
+            if not isinstance(labels, dict):
+                labels = dict(
+                    label.split("=", 1) if "=" in label else (label, "")
+                    for label in ([labels] if isinstance(labels, str) else labels)
+                )
+            shared_kwargs["labels"] = {
+                **self._run_labels(command, **kwargs),
+                **labels,
+            }
+            if kwargs.get("detach"):
+                self.container = self.client.containers.run(
+                    **shared_kwargs, command=command, detach=True
+                )
+                print(
+                    f"Started {self.container.name}. Follow it with "
+                    f"`cpac logs --follow {self.container.name}` or `cpac "
+                    f"attach {self.container.name}`; check on it with "
+                    "`cpac status`."
+                )
+                # leave the container running when cpac exits
+                self.container = None
+                return None
+            # removed after exiting rather than automatically, so the exit
+            # code can still be read
+            with self._host_slot(**kwargs):
+                with span("container create/start"):
+                    self.container = self.client.containers.run(
+                        **shared_kwargs,
+                        command=command,
+                        detach=True,
+                        stderr=True,
+                        stdout=True,
+                    )
+                try:
+                    with self._telemetry(
+                        docker_samples(self.container), command, **kwargs
+                    ):
+                        self._run = DockerRun(
+                            self.container, LogSink.from_options(**kwargs)
+                        )
+                    self.exit_code = self._run.exit_code
+                    self.out_of_memory = (
+                        self._run.oom_killed or self.exit_code == OOM_EXIT_CODE
+                    )
+                finally:
+                    self._remove_container()
         elif run_type == "version":
             return self.get_version()
         elif run_type == "exec":
-            self.container = self.client.containers.create(
-                **shared_kwargs,
-                auto_remove=True,
-                entrypoint="/bin/bash",
-                stdin_open=True,
-            )
-            self.container.start()
-            container_return = self.container.exec_run(
-                cmd=command, stdout=True, stderr=True, stream=True
-            )[1]
+            container_return = self._exec(command, shared_kwargs)
         elif run_type == "enter":
             self.container = self.client.containers.create(
                 **shared_kwargs,
@@ -175,6 +552,254 @@ class Docker(Backend):
             dockerpty.start(self.client.api, self.container.id)
         return container_return
 
+    def _run_labels(self, command, **kwargs):
+        """Return labels that identify a C-PAC run container."""
+        participant = self._participant(command)
+        config = getattr(self, "config", None)
+        values = {
+            "role": "run",
+            "participant": participant,
+            "config_hash": sha256(config.dump().encode()).hexdigest()[:12]
+            if config
+            else "",
+            "output_dir": str(kwargs.get("output_dir") or ""),
+            "detached": "true" if kwargs.get("detach") else "false",
+            "host": socket.gethostname(),
+            "pid": str(os.getpid()),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        return {f"{LABEL_PREFIX}.{label}": value for label, value in values.items()}
+
+    def _list_containers(self, label):
+        """List cpac's containers with a label in a single API call."""
+        return self.client.api.containers(all=True, filters={"label": label})
+
+    def list_runs(self):
+        """Return a record of every C-PAC run container, newest first.
+
+        Returns
+        -------
+        list of dict
+            see :py:func:`run_record`
+        """
+        return [
+            run_record(summary)
+            for summary in self._list_containers(f"{LABEL_PREFIX}.role=run")
+        ]
+
+    def status(self, names=None):
+        """Print a table of C-PAC run containers.
+
+        Parameters
+        ----------
+        names : list of str, optional
+            only show these containers
+        """
+        from tabulate import tabulate
+
+        runs = [run for run in self.list_runs() if not names or run["name"] in names]
+        if not runs:
+            print("No C-PAC run containers.")
+            return
+        print(
+            tabulate(
+                [
+                    [
+                        run["name"],
+                        run["participant"],
+                        "orphaned" if run["orphaned"] else run["status"],
+                        "" if run["exit_code"] is None else run["exit_code"],
+                        run["started"],
+                        run["config_hash"],
+                        run["output_dir"],
+                    ]
+                    for run in runs
+                ],
+                headers=[
+                    "container",
+                    "participant",
+                    "status",
+                    "exit",
+                    "started",
+                    "config",
+                    "output",
+                ],
+            )
+        )
+
+    def logs(self, name, since=None, follow=False):
+        """Print a run container's output.
+
+        Parameters
+        ----------
+        name : str
+            container name or ID
+
+        since : int, optional
+            Unix timestamp to print output from, rather than the beginning
+
+        follow : bool
+            keep printing output until the container exits
+
+        Returns
+        -------
+        int or None
+            the container's exit code if it has exited
+        """
+        container = self.client.containers.get(name)
+        with LogSink() as sink:
+            sink.write_all(
+                container.logs(
+                    stream=True, follow=follow, since=since, stdout=True, stderr=True
+                )
+            )
+        container.reload()
+        if container.status == "exited":
+            exit_code = container.attrs.get("State", {}).get("ExitCode")
+            print(f"{container.name} exited with code {exit_code}.")
+            return exit_code
+        return None
+
+    def attach(self, name):
+        """Follow a run container's new output until it exits.
+
+        Earlier output is not replayed; see :py:meth:`logs`.
+
+        Parameters
+        ----------
+        name : str
+            container name or ID
+
+        Returns
+        -------
+        int or None
+            the container's exit code
+        """
+        return self.logs(name, since=int(time.time()), follow=True)
+
+    def collect_garbage(self, dry_run=False):
+        """Remove exited cpac containers and orphaned runs.
+
+        An orphaned run is an attached run (not ``--detach``) whose cpac
+        process on this host is gone, e.g., after a dropped SSH session.
+
+        Parameters
+        ----------
+        dry_run : bool
+            only print what would be removed
+
+        Returns
+        -------
+        list of str
+            names of the removed containers
+        """
+        removed = []
+        for summary in self._list_containers(f"{LABEL_PREFIX}.role"):
+            record = run_record(summary)
+            if record["status"] in ("exited", "dead"):
+                reason = record["status"]
+            elif record["orphaned"]:
+                reason = "orphaned"
+            else:
+                continue
+            print(
+                f"{'Would remove' if dry_run else 'Removing'} {reason} "
+                f"{record['name']}"
+            )
+            if not dry_run:
+                try:
+                    self.client.api.remove_container(record["id"], force=True)
+                except docker.errors.NotFound:
+                    continue
+            removed.append(record["name"])
+        return removed
+
+    def _exec(self, command, shared_kwargs):
+        """Run a command in the helper container, starting one if needed."""
+        if isinstance(command, str):
+            command = shlex.split(command)
+        command = ["/bin/sh", "-c", 'touch "$0"; exec "$@"', HELPER_STAMP, *command]
+        try:
+            return self._helper_container(shared_kwargs).exec_run(
+                cmd=command, stdout=True, stderr=True, stream=True
+            )[1]
+        except docker.errors.APIError:
+            # the helper went idle and exited between lookup and use
+            self._helper = None
+            return self._helper_container(shared_kwargs, reuse=False).exec_run(
+                cmd=command, stdout=True, stderr=True, stream=True
+            )[1]
+
+    def _helper_container(self, shared_kwargs, reuse=True):
+        """Return a running container for ``exec_run`` calls.
+
+        One helper is started per invocation and stopped on cleanup. With a
+        ``helper_ttl``, the helper is left running until it has been idle
+        that many seconds, and later invocations with the same image,
+        user, bindings and options reuse it.
+
+        Parameters
+        ----------
+        shared_kwargs : dict
+            keyword arguments for ``containers.create``
+
+        reuse : bool
+            look for a running helper from an earlier invocation
+
+        Returns
+        -------
+        docker.models.containers.Container
+        """
+        if self._helper is not None:
+            return self._helper
+        key = sha256(
+            json.dumps(shared_kwargs, sort_keys=True, default=str).encode()
+        ).hexdigest()[:16]
+        labels = {f"{LABEL_PREFIX}.role": "helper", f"{LABEL_PREFIX}.helper": key}
+        if reuse and self.helper_ttl > 0:
+            running = self.client.containers.list(
+                filters={
+                    "label": [f"{label}={value}" for label, value in labels.items()],
+                    "status": "running",
+                }
+            )
+            if running:
+                self._helper = running[0]
+                return self._helper
+        self._helper = self.client.containers.create(
+            **{**shared_kwargs, "labels": labels},
+            auto_remove=True,
+            entrypoint="/bin/sh",
+            command=[
+                "-c",
+                HELPER_SCRIPT,
+                HELPER_STAMP,
+                str(self.helper_ttl if self.helper_ttl > 0 else HELPER_IDLE),
+            ],
+        )
+        self._helper.start()
+        return self._helper
+
+    def _remove_container(self):
+        if self.container is not None:
+            try:
+                self.container.remove(force=True)
+            except docker.errors.DockerException:
+                pass
+
+    def _cleanup(self):
+        super()._cleanup()
+        if getattr(self, "_run", None) is not None and self._run.exit_code is None:
+            # interrupted while running
+            self._remove_container()
+        helper = getattr(self, "_helper", None)
+        if helper is not None and not self.helper_ttl:
+            try:
+                helper.kill()
+            except docker.errors.DockerException:
+                pass
+        self._helper = None
+
     def get_response(self, command, **kwargs):
         """
         Return the response of running a command in the Docker container.
@@ -193,16 +818,86 @@ class Docker(Backend):
         return "".join(full_response)
 
 
+class _ChunkReader(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks: Iterator[bytes] = iter(chunks)
+        self._chunk = memoryview(b"")
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._offset >= len(self._chunk):
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+            self._offset = 0
+        size = min(len(buffer), len(self._chunk) - self._offset)
+        buffer[:size] = self._chunk[self._offset : self._offset + size]
+        self._offset += size
+        return size
+
+
+def _read_tar(
+    stream: Iterable[bytes],
+    wanted: Optional[Callable[[str], bool]] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, str]:
+    """Return the text of files in a streamed tar archive, keyed by member name.
+
+    Parameters
+    ----------
+    stream : iterable of bytes
+        chunks of a tar archive, e.g. from ``Container.get_archive``
+
+    wanted : callable, optional
+        takes a member name and returns whether to extract it; by default,
+        every file is extracted
+
+    limit : int, optional
+        stop reading the archive once this many files are extracted
+
+    Returns
+    -------
+    dict
+    """
+    texts = {}
+    with tarfile.open(fileobj=_ChunkReader(stream), mode="r|") as archive:
+        for member in archive:
+            if member.isfile() and (wanted is None or wanted(member.name)):
+                texts[member.name] = archive.extractfile(member).read().decode()
+                if limit is not None and len(texts) >= limit:
+                    break
+    return texts
+
+
 class DockerRun:
-    def __init__(self, container):
-        # pylint: disable=expression-not-assigned
+    def __init__(self, container, sink=None):
         self.container = container
-        [
-            print(l.decode("utf-8"), end="")
-            for l in self.container.attach(  # noqa E741
-                logs=True, stderr=True, stdout=True, stream=True
+        self.exit_code = None
+        self.oom_killed = False
+        with sink or LogSink() as sink:
+            sink.write_all(
+                self.container.attach(
+                    logs=True,
+                    stderr=True,
+                    stdout=True,
+                    stream=True,
+                    demux=sink.demultiplex,
+                )
             )
-        ]
+        self.exit_code = self.container.wait().get("StatusCode")
+        try:
+            self.container.reload()
+            self.oom_killed = bool(
+                self.container.attrs.get("State", {}).get("OOMKilled")
+            )
+        except docker.errors.DockerException:
+            pass
 
     @property
     def status(self):
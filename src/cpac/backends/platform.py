@@ -2,24 +2,83 @@
 
 import atexit
 from collections import namedtuple
-from contextlib import redirect_stderr
+from contextlib import contextmanager, redirect_stderr
 from io import StringIO
 import os
 import pwd
+from subprocess import CalledProcessError
+import sys
 import tempfile
 import textwrap
-from typing import Union
+from typing import Optional, Union
 from warnings import warn
 
-from docker import errors as docker_errors
-import pandas as pd
-from tabulate import tabulate
 import yaml
 
 from cpac import __version__ as cpac_version
-from cpac.helpers import cpac_read_crash, get_extra_arg_value
+from cpac.helpers import cpac_read_crash, drop_extra_arg, get_extra_arg_value
 from cpac.helpers.cpac_parse_resources import get_or_create_config
 from cpac.utils import LocalsToBind, Volume, Volumes
+from cpac.utils.cache import ImageMetadataCache, VERSION_PATH
+from cpac.utils.configuration import (
+    ContainerLimits,
+    preconfig_path,
+    read_local_config,
+    ResolvedConfig,
+)
+from cpac.utils.metrics import REGISTRY
+from cpac.utils.placement import Placement
+from cpac.utils.profiling import profiled, span
+
+OOM_EXIT_CODE = 137
+"""exit status of a process killed with SIGKILL, as the kernel's OOM killer does"""
+OOM_MEMORY_FACTOR = 1.5
+"""default factor to scale memory by when retrying a run that ran out of it"""
+
+
+def cgroup_oom_kills() -> Optional[int]:
+    """Return how many processes the OOM killer has killed in this cgroup.
+
+    Reads ``oom_kill`` from the cgroup v2 ``memory.events`` of this process's
+    cgroup, which also counts kills in the cgroups of child processes (e.g.,
+    a container that Apptainer/Singularity limits with ``--memory``).
+
+    Returns
+    -------
+    int or None
+        None without cgroup v2 memory accounting
+    """
+    try:
+        with open("/proc/self/cgroup", encoding="utf-8") as cgroup:
+            path = next(
+                line.split(":", 2)[2].strip()
+                for line in cgroup
+                if line.startswith("0::")
+            )
+        with open(
+            f"/sys/fs/cgroup{path.rstrip('/')}/memory.events", encoding="utf-8"
+        ) as events:
+            for line in events:
+                key, _, value = line.partition(" ")
+                if key == "oom_kill":
+                    return int(value)
+    except (OSError, StopIteration, ValueError):
+        pass
+    return None
+
+
+def _sample_to_metrics(participant: str):
+    """Return a function that reports a container's samples as metrics."""
+
+    def report(sample) -> None:
+        REGISTRY.set(
+            "cpac_container_cpu_percent", sample.cpu_percent, participant=participant
+        )
+        REGISTRY.set(
+            "cpac_container_memory_bytes", sample.memory_bytes, participant=participant
+        )
+
+    return report
 
 
 class CpacVersion:
@@ -29,7 +88,12 @@ class CpacVersion:
     def __init__(self, backend):
         self.versions = namedtuple("versions", "cpac CPAC")
         self.versions.cpac = cpac_version
-        self.versions.CPAC = backend.get_response("cat /code/version").rstrip()
+        metadata = backend.image_metadata
+        self.versions.CPAC = (
+            metadata.version
+            if metadata is not None and metadata.version
+            else backend.get_response(f"cat {VERSION_PATH}")
+        ).rstrip()
         self.platform = backend.platform
 
     def __str__(self):
@@ -90,12 +154,7 @@ class Backend:
             else:
                 pipeline_config = get_extra_arg_value(kwargs["extra_args"], "preconfig")
                 if pipeline_config is not None:
-                    self.pipeline_config = "/".join(
-                        [
-                            "/code/CPAC/resources/configs",
-                            f"pipeline_config_{pipeline_config}.yml",
-                        ]
-                    )
+                    self.pipeline_config = preconfig_path(pipeline_config)
         self.volumes = Volume("/etc/passwd", mode="ro")
         tracking_opt_out = "--tracking_opt-out"
         if not (
@@ -118,6 +177,8 @@ class Backend:
         self.container = None
         self.image = None
         self._run = None
+        self.exit_code = None
+        self.out_of_memory = False
         self.uid = 0
         self.username = "root"
         self.working_dir = kwargs.get("working_dir", os.getcwd())
@@ -196,34 +257,11 @@ class Backend:
         """
         self.volumes += self._prep_binding(volume)
 
-    def _collect_config_binding(self, config, config_key):
-        config_binding = _MockBinding()
-        if isinstance(config, str):
-            if os.path.exists(config):
-                self._set_bindings(custom_binding=Volume(config, mode="r"))
-                config = self.clarg(
-                    clcommand='python -c "from CPAC.utils.configuration; '
-                    "import Configuration; "
-                    f'yaml.dump(Configuration({config}).dict())"'
-                )
-            config = yaml.safe_load(config)
-        if config:
-            pipeline_setup = config.get("pipeline_setup", {})
-            minimal = pipeline_setup.get("FROM", False)
-            if isinstance(pipeline_setup, dict):
-                config_binding = Volume(pipeline_setup.get(config_key, {}).get("path"))
-            else:
-                minimal = True
-            if minimal:
-                warn(
-                    "This run is using a minimal pipeline configuration. If "
-                    "this configuration imports a configuration that "
-                    "requires paths to be bound from your real environment "
-                    "to your container, you need to bind those paths "
-                    "manually with the `-B` flag.",
-                    UserWarning,
-                )
-        return config_binding
+    def _collect_config_binding(
+        self, config: ResolvedConfig, config_key: str
+    ) -> Union[Volume, _MockBinding]:
+        path = config.directory_path(config_key)
+        return _MockBinding() if path is None else Volume(path)
 
     def clarg(self, clcommand, flags=None, **kwargs):
         """Run a commandline command.
@@ -240,17 +278,20 @@ class Backend:
 
     def _cleanup(self):
         if hasattr(self, "container") and hasattr(self.container, "stop"):
+            from docker import errors as docker_errors
+
             try:
                 self.container.stop()
             except (docker_errors.APIError, docker_errors.NotFound):
                 pass
 
+    @profiled()
     def collect_config_bindings(self, config, **kwargs):
         """Collect bindings for a given configuration.
 
         Parameters
         ----------
-        config : str or dict
+        config : ResolvedConfig, str, dict or None
             Configuration to collect bindings for.
 
         kwargs : dict
@@ -268,6 +309,17 @@ class Backend:
         """
         kwargs["output_dir"] = kwargs.get("output_dir", os.getcwd())
         kwargs["working_dir"] = self.working_dir
+        if not isinstance(config, ResolvedConfig):
+            config = self.resolve_config(config)
+        if config.minimal:
+            warn(
+                "This run is using a minimal pipeline configuration that "
+                "imports a configuration that could not be read. If that "
+                "configuration requires paths to be bound from your real "
+                "environment to your container, you need to bind those paths "
+                "manually with the `-B` flag.",
+                UserWarning,
+            )
 
         config_bindings = Volumes()
         cwd = os.getcwd()
@@ -298,9 +350,348 @@ class Backend:
             else:
                 path = os.path.join(cwd, c_b[1])
                 config_bindings += Volume(path)
+        observed_usage = config.get(
+            "pipeline_setup", "system_config", "observed_usage", "callback_log"
+        )
+        if isinstance(observed_usage, str) and os.path.isfile(observed_usage):
+            config_bindings += Volume(observed_usage, mode="ro")
         kwargs["config_bindings"] = config_bindings
         return kwargs
 
+    def _read_config_file(self, path: str) -> Optional[str]:
+        """Return the text of a configuration file.
+
+        Reads local files directly and only looks inside the container for
+        paths that do not exist locally.
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        str or None
+        """
+        config_text = read_local_config(path)
+        if config_text is None and self.image_metadata is not None:
+            config_text = self.image_metadata.config(path)
+        if config_text is None:
+            config_text = self._read_container_file(path)
+        return config_text
+
+    def _read_container_file(self, path: str) -> Optional[str]:
+        """Return the text of a file in the container.
+
+        Backends that cannot look inside their image find nothing there.
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        str or None
+        """
+        return None
+
+    def resolve_config(self, config: Optional[Union[str, dict]]) -> ResolvedConfig:
+        """Load a pipeline configuration and its ``FROM:`` ancestors once.
+
+        Parameters
+        ----------
+        config : str, dict or None
+            YAML text or loaded pipeline configuration
+
+        Returns
+        -------
+        ResolvedConfig
+        """
+        return ResolvedConfig(config, fetch=self._read_config_file)
+
+    def container_limits(self, **kwargs) -> Optional[ContainerLimits]:
+        """Return the limits to put on containers with ``--limit_resources``.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Extra arguments from the commandline.
+
+        Returns
+        -------
+        ContainerLimits or None
+            None unless ``--limit_resources`` was given with a pipeline
+            configuration
+        """
+        config = getattr(self, "config", None)
+        if not (kwargs.get("limit_resources") and isinstance(config, ResolvedConfig)):
+            return None
+        # each --parallel_participants container runs a single participant
+        return ContainerLimits.from_config(
+            config, 1 if kwargs.get("parallel_participants") else None
+        )
+
+    @contextmanager
+    def _host_slot(self, **kwargs):
+        """Hold a share of the host while a container runs, with ``--share_host``.
+
+        The share is the memory and CPUs the pipeline configuration allows
+        the container (see :py:meth:`container_limits`); the container waits
+        until other cpac invocations on this host leave that much free.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Extra arguments from the commandline.
+        """
+        slots = None
+        if kwargs.get("share_host"):
+            from cpac.utils.slots import HostSlots
+
+            try:
+                slots = HostSlots()
+            except OSError as os_error:
+                warn(f"Not sharing host resources: {os_error}", UserWarning)
+        if slots is None:
+            yield
+            return
+        config = getattr(self, "config", None)
+        limits = ContainerLimits.from_config(
+            config if isinstance(config, ResolvedConfig) else ResolvedConfig({}),
+            1 if kwargs.get("parallel_participants") else None,
+        )
+        with slots.acquire(
+            limits.memory_gb or 1,
+            limits.cpus or 1,
+            f"{pwd.getpwuid(os.getuid()).pw_name}: {self.image}",
+        ):
+            yield
+
+    @staticmethod
+    def _participant(args: list) -> str:
+        """Return which participant a C-PAC command line runs.
+
+        Parameters
+        ----------
+        args : list
+            C-PAC command line
+
+        Returns
+        -------
+        str
+            the participant label, ``ndx-<index>`` or ``all``
+        """
+        participant = get_extra_arg_value(args, "participant_label")
+        if participant is None:
+            participant = get_extra_arg_value(args, "participant_ndx")
+            participant = f"ndx-{participant}" if participant is not None else "all"
+        return participant
+
+    @staticmethod
+    def _wants_telemetry(**kwargs) -> bool:
+        """Return whether a run's resource use should be sampled."""
+        return bool(kwargs.get("telemetry_interval")) or (
+            kwargs.get("metrics_port") is not None
+        )
+
+    @contextmanager
+    def _telemetry(self, source, args: list, **kwargs):
+        """Report on a running container.
+
+        The container is counted in ``cpac_running_containers`` and its
+        run time in ``cpac_phase_seconds`` (see :py:mod:`cpac.utils.metrics`).
+        With ``--telemetry_interval``, its resource use is sampled to
+        ``telemetry/<participant>.csv`` in the output directory and peaks
+        are printed when it exits. With ``--metrics_port``, its latest
+        sample is reported as metrics.
+
+        Parameters
+        ----------
+        source : callable or iterable
+            see :py:class:`~cpac.utils.telemetry.TelemetryRecorder`
+
+        args : list
+            C-PAC command line
+
+        kwargs : dict
+            Extra arguments from the commandline.
+        """
+        participant = self._participant(args)
+        recorder = None
+        if self._wants_telemetry(**kwargs):
+            from cpac.utils.telemetry import INTERVAL, TelemetryRecorder
+
+            recorder = TelemetryRecorder(
+                source,
+                os.path.join(
+                    kwargs.get("output_dir") or os.getcwd(),
+                    "telemetry",
+                    f"{participant}.csv",
+                )
+                if kwargs.get("telemetry_interval")
+                else None,
+                kwargs.get("telemetry_interval") or INTERVAL,
+                _sample_to_metrics(participant)
+                if kwargs.get("metrics_port") is not None
+                else None,
+            )
+            try:
+                recorder.start()
+            except OSError as os_error:
+                warn(f"Not recording resource telemetry: {os_error}", UserWarning)
+                recorder = None
+        REGISTRY.add("cpac_running_containers", 1)
+        try:
+            with REGISTRY.timed("container"), span("container"):
+                yield
+        finally:
+            REGISTRY.add("cpac_running_containers", -1)
+            if recorder is not None:
+                recorder.stop()
+                if recorder.path is not None:
+                    print(recorder.summary(participant))
+            for metric in ("cpac_container_cpu_percent", "cpac_container_memory_bytes"):
+                REGISTRY.remove(metric, participant=participant)
+
+    def _memory_gb(self, flags: list) -> float:
+        """Return the memory per participant C-PAC is told it has."""
+        for value in (
+            get_extra_arg_value(flags, "mem_gb"),
+            self.config.get(
+                "pipeline_setup", "system_config", "maximum_memory_per_participant"
+            )
+            if isinstance(getattr(self, "config", None), ResolvedConfig)
+            else None,
+        ):
+            try:
+                if value is not None and float(value) > 0:
+                    return float(value)
+            except (TypeError, ValueError):
+                continue
+        return 1.0
+
+    def _scale_memory_limit(self, factor: float) -> None:
+        """Scale the memory limit on this backend's containers, if any.
+
+        Backends that do not limit their containers' memory have nothing to
+        scale; C-PAC's ``--mem_gb`` is scaled by :py:meth:`run_with_retries`.
+        """
+
+    def run_with_retries(
+        self,
+        flags: Optional[list] = None,
+        oom_retries: Optional[int] = 0,
+        oom_memory_factor: Optional[float] = OOM_MEMORY_FACTOR,
+        **kwargs,
+    ):
+        """Run C-PAC, running it again with more memory if it runs out.
+
+        Each retry scales C-PAC's ``--mem_gb`` (starting from the pipeline
+        configuration's ``maximum_memory_per_participant``) and any container
+        memory limit by ``oom_memory_factor``.
+
+        Parameters
+        ----------
+        flags : list, optional
+
+        oom_retries : int, optional
+            most times to run again
+
+        oom_memory_factor : float, optional
+
+        kwargs : dict
+            Extra arguments from the commandline.
+        """
+        flags = list(flags or [])
+        oom_retries = oom_retries or 0
+        oom_memory_factor = oom_memory_factor or OOM_MEMORY_FACTOR
+        memory_gb = self._memory_gb(flags)
+        for attempt in range(oom_retries + 1):
+            self.out_of_memory = False
+            try:
+                result = self.run(flags=flags, **kwargs)
+            except CalledProcessError:
+                if not (self.out_of_memory and attempt < oom_retries):
+                    raise
+            else:
+                if not (self.out_of_memory and attempt < oom_retries):
+                    return result
+            memory_gb = round(memory_gb * oom_memory_factor, 2)
+            print(
+                f"C-PAC ran out of memory (exit code {self.exit_code}); running "
+                f"again with {memory_gb:g} GB (retry {attempt + 1} of "
+                f"{oom_retries})",
+                file=sys.stderr,
+            )
+            self._scale_memory_limit(oom_memory_factor)
+            flags = [*drop_extra_arg(flags, "mem_gb"), "--mem_gb", f"{memory_gb:g}"]
+        return None
+
+    def pin(self, placement: Placement) -> None:
+        """Run this backend's containers on a placement's CPUs.
+
+        Backends that cannot pin their containers run them unpinned.
+
+        Parameters
+        ----------
+        placement : Placement
+        """
+        warn(
+            f"{type(self).__name__} containers cannot be pinned to CPUs "
+            f"{placement.cpuset_cpus}; running unpinned.",
+            UserWarning,
+        )
+
+    def _dump_image_metadata(self) -> Optional[tuple[str, dict[str, str]]]:
+        """Read the C-PAC version and every preconfig from the image at once.
+
+        Implemented in the subclasses.
+
+        Returns
+        -------
+        tuple of (str, dict) or None
+            C-PAC version and pipeline configuration text keyed by path
+            relative to ``/code/CPAC/resources/configs``
+        """
+        return None
+
+    def _image_key(self) -> Optional[str]:
+        """Return a digest identifying this backend's image.
+
+        Implemented in the subclasses.
+
+        Returns
+        -------
+        str or None
+        """
+        return None
+
+    def _load_image_metadata(self) -> Optional[ImageMetadataCache]:
+        key = self._image_key()
+        if key is None:
+            return None
+        metadata = ImageMetadataCache(key)
+        if not metadata.complete:
+            dumped = self._dump_image_metadata()
+            if dumped is None:
+                return None
+            try:
+                metadata.store(*dumped)
+            except OSError as os_error:
+                warn(f"Could not cache image metadata: {os_error}", UserWarning)
+                return None
+        return metadata
+
+    @property
+    def image_metadata(self) -> Optional[ImageMetadataCache]:
+        """Cached version and pipeline configurations of this backend's image.
+
+        The cache is warmed on first use, after which reading the version or
+        a preconfig does not start a container.
+        """
+        if "_image_metadata" not in self.__dict__:
+            self._image_metadata = self._load_image_metadata()
+        return self._image_metadata
+
     def get_response(self, command, **kwargs):
         """
         Return the response of running a command in the container.
@@ -332,15 +723,18 @@ class Backend:
         print(version)
         return version
 
+    @profiled()
     def _load_logging(self):
-        table = pd.DataFrame(
+        table = [
             [
-                (volume.local, volume.bind, volume.mode)
-                for volume in self.bindings.get("volumes", [])
+                "\n".join(textwrap.wrap(cell, 42)) if isinstance(cell, str) else cell
+                for cell in (volume.local, volume.bind, volume.mode)
             ]
-        )
-        if not table.empty:
-            table.columns = ["local", self.platform.name, "mode"]
+            for volume in self.bindings.get("volumes", [])
+        ]
+        if table:
+            from tabulate import tabulate
+
             self._print_loading_with_symbol(
                 " ".join(
                     [
@@ -353,13 +747,8 @@ class Backend:
             print(
                 textwrap.indent(
                     tabulate(
-                        table.applymap(
-                            lambda x: ("\n".join(textwrap.wrap(x, 42)))
-                            if isinstance(x, str)
-                            else x
-                        ),
-                        headers="keys",
-                        showindex=False,
+                        table,
+                        headers=["local", self.platform.name, "mode"],
                     ),
                     "  ",
                 )
@@ -381,6 +770,7 @@ class Backend:
         """Set platform metadata."""
         self._platform = value
 
+    @profiled()
     def _prep_binding(self, volume: Volume, second_try: bool = False) -> Volume:
         """Prepare a volume binding for the container.
 
@@ -432,6 +822,7 @@ class Backend:
         else:
             self.__dict__[name] = value
 
+    @profiled()
     def _set_bindings(self, **kwargs):
         tag = kwargs.get("tag", None)
         tag = tag if isinstance(tag, str) else None
@@ -445,7 +836,11 @@ class Backend:
             and os.path.exists(kwargs["data_config_file"])
         ):
             self._bind_volume(Volume(kwargs["data_config_file"], mode="r"))
-            locals_from_data_config = LocalsToBind()
+            min_fanout = kwargs.get("bind_min_fanout")
+            locals_from_data_config = LocalsToBind(
+                max_depth=kwargs.get("bind_max_depth"),
+                min_fanout=2 if min_fanout is None else min_fanout,
+            )
             locals_from_data_config.from_config_file(kwargs["data_config_file"])
             for local in locals_from_data_config.locals:
                 self._bind_volume(Volume(local, mode="r"))
@@ -1,13 +1,48 @@
 """Backend for Singularity images."""
 
+from contextlib import contextmanager
+from functools import partial, wraps
+import json
+from math import ceil
 import os
+from subprocess import CalledProcessError
+import tempfile
+import threading
 
 from spython.image import Image
 from spython.main import Client
 
-from cpac.backends.platform import Backend, PlatformMeta
+from cpac.backends.platform import (
+    Backend,
+    cgroup_oom_kills,
+    OOM_EXIT_CODE,
+    PlatformMeta,
+)
+from cpac.utils.cache import DUMP_METADATA_SCRIPT, file_key
+from cpac.utils.configuration import ContainerLimits, memory_mb
+from cpac.utils.log_sink import LogSink
+from cpac.utils.profiling import profiled
+from cpac.utils.telemetry import ProcessTreeSampler, read_pid, record_pid
 
 BINDING_MODES = {"ro": "ro", "w": "rw", "rw": "rw"}
+_COMMAND_PREFIX = threading.local()
+"""command (e.g., ``taskset``) that each thread's container runs under"""
+
+
+def _prefixed(init_command):
+    """Wrap spython's ``_init_command`` to run under this thread's prefix."""
+    if getattr(init_command, "prefixed", False):
+        return init_command
+
+    @wraps(init_command)
+    def init_prefixed_command(self, action, flags=None):
+        return [
+            *getattr(_COMMAND_PREFIX, "command", []),
+            *init_command(self, action, flags),
+        ]
+
+    init_prefixed_command.prefixed = True
+    return init_prefixed_command
 
 
 class Singularity(Backend):
@@ -23,36 +58,118 @@ class Singularity(Backend):
         """Set metadata for Apptainer platform."""
         self.platform = PlatformMeta("Singularity", "Ⓢ")
 
+    @profiled()
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.container = None
+        self.command_prefix = []
+        self._pid_file = None
         self._set_platform()
         self._print_loading_with_symbol(self.platform.name)
         container_options = kwargs.get("container_options")
         self.options = container_options if isinstance(container_options, list) else []
         self.pull(**kwargs, force=False)
-        if isinstance(self.pipeline_config, str):
-            self.config = Client.execute(
-                image=self.image,
-                command=f"cat {self.pipeline_config}",
-                return_result=False,
-            )
-        else:
-            self.config = self.pipeline_config
+        self.config = self.resolve_config(
+            self._read_config_file(self.pipeline_config)
+            if isinstance(self.pipeline_config, str)
+            else self.pipeline_config
+        )
         kwargs = self.collect_config_bindings(self.config, **kwargs)
-        del self.config
         self._set_bindings(**kwargs)
+        limits = self.container_limits(**kwargs)
+        if limits is not None:
+            self._set_limits(limits)
 
-    def _bindings_as_option(self):
-        self.options += [
-            "-B",
-            ",".join(
-                [
-                    ":".join([binding.local, binding.bind, str(binding.mode)])
-                    for binding in self.volumes
-                ]
-            ),
+    def _set_limits(self, limits: ContainerLimits) -> None:
+        """Limit containers' memory, CPUs and threads.
+
+        Limits already given with ``--container_option`` are kept.
+        """
+        if limits.cpus and "--cpus" not in self.options:
+            self.options += ["--cpus", str(limits.cpus)]
+        if limits.memory_mb and "--memory" not in self.options:
+            self.options += ["--memory", f"{limits.memory_mb}M"]
+        if limits.environment:
+            self.options += [
+                "--env",
+                ",".join(f"{key}={value}" for key, value in limits.environment.items()),
+            ]
+
+    def pin(self, placement):
+        """Run this backend's containers on a placement's CPUs.
+
+        The container runs under ``numactl`` (which also binds memory to the
+        placement's NUMA nodes) or, without ``numactl``, ``taskset``.
+
+        Parameters
+        ----------
+        placement : ~cpac.utils.placement.Placement
+        """
+        self.command_prefix = placement.command_prefix()
+
+    @contextmanager
+    def _prefixed_commands(self):
+        """Run Singularity commands from this thread under ``command_prefix``."""
+        client_class = type(Client)
+        # Apptainer swaps in its own ``_init_command``, so wrap whichever is set
+        client_class._init_command = _prefixed(client_class._init_command)
+        _COMMAND_PREFIX.command = [
+            *(record_pid(self._pid_file) if self._pid_file else []),
+            *self.command_prefix,
         ]
+        try:
+            yield
+        finally:
+            _COMMAND_PREFIX.command = []
+
+    def _dump_image_metadata(self):
+        """Read the C-PAC version and preconfigs in a single container."""
+        try:
+            metadata = json.loads(
+                self._execute_for_text(["python", "-c", DUMP_METADATA_SCRIPT]) or ""
+            )
+        except ValueError:
+            return None
+        return metadata["version"], metadata["configs"]
+
+    def _execute_for_text(self, command):
+        """Return the output of a command in the image, or None on failure."""
+        output = Client.execute(image=self.image, command=command, return_result=False)
+        if isinstance(output, dict):
+            return None
+        if isinstance(output, list):
+            return "".join(output)
+        return output
+
+    def _image_key(self):
+        image = str(self.image) if self.image is not None else None
+        if image is None or not os.path.isfile(image):
+            return None
+        return file_key(image)
+
+    def _read_container_file(self, path):
+        """Return the text of a file in the image."""
+        return self._execute_for_text(["cat", path])
+
+    def _scale_memory_limit(self, factor):
+        """Scale the containers' ``--memory``, if one is set."""
+        if "--memory" in self.options:
+            index = self.options.index("--memory") + 1
+            self.options[index] = f"{ceil(memory_mb(self.options[index]) * factor)}M"
+
+    def _bindings_as_option(self):
+        bindings = ",".join(
+            [
+                ":".join([binding.local, binding.bind, str(binding.mode)])
+                for binding in self.volumes
+            ]
+        )
+        # replace the bindings from an earlier run of this backend
+        for index in range(len(self.options) - 1, 0, -1):
+            if self.options[index - 1 : index + 1] == ["-B", bindings]:
+                del self.options[index - 1 : index + 1]
+                break
+        self.options += ["-B", bindings]
 
     def _bindings_from_option(self):
         enter_options = {}
@@ -126,14 +243,15 @@ class Singularity(Backend):
     def _try_to_stream(self, args, stream_command="run", silent=False, **kwargs):
         self._bindings_as_option()
         if stream_command == "run":
-            self.container = Client.run(
-                self.image,
-                args=args,
-                options=self.options,
-                stream=not silent,
-                return_result=True,
-                **kwargs,
-            )
+            with self._prefixed_commands():
+                self.container = Client.run(
+                    self.image,
+                    args=args,
+                    options=self.options,
+                    stream=not silent,
+                    return_result=True,
+                    **kwargs,
+                )
         else:
             enter_options = self._bindings_from_option()
             if stream_command == "execute":
@@ -172,19 +290,45 @@ class Singularity(Backend):
 
     def run(self, flags=None, run_type="run", **kwargs):
         """Run a Singularity container."""
-        # pylint: disable=expression-not-assigned
         if flags is None:
             flags = []
         self._load_logging()
         if run_type == "run":
-            [
-                print(o, end="")
-                for o in self._try_to_stream(
-                    args=" ".join(
-                        self.drop_missing_positional_arguments(kwargs, flags)
-                    ).strip(" ")
-                )
-            ]
+            oom_kills = cgroup_oom_kills()
+            with self._host_slot(**kwargs):
+                args = self.drop_missing_positional_arguments(kwargs, flags)
+                if self._wants_telemetry(**kwargs):
+                    # parallel participants' containers share this parent and
+                    # Apptainer renames its processes, so sample the process
+                    # tree of the PID this run's command records
+                    descriptor, self._pid_file = tempfile.mkstemp(
+                        prefix="cpac-", suffix=".pid"
+                    )
+                    os.close(descriptor)
+                try:
+                    with self._telemetry(
+                        ProcessTreeSampler(
+                            partial(read_pid, self._pid_file)
+                            if self._pid_file
+                            else None
+                        ),
+                        args,
+                        **kwargs,
+                    ), LogSink.from_options(**kwargs) as sink:
+                        sink.write_all(
+                            self._try_to_stream(args=" ".join(args).strip(" "))
+                        )
+                except CalledProcessError as process_error:
+                    self.exit_code = process_error.returncode
+                    self.out_of_memory = self.exit_code == OOM_EXIT_CODE or (
+                        oom_kills is not None and (cgroup_oom_kills() or 0) > oom_kills
+                    )
+                    raise
+                finally:
+                    if self._pid_file:
+                        os.unlink(self._pid_file)
+                        self._pid_file = None
+                self.exit_code = 0
         elif run_type == "version":
             return self.get_version()
         else:
@@ -206,20 +350,19 @@ class Singularity(Backend):
 
         kwargs: dict
         """
-        # pylint: disable=expression-not-assigned
         if flags is None:
             flags = []
         self._load_logging()
-        [
-            print(o, end="")
-            for o in self._try_to_stream(
-                args=" ".join(
-                    [
-                        kwargs.get("bids_dir", "bids_dir"),
-                        kwargs.get("output_dir", "output_dir"),
-                        f"cli -- {clcommand}",
-                        *flags,
-                    ]
-                ).strip(" ")
+        with LogSink.from_options(**kwargs) as sink:
+            sink.write_all(
+                self._try_to_stream(
+                    args=" ".join(
+                        [
+                            kwargs.get("bids_dir", "bids_dir"),
+                            kwargs.get("output_dir", "output_dir"),
+                            f"cli -- {clcommand}",
+                            *flags,
+                        ]
+                    ).strip(" ")
+                )
             )
-        ]
@@ -2,17 +2,42 @@
 from itertools import chain
 import re
 
-TODOs = {
-    "persisting_containers": "Some Docker containers unexpectedly "
-    "persist after cpac finishes. To clear "
-    "them, run\n    "
-    r"1. `docker ps` to list the containers"
-    "\n  For each C-PAC conatainer that "
-    "persists, run\n    "
-    r"2. `docker attach <container_name>`"
-    "\n    "
-    r"3. `exit`"
-}
+TODOs: dict = {}
+
+
+def drop_extra_arg(extra_args, argument):
+    """Remove a passed-through argument and its value.
+
+    Parameters
+    ----------
+    extra_args : list
+
+    argument : str
+
+    Returns
+    -------
+    list
+
+    Examples
+    --------
+    >>> drop_extra_arg([
+    ...     '--preconfig', 'fmriprep-options', '--participant_ndx', '3',
+    ...     '--save_working_dir'], 'participant_ndx')
+    ['--preconfig', 'fmriprep-options', '--save_working_dir']
+    >>> drop_extra_arg(['--participant_ndx=3', '--n_cpus', '2'], 'participant_ndx')
+    ['--n_cpus', '2']
+    """
+    kept = []
+    skip_value = False
+    for item in extra_args:
+        name = re.split(r"[=\s]", item, maxsplit=1)[0]
+        if skip_value:
+            skip_value = False
+        elif name.startswith("-") and name.lstrip("-") == argument:
+            skip_value = name == item
+        else:
+            kept.append(item)
+    return kept
 
 
 def get_extra_arg_value(extra_args, argument):
@@ -51,4 +76,4 @@ def get_extra_arg_value(extra_args, argument):
     return None
 
 
-__all__ = ["get_extra_arg_value", "TODOs"]
+__all__ = ["drop_extra_arg", "get_extra_arg_value", "TODOs"]
@@ -5,45 +5,102 @@ When provided with a `callback.log` file, this utility can sort through
 the memory `runtime` usage, `estimate`, and associated `efficiency`, to
 identify the `n` tasks with the `highest` or `lowest` of each of these
 categories.
+When provided with an output directory or a glob, this utility instead
+summarizes every `callback.log` found, reporting the count, mean, median,
+95th percentile and maximum of each category per node type.
+With `--recalibrate`, it writes a pipeline configuration overlay that
+replaces memory estimates with a high quantile of observed memory usage.
 `cpac_parse_resources` is intended to be run outside a C-PAC container.
 """
+
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 import configparser
+from functools import partial
+import glob
+from hashlib import sha256
 import json
+import math
 import os
+import re
+import tempfile
+from typing import Iterable, Iterator, Optional
 import uuid
 
-import pandas as pd
-from rich.console import Console
-from rich.table import Table
-
 runti = "runtime_memory_gb"
 estim = "estimated_memory_gb"
 
 field = {"runtime": runti, "estimate": estim, "efficiency": "efficiency"}
 
+CHUNK_SIZE = 65536
+"""number of nodes parsed into each chunk of columns"""
+TIME_COLUMNS = ("start", "finish")
+"""callback.log timestamps to keep"""
+FLOAT_COLUMNS = (runti, estim, "num_threads", "runtime_threads")
+"""callback.log numeric fields to keep"""
+COLUMNS = ("id", "name", *TIME_COLUMNS, *FLOAT_COLUMNS, "efficiency")
+"""columns of parsed resource usage"""
+CALLBACK_LOG = "callback.log"
+"""filename of the logs to summarize when given a directory or glob"""
+AGGREGATE_COLUMNS = (runti, estim, "efficiency")
+"""columns summarized per node type"""
+AGGREGATE_STATS = ("mean", "p50", "p95", "max")
+"""statistics reported for each of :py:data:`AGGREGATE_COLUMNS`"""
+CACHE_SUFFIX = ".columns.npz"
+"""suffix of the sidecar cache of a ``callback.log``'s parsed columns"""
+CACHE_FORMAT = 2
+"""version of the sidecar cache layout; bump when :py:data:`COLUMNS` change"""
+PARTICIPANT_PREFIX = re.compile(r"^cpac_[^.]+\.")
+"""participant workflow prefix of callback.log node IDs"""
+
 
 def display(df):
-    console = Console()
+    """Display resource usage in a table.
 
-    table = Table(show_header=True, header_style="bold magenta")
+    Parameters
+    ----------
+    df : pandas.DataFrame or dict
+        resource usage columns, e.g. from :py:meth:`TopK.result`
+    """
+    from rich.console import Console
+
+    Console().print(usage_table(df))
+
+
+def usage_table(df, caption: Optional[str] = None):
+    """Build a table of resource usage.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame or dict
+        resource usage columns, e.g. from :py:meth:`TopK.result`
+
+    caption : str, optional
+
+    Returns
+    -------
+    rich.table.Table
+    """
+    import numpy as np
+    from rich.table import Table
+
+    table = Table(show_header=True, header_style="bold magenta", caption=caption)
     table.add_column("Task ID", style="dim", width=40)
     table.add_column("Memory Used")
     table.add_column("Memory Estimated")
     table.add_column("Memory Efficiency")
 
-    for _, d in df.iterrows():
-        tmp = []
-        tmp += [d["id"]]
-        tmp += [d[runti]]
-        tmp += [d[estim]]
-        tmp += ["{0:.2f} %".format(100 * d[runti] * 1.0 / d[estim])]
-
-        tmp = ["{0:.4f}".format(t) if isinstance(t, float) else str(t) for t in tmp]
-        table.add_row(*tmp)
-        del tmp
-
-    console.print(table)
+    columns = [
+        np.asarray(df["id"]).astype(str),
+        np.char.mod("%.4f", np.asarray(df[runti], dtype=np.float64)),
+        np.char.mod("%.4f", np.asarray(df[estim], dtype=np.float64)),
+        np.char.add(
+            np.char.mod("%.2f", np.asarray(df["efficiency"], dtype=np.float64)), " %"
+        ),
+    ]
+    for row in zip(*columns):
+        table.add_row(*row)
+    return table
 
 
 def get_or_create_config(udir):
@@ -62,24 +119,905 @@ def get_or_create_config(udir):
     return tracking_path
 
 
-def load_runtime_stats(callback):
-    with open(callback) as fhandle:
-        logs = [json.loads(log) for log in fhandle.readlines()]
+def _columns_from_records(records: dict) -> dict:
+    """Convert lists of parsed values into typed NumPy columns."""
+    import numpy as np
+
+    columns = {
+        "id": np.array(records["id"], dtype=object),
+        "name": np.array(records["name"], dtype=object),
+        **{key: _to_datetime64(records[key]) for key in TIME_COLUMNS},
+        **{key: np.array(records[key], dtype=np.float64) for key in FLOAT_COLUMNS},
+    }
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns["efficiency"] = columns[runti] / columns[estim] * 100
+    return columns
+
+
+def _to_datetime64(values: list):
+    """Convert ISO 8601 timestamps, replacing unparseable ones with ``NaT``."""
+    import numpy as np
+
+    try:
+        return np.array(values, dtype="datetime64[us]")
+    except ValueError:
+        converted = np.full(len(values), "NaT", dtype="datetime64[us]")
+        for index, value in enumerate(values):
+            try:
+                converted[index] = np.datetime64(value, "us")
+            except ValueError:
+                pass
+        return converted
+
+
+def _empty_records() -> dict:
+    return {key: [] for key in ("id", "name", *TIME_COLUMNS, *FLOAT_COLUMNS)}
+
+
+def iter_runtime_stats(
+    lines: Iterable[str], chunk_size: int = CHUNK_SIZE
+) -> Iterator[dict]:
+    """Parse completed nodes from ``callback.log`` lines in fixed-size chunks.
+
+    Only lines that report a runtime are decoded, and only the columns in
+    :py:data:`TIME_COLUMNS` and :py:data:`FLOAT_COLUMNS` (plus ``id`` and
+    ``efficiency``) are kept, so memory use is bounded by ``chunk_size``
+    rather than by the size of the log.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        e.g., an open ``callback.log``
+
+    chunk_size : int
+        maximum number of nodes per chunk
+
+    Yields
+    ------
+    dict
+        NumPy arrays keyed by column name
+    """
+    records = _empty_records()
+    count = 0
+    for line in lines:
+        if runti not in line:
+            # start stamps and other messages don't report usage
+            continue
+        try:
+            log = json.loads(line)
+        except ValueError:
+            # e.g., a line still being written
+            continue
+        if not isinstance(log, dict) or runti not in log:
+            continue
+        records["id"].append(log.get("id"))
+        records["name"].append(log.get("name") or str(log.get("id")).rsplit(".", 1)[-1])
+        for key in TIME_COLUMNS:
+            records[key].append(log.get(key) or "NaT")
+        for key in FLOAT_COLUMNS:
+            value = log.get(key)
+            records[key].append(float("nan") if value is None else value)
+        count += 1
+        if count == chunk_size:
+            yield _columns_from_records(records)
+            records = _empty_records()
+            count = 0
+    if count:
+        yield _columns_from_records(records)
+
+
+def _concatenate_columns(chunks: list, columns: Iterable[str] = COLUMNS) -> dict:
+    """Concatenate chunks of columns from :py:func:`iter_runtime_stats`."""
+    import numpy as np
+
+    chunks = chunks or [_columns_from_records(_empty_records())]
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in columns}
+
+
+def _cache_paths(callback: str) -> Iterator[str]:
+    """Yield where a ``callback.log``'s columns may be cached, in priority order.
+
+    The cache sits next to the log, or in the user's cache directory if the
+    log's directory is not writable.
+    """
+    yield f"{callback}{CACHE_SUFFIX}"
+    from cpac.utils.cache import CACHE_DIR
+
+    yield os.path.join(
+        CACHE_DIR,
+        "callback_logs",
+        f"{sha256(os.path.realpath(callback).encode()).hexdigest()}.npz",
+    )
+
+
+def _open_cached_columns(callback: str, stat: os.stat_result):
+    """Open a ``callback.log``'s cached columns if its size and mtime match.
+
+    Returns
+    -------
+    numpy.lib.npyio.NpzFile or None
+        arrays are only read from the file when indexed
+    """
+    from zipfile import BadZipFile
+
+    import numpy as np
 
-    pruned_logs = []
-    for log in logs:
-        if runti not in log.keys():
+    for path in _cache_paths(callback):
+        try:
+            cached = np.load(path)
+        except (BadZipFile, EOFError, OSError, ValueError):
             continue
+        try:
+            if (
+                int(cached["_format"]),
+                int(cached["_size"]),
+                int(cached["_mtime_ns"]),
+            ) == (CACHE_FORMAT, stat.st_size, stat.st_mtime_ns) and all(
+                f"{key}_{index}.npy" in cached.zip.namelist()
+                for index in range(int(cached["_chunks"]))
+                for key in COLUMNS
+            ):
+                return cached
+        except (BadZipFile, EOFError, KeyError, OSError, ValueError):
+            pass
+        cached.close()
+    return None
+
+
+def _iter_cached_columns(cached) -> Iterator[dict]:
+    """Yield the chunks of columns in an opened cache one at a time."""
+    with cached:
+        for index in range(int(cached["_chunks"])):
+            yield {
+                key: (
+                    cached[f"{key}_{index}"].astype(object)
+                    if key in ("id", "name")
+                    else cached[f"{key}_{index}"]
+                )
+                for key in COLUMNS
+            }
+
+
+class _ColumnCacheWriter:
+    """Write a ``callback.log``'s columns to its cache one chunk at a time.
+
+    Chunks are appended to a staged ``.npz`` as they are parsed, and the
+    staged file replaces the cache only once the whole log has been read.
+    If no cache location is writable, chunks are dropped.
+
+    Parameters
+    ----------
+    callback : str
+        path to ``callback.log``
+
+    stat : os.stat_result
+        of ``callback`` before parsing
+    """
+
+    def __init__(self, callback: str, stat: os.stat_result) -> None:
+        from zipfile import ZIP_STORED, ZipFile
+
+        self.stat = stat
+        self.chunks = 0
+        self.path: Optional[str] = None
+        self._staging: Optional[str] = None
+        self._archive: Optional[ZipFile] = None
+        for path in _cache_paths(callback):
+            directory = os.path.dirname(path) or "."
+            try:
+                os.makedirs(directory, exist_ok=True)
+                descriptor, staging = tempfile.mkstemp(
+                    prefix=".", suffix=".npz", dir=directory
+                )
+            except OSError:
+                continue
+            os.close(descriptor)
+            try:
+                self._archive = ZipFile(staging, "w", ZIP_STORED, allowZip64=True)
+            except OSError:
+                os.unlink(staging)
+                continue
+            self.path, self._staging = path, staging
+            return
+
+    def _write_array(self, name: str, array) -> None:
+        import numpy as np
+
+        with self._archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+            np.lib.format.write_array(member, np.asanyarray(array), allow_pickle=False)
+
+    def append(self, chunk: dict) -> None:
+        """Stage a chunk of columns from :py:func:`iter_runtime_stats`."""
+        if self._archive is None:
+            return
+        try:
+            for key in COLUMNS:
+                values = chunk[key]
+                self._write_array(
+                    f"{key}_{self.chunks}",
+                    values.astype(str) if values.dtype == object else values,
+                )
+        except OSError:
+            self.discard()
+            return
+        self.chunks += 1
+
+    def commit(self) -> None:
+        """Replace the cache with the staged chunks."""
+        if self._archive is None:
+            return
+        try:
+            for name, value in (
+                ("_format", CACHE_FORMAT),
+                ("_size", self.stat.st_size),
+                ("_mtime_ns", self.stat.st_mtime_ns),
+                ("_chunks", self.chunks),
+            ):
+                self._write_array(name, value)
+            self._archive.close()
+            self._archive = None
+            os.replace(self._staging, self.path)
+        except OSError:
+            self.discard()
+
+    def discard(self) -> None:
+        """Delete the staged chunks, if any."""
+        if self._archive is not None:
+            try:
+                self._archive.close()
+            except OSError:
+                pass
+            self._archive = None
+        if self._staging is not None and os.path.exists(self._staging):
+            os.unlink(self._staging)
+
+
+def iter_cached_runtime_stats(
+    callback: str, chunk_size: int = CHUNK_SIZE, cache: bool = True
+) -> Iterator[dict]:
+    """Yield a ``callback.log``'s columns, parsing the log at most once.
+
+    Parsed columns are cached in a ``.npz`` sidecar (see
+    :py:data:`CACHE_SUFFIX`) keyed by the log's size and modification time,
+    so later queries of an unchanged log skip the JSON parsing. The cache
+    holds one set of arrays per chunk and is written and read a chunk at a
+    time, so only one chunk is in memory either way. A cache hit yields the
+    chunks as they were parsed, whatever ``chunk_size`` is.
+
+    Parameters
+    ----------
+    callback : str
+        path to ``callback.log``
+
+    chunk_size : int
+        number of nodes to parse at a time on a cache miss
+
+    cache : bool
+        read and write the sidecar cache
+
+    Yields
+    ------
+    dict
+        NumPy arrays keyed by column name
+    """
+    stat = os.stat(callback)
+    if not cache:
+        with open(callback, encoding="utf-8") as fhandle:
+            yield from iter_runtime_stats(fhandle, chunk_size)
+        return
+    cached = _open_cached_columns(callback, stat)
+    if cached is not None:
+        yield from _iter_cached_columns(cached)
+        return
+    writer = _ColumnCacheWriter(callback, stat)
+    try:
+        with open(callback, encoding="utf-8") as fhandle:
+            for chunk in iter_runtime_stats(fhandle, chunk_size):
+                writer.append(chunk)
+                yield chunk
+        writer.commit()
+    finally:
+        # a no-op once committed
+        writer.discard()
+
+
+def load_runtime_stats(callback: str, chunk_size: int = CHUNK_SIZE, cache: bool = True):
+    """Load the resource usage of every completed node in a ``callback.log``.
+
+    Parameters
+    ----------
+    callback : str
+        path to ``callback.log``
+
+    chunk_size : int
+        number of nodes to parse at a time
+
+    cache : bool
+        use the sidecar cache from :py:func:`iter_cached_runtime_stats`
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    import pandas as pd
+
+    return pd.DataFrame(
+        _concatenate_columns(
+            list(iter_cached_runtime_stats(callback, chunk_size, cache))
+        )
+    )
+
+
+class LogFollower:
+    """Read the lines appended to a growing file since the last read.
+
+    Only complete lines are returned; a trailing partial line is held until
+    its newline is written. If the file shrinks (e.g., it was replaced),
+    reading starts over from the beginning.
+
+    Parameters
+    ----------
+    path : str
+
+    offset : int
+        byte offset to start reading from
+    """
+
+    def __init__(self, path: str, offset: int = 0) -> None:
+        self.path = path
+        self.offset = offset
+        self._partial = b""
+
+    def lines(self, block_size: int = 1 << 20) -> Iterator[str]:
+        """Yield the complete lines appended since the last call.
+
+        Parameters
+        ----------
+        block_size : int
+            number of bytes to read at a time
+
+        Yields
+        ------
+        str
+        """
+        try:
+            fhandle = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with fhandle:
+            if os.fstat(fhandle.fileno()).st_size < self.offset:
+                self.offset = 0
+                self._partial = b""
+            fhandle.seek(self.offset)
+            while block := fhandle.read(block_size):
+                self.offset += len(block)
+                complete, newline, self._partial = (self._partial + block).rpartition(
+                    b"\n"
+                )
+                if newline:
+                    yield from complete.decode("utf-8", errors="replace").splitlines()
+
+
+def follow(args) -> None:
+    """Follow a growing ``callback.log``, refreshing a top-k table in place.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+
+    Returns
+    -------
+    None
+    """
+    import time
+
+    from rich.live import Live
+
+    top = TopK(
+        field[args.filter_field],
+        args.filter_count,
+        highest=args.filter_group == "highest",
+    )
+    follower = LogFollower(args.callback)
+    caption = f"following {args.callback} (Ctrl+C to stop)"
+    with Live(usage_table(top.result(), caption), auto_refresh=False) as live:
+        try:
+            while True:
+                offset = follower.offset
+                for chunk in iter_runtime_stats(follower.lines()):
+                    top.update(chunk)
+                if follower.offset != offset:
+                    live.update(usage_table(top.result(), caption), refresh=True)
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def find_callback_logs(path: str) -> Iterator[str]:
+    """Find ``callback.log`` files in a directory tree or matching a glob.
+
+    Parameters
+    ----------
+    path : str
+        directory to search recursively, or a glob whose matching files are
+        used as-is and whose matching directories are searched recursively
+
+    Yields
+    ------
+    str
+        path to a ``callback.log``
+    """
+    seen = set()
+    stack = []
+    if os.path.isdir(path):
+        stack.append(path)
+    else:
+        for match in sorted(glob.iglob(path, recursive=True), reverse=True):
+            if os.path.isdir(match):
+                stack.append(match)
+            elif not match.endswith(CACHE_SUFFIX) and match not in seen:
+                seen.add(match)
+                yield match
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif (
+                    entry.name == CALLBACK_LOG
+                    and entry.path not in seen
+                    and entry.is_file()
+                ):
+                    seen.add(entry.path)
+                    yield entry.path
+
+
+def _node_usage(callback: str, cache: bool = True) -> dict:
+    """Return the node IDs, names and summarized columns of one ``callback.log``."""
+    try:
+        chunks = list(iter_cached_runtime_stats(callback, cache=cache))
+    except (OSError, UnicodeDecodeError):
+        chunks = []
+    columns = _concatenate_columns(chunks)
+    return {key: columns[key] for key in ("id", "name", *AGGREGATE_COLUMNS)}
+
+
+def _collect_node_usage(
+    callbacks: Iterable[str], jobs: Optional[int] = None, cache: bool = True
+) -> dict:
+    """Parse many ``callback.log`` files in parallel and concatenate their usage."""
+    usages = []
+    node_usage = partial(_node_usage, cache=cache)
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        usages.extend(map(node_usage, callbacks))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            usages.extend(pool.map(node_usage, callbacks, chunksize=4))
+    return _concatenate_columns(usages, ("id", "name", *AGGREGATE_COLUMNS))
+
+
+def _group_by(keys) -> tuple:
+    """Return unique ``keys``, their counts and an iterator of grouped indices."""
+    import numpy as np
+
+    groups, inverse, counts = np.unique(
+        keys.astype(str), return_inverse=True, return_counts=True
+    )
+    indices = np.split(np.argsort(inverse, kind="stable"), np.cumsum(counts)[:-1])
+    return groups, counts, indices if groups.size else []
+
+
+def _describe(values) -> tuple:
+    """Return :py:data:`AGGREGATE_STATS` of the finite ``values``."""
+    import numpy as np
+
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return (np.nan,) * len(AGGREGATE_STATS)
+    p50, p95 = np.percentile(values, [50, 95])
+    return values.mean(), p50, p95, values.max()
+
+
+def aggregate_runtime_stats(
+    callbacks: Iterable[str], jobs: Optional[int] = None, cache: bool = True
+) -> dict:
+    """Summarize resource usage per node type across many ``callback.log`` files.
+
+    Parameters
+    ----------
+    callbacks : iterable of str
+        paths to ``callback.log`` files, e.g. from :py:func:`find_callback_logs`
+
+    jobs : int, optional
+        number of processes parsing logs in parallel; defaults to the
+        number of CPUs
 
-        tmp = {}
-        for k in ["id", runti, estim]:
-            tmp[k] = log[k]
-        tmp["efficiency"] = tmp[runti] / tmp[estim] * 100
+    cache : bool
+        use the sidecar caches from :py:func:`iter_cached_runtime_stats`
 
-        pruned_logs += [tmp]
-        del tmp
+    Returns
+    -------
+    dict
+        NumPy arrays of ``name``, ``count`` and, for each of
+        :py:data:`AGGREGATE_COLUMNS`, ``<column>_<stat>`` for each of
+        :py:data:`AGGREGATE_STATS`, with one element per node type
+    """
+    import numpy as np
+
+    usage = _collect_node_usage(callbacks, jobs, cache)
+    node_types, counts, groups = _group_by(usage["name"])
+    summary = {"name": node_types, "count": counts}
+    for key in AGGREGATE_COLUMNS:
+        stats = np.array([_describe(usage[key][group]) for group in groups]).reshape(
+            -1, len(AGGREGATE_STATS)
+        )
+        for index, stat in enumerate(AGGREGATE_STATS):
+            summary[f"{key}_{stat}"] = stats[:, index]
+    return summary
+
+
+def node_key(node_id: str) -> str:
+    """Return a node ID without its participant workflow prefix.
+
+    Parameters
+    ----------
+    node_id : str
+        ``id`` from a ``callback.log``
+
+    Returns
+    -------
+    str
+
+    Examples
+    --------
+    >>> node_key("cpac_sub-01_ses-1.anat_preproc_0.n4")
+    'anat_preproc_0.n4'
+    >>> node_key("anat_preproc_0.n4")
+    'anat_preproc_0.n4'
+    """
+    return PARTICIPANT_PREFIX.sub("", node_id, count=1)
+
+
+def observed_memory(
+    callbacks: Iterable[str],
+    quantile: float = 0.95,
+    jobs: Optional[int] = None,
+    cache: bool = True,
+) -> dict:
+    """Return a high quantile of observed memory per node across many runs.
+
+    Parameters
+    ----------
+    callbacks : iterable of str
+        paths to ``callback.log`` files
+
+    quantile : float
+        quantile of each node's observed ``runtime_memory_gb``, in (0, 1]
+
+    jobs : int, optional
+        number of processes parsing logs in parallel
+
+    cache : bool
+        use the sidecar caches from :py:func:`iter_cached_runtime_stats`
+
+    Returns
+    -------
+    dict
+        NumPy arrays ``id`` (without the participant prefix; see
+        :py:func:`node_key`), ``ids`` (each node's participant-specific IDs),
+        ``name``, ``count``, ``runtime_memory_gb`` (the quantile) and
+        ``estimated_memory_gb`` (the highest estimate seen), with one
+        element per node that reported memory usage in any run
+    """
+    import numpy as np
+
+    usage = _collect_node_usage(callbacks, jobs, cache)
+    observed = ~np.isnan(usage[runti])
+    usage = {key: values[observed] for key, values in usage.items()}
+    full_ids = usage["id"].astype(str)
+    # pool every participant's runs of the same node
+    keys, counts, groups = _group_by(
+        np.array([node_key(node_id) for node_id in full_ids], dtype=object)
+    )
+    ids = np.empty(len(groups), dtype=object)
+    ids[:] = [sorted(set(full_ids[group])) for group in groups]
+    return {
+        "id": keys,
+        "ids": ids,
+        "name": np.array([usage["name"][group[0]] for group in groups], dtype=object),
+        "count": counts,
+        runti: np.array(
+            [np.quantile(usage[runti][group], quantile) for group in groups],
+            dtype=np.float64,
+        ),
+        estim: np.array(
+            [np.nanmax(usage[estim][group], initial=np.nan) for group in groups],
+            dtype=np.float64,
+        ),
+    }
+
+
+def write_memory_overlay(
+    observed: dict, overlay: str, buffer: float = 10, base: Optional[str] = None
+) -> str:
+    """Write a pipeline configuration overlay that applies observed memory.
+
+    C-PAC replaces a node's memory estimate with the usage recorded for that
+    node in ``pipeline_setup.system_config.observed_usage.callback_log``,
+    padded by ``buffer`` percent, so the overlay points there at a log of
+    the recalibrated values written next to it. Each node is written under
+    every participant-specific ID it was observed with, so reruns of those
+    participants match, and under its participant-independent ID.
+
+    Parameters
+    ----------
+    observed : dict
+        from :py:func:`observed_memory`
+
+    overlay : str
+        path to write the YAML overlay to
+
+    buffer : float
+        percentage C-PAC adds to each observed value
+
+    base : str, optional
+        preconfig or pipeline configuration for the overlay to import
+        with ``FROM:``
+
+    Returns
+    -------
+    str
+        path to the written log of recalibrated memory
+    """
+    import yaml
+
+    overlay = os.path.abspath(overlay)
+    observed_log = f"{os.path.splitext(overlay)[0]}_observed_usage.log"
+    with open(observed_log, "w", encoding="utf-8") as fhandle:
+        for key, seen, name, memory, estimate in zip(
+            observed["id"],
+            observed.get("ids", observed["id"]),
+            observed["name"],
+            observed[runti],
+            observed[estim],
+        ):
+            node_ids = [seen] if isinstance(seen, str) else list(seen)
+            for node_id in [*node_ids, *([key] if key not in node_ids else [])]:
+                fhandle.write(
+                    json.dumps(
+                        {
+                            "id": node_id,
+                            "name": name,
+                            runti: round(float(memory), 4),
+                            estim: None if math.isnan(estimate) else float(estimate),
+                        }
+                    )
+                    + "\n"
+                )
+    config = {} if base is None else {"FROM": base}
+    config["pipeline_setup"] = {
+        "system_config": {
+            "observed_usage": {"callback_log": observed_log, "buffer": buffer}
+        }
+    }
+    with open(overlay, "w", encoding="utf-8") as fhandle:
+        yaml.safe_dump(config, fhandle, sort_keys=False)
+    return observed_log
+
+
+def display_aggregate(summary: dict) -> None:
+    """Display per-node-type resource usage, one table per summarized column.
+
+    Parameters
+    ----------
+    summary : dict
+        from :py:func:`aggregate_runtime_stats`
+    """
+    import numpy as np
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console()
+    titles = {
+        runti: "Memory Used (GB)",
+        estim: "Memory Estimated (GB)",
+        "efficiency": "Memory Efficiency (%)",
+    }
+    for key in AGGREGATE_COLUMNS:
+        table = Table(title=titles[key], show_header=True, header_style="bold magenta")
+        table.add_column("Node", style="dim", width=40)
+        table.add_column("Count")
+        columns = [
+            np.asarray(summary["name"]).astype(str),
+            np.asarray(summary["count"]).astype(str),
+        ]
+        for stat in AGGREGATE_STATS:
+            table.add_column(stat)
+            columns.append(np.char.mod("%.2f", summary[f"{key}_{stat}"]))
+        for row in zip(*columns):
+            table.add_row(*row)
+        console.print(table)
+
+
+def timeline(columns: dict) -> dict:
+    """Sweep over node start and finish stamps to build a resource timeline.
+
+    Each node is assumed to hold its requested threads, used threads and
+    peak memory for its whole run, so memory is an upper bound. When one
+    node finishes as another starts, the two are not counted as concurrent.
+
+    Parameters
+    ----------
+    columns : dict
+        resource usage columns, e.g. from :py:func:`iter_runtime_stats`
+
+    Returns
+    -------
+    dict
+        NumPy arrays ``time`` (sorted, unique) and, holding from each time
+        until the next, ``concurrency``, ``requested_threads``,
+        ``used_threads`` and ``memory_gb``
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> stamps = np.array(["2024-01-01T00:00:00", "2024-01-01T00:00:10",
+    ...                    "2024-01-01T00:00:20"], dtype="datetime64[us]")
+    >>> steps = timeline({"start": stamps[[0, 1]], "finish": stamps[[2, 1]],
+    ...                   "num_threads": np.array([2.0, 1.0]),
+    ...                   "runtime_threads": np.array([1.5, 1.0]),
+    ...                   "runtime_memory_gb": np.array([1.0, np.nan])})
+    >>> steps["concurrency"].tolist()
+    [1, 1, 0]
+    >>> steps["requested_threads"].tolist()
+    [2.0, 2.0, 0.0]
+    """
+    import numpy as np
+
+    valid = ~(np.isnat(columns["start"]) | np.isnat(columns["finish"]))
+    valid &= columns["finish"] >= columns["start"]
+    starts = columns["start"][valid]
+    times = np.concatenate([starts, columns["finish"][valid]])
+    # finishes sort before starts at the same time
+    is_start = np.repeat([1, 0], len(starts))
+    order = np.lexsort((is_start, times))
+    sign = np.where(is_start[order], 1, -1)
+    steps = {"time": times[order]}
+    for key, column in (
+        ("concurrency", None),
+        ("requested_threads", "num_threads"),
+        ("used_threads", "runtime_threads"),
+        ("memory_gb", runti),
+    ):
+        if column is None:
+            deltas = sign
+        else:
+            values = np.nan_to_num(columns[column][valid].astype(np.float64))
+            deltas = sign * np.concatenate([values, values])[order]
+        steps[key] = np.cumsum(deltas)
+    # keep the state after the last event at each time
+    last = np.append(steps["time"][1:] != steps["time"][:-1], True)
+    return {key: values[last] for key, values in steps.items()}
+
+
+def _runs(mask, times) -> tuple:
+    """Return the start times and durations of runs of ``True`` intervals."""
+    import numpy as np
+
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask, [0]]).astype(np.int8)))
+    begins, ends = edges[::2], edges[1::2]
+    return times[begins], times[ends] - times[begins]
+
+
+def summarize_timeline(steps: dict) -> dict:
+    """Summarize a timeline from :py:func:`timeline`.
+
+    Parameters
+    ----------
+    steps : dict
+
+    Returns
+    -------
+    dict
+        durations as :py:class:`numpy.timedelta64`, other values as floats;
+        ``longest_serial`` is the longest stretch with exactly one node
+        running, where more cores per participant would not help
+    """
+    import numpy as np
 
-    return pd.DataFrame.from_dict(pruned_logs)
+    times = steps["time"]
+    zero = np.timedelta64(0, "us")
+    if len(times) < 2:  # noqa: PLR2004
+        return {"wall_time": zero}
+    summary = {}
+    durations = np.diff(times)
+    wall_time = times[-1] - times[0]
+    weights = durations / wall_time
+    summary["wall_time"] = wall_time
+    for key in ("concurrency", "requested_threads", "used_threads", "memory_gb"):
+        summary[f"peak_{key}"] = float(steps[key].max())
+        summary[f"mean_{key}"] = float((steps[key][:-1] * weights).sum())
+    idle_starts, idle = _runs(steps["concurrency"][:-1] == 0, times)
+    summary["idle_gaps"] = float(len(idle))
+    summary["idle_time"] = idle.sum() if len(idle) else zero
+    summary["longest_idle_gap"] = idle.max() if len(idle) else zero
+    serial_starts, serial = _runs(steps["concurrency"][:-1] == 1, times)
+    summary["longest_serial"] = serial.max() if len(serial) else zero
+    if len(serial):
+        summary["longest_serial_start"] = serial_starts[serial.argmax()]
+    return summary
+
+
+def summarize_run(callback: str, cache: bool = True) -> dict:
+    """Summarize the timeline of the run that wrote a ``callback.log``.
+
+    Parameters
+    ----------
+    callback : str
+        path to ``callback.log``
+
+    cache : bool
+        use the sidecar cache from :py:func:`iter_cached_runtime_stats`
+
+    Returns
+    -------
+    dict
+        see :py:func:`summarize_timeline`
+    """
+    return summarize_timeline(
+        timeline(
+            _concatenate_columns(list(iter_cached_runtime_stats(callback, cache=cache)))
+        )
+    )
+
+
+def display_timeline(summary: dict) -> None:
+    """Display a summary from :py:func:`summarize_timeline`.
+
+    Parameters
+    ----------
+    summary : dict
+    """
+    from datetime import timedelta
+
+    import numpy as np
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Metric", style="dim")
+    table.add_column("Value")
+    for key, value in summary.items():
+        if isinstance(value, np.timedelta64):
+            text = str(timedelta(microseconds=int(value / np.timedelta64(1, "us"))))
+        elif isinstance(value, np.datetime64):
+            text = str(value)
+        else:
+            text = f"{value:g}" if float(value).is_integer() else f"{value:.2f}"
+        table.add_row(key.replace("_", " "), text)
+    Console().print(table)
+
+
+def _callback_logs(path: str) -> list:
+    """Return ``path`` if it is a file, or the ``callback.log`` files it finds.
+
+    Raises
+    ------
+    FileNotFoundError
+        if ``path`` finds no files
+    """
+    if os.path.isfile(path):
+        return [path]
+    callbacks = list(find_callback_logs(path))
+    if not callbacks:
+        msg = f"No callback.log files found at {path}"
+        raise FileNotFoundError(msg)
+    return callbacks
 
 
 def main(args):
@@ -93,18 +1031,141 @@ def main(args):
     -------
     None
     """
-    usage = load_runtime_stats(args.callback)
-    filtered_usage = query(
-        usage, args.filter_field, args.filter_group, args.filter_count
-    )
-    display(filtered_usage)
+    if args.follow:
+        follow(args)
+        return
+    if args.recalibrate:
+        observed = observed_memory(
+            _callback_logs(args.callback),
+            args.quantile,
+            args.jobs,
+            args.cache,
+        )
+        observed_log = write_memory_overlay(
+            observed, args.recalibrate, args.buffer, args.base
+        )
+        print(
+            f"Wrote recalibrated memory for {len(observed['id'])} nodes to "
+            f"{observed_log} and a pipeline configuration overlay using it to "
+            f"{args.recalibrate}"
+        )
+        return
+    if args.timeline:
+        display_timeline(summarize_run(args.callback, args.cache))
+        return
+    highest = args.filter_group == "highest"
+    if not os.path.isfile(args.callback):
+        import numpy as np
+
+        summary = aggregate_runtime_stats(
+            _callback_logs(args.callback), args.jobs, args.cache
+        )
+        ranked = summary[f"{field[args.filter_field]}_mean"]
+        order = np.argsort(-ranked if highest else ranked, kind="stable")
+        display_aggregate(
+            {key: values[order[: args.filter_count]] for key, values in summary.items()}
+        )
+        return
+    top = TopK(field[args.filter_field], args.filter_count, highest=highest)
+    for chunk in iter_cached_runtime_stats(args.callback, cache=args.cache):
+        top.update(chunk)
+    display(top.result())
 
 
 def query(usage, f, g, c):
-    order = g == "lowest"
-    usage.sort_values(by=field[f], ascending=order, inplace=True)
-    usage.reset_index(inplace=True, drop=True)
-    return usage[0:c]
+    """Return the ``c`` nodes with the ``g`` (highest or lowest) ``f`` values.
+
+    Parameters
+    ----------
+    usage : pandas.DataFrame
+        resource usage from :py:func:`load_runtime_stats`
+
+    f : str
+        key of :py:data:`field` to sort by
+
+    g : str
+        "highest" or "lowest"
+
+    c : int
+        number of nodes to return
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    selected = (usage.nlargest if g == "highest" else usage.nsmallest)(c, field[f])
+    return selected.reset_index(drop=True)
+
+
+class TopK:
+    """Bounded selection of the nodes with the highest or lowest values.
+
+    Chunks from :py:func:`iter_runtime_stats` are merged into the current
+    selection with a partial sort, so memory and time per chunk depend only
+    on the chunk size and ``k``.
+
+    Parameters
+    ----------
+    column : str
+        column to rank nodes by
+
+    k : int
+        number of nodes to keep
+
+    highest : bool
+        keep the highest values if True, otherwise the lowest
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> top = TopK("efficiency", 2, highest=True)
+    >>> top.update({"id": np.array(["a", "b", "c"], dtype=object),
+    ...             "efficiency": np.array([10.0, np.nan, 30.0])})
+    >>> top.update({"id": np.array(["d"], dtype=object),
+    ...             "efficiency": np.array([20.0])})
+    >>> list(top.result()["id"])
+    ['c', 'd']
+    """
+
+    def __init__(self, column: str, k: int, highest: bool = False) -> None:
+        self.column = column
+        self.k = max(k, 0)
+        self.highest = highest
+        self.columns: Optional[dict] = None
+
+    def _order(self, values):
+        return -values if self.highest else values
+
+    def update(self, chunk: dict) -> None:
+        """Merge a chunk of columns into the selection."""
+        import numpy as np
+
+        ranked = ~np.isnan(chunk[self.column])
+        merged = {
+            key: (
+                np.concatenate([self.columns[key], values[ranked]])
+                if self.columns is not None
+                else values[ranked]
+            )
+            for key, values in chunk.items()
+        }
+        if len(merged[self.column]) > self.k:
+            selected = (
+                np.argpartition(self._order(merged[self.column]), self.k - 1)[: self.k]
+                if self.k
+                else np.array([], dtype=np.intp)
+            )
+            merged = {key: values[selected] for key, values in merged.items()}
+        self.columns = merged
+
+    def result(self) -> dict:
+        """Return the selected nodes' columns, best first."""
+        import numpy as np
+
+        if self.columns is None:
+            return {key: np.array([]) for key in COLUMNS}
+        order = np.argsort(self._order(self.columns[self.column]), kind="stable")
+        return {key: values[order] for key, values in self.columns.items()}
 
 
 def set_args(parser):
@@ -121,7 +1182,9 @@ def set_args(parser):
     parser.add_argument(
         "callback",
         help="callback.log file found in the 'log' "
-        "directory of the specified derivatives path",
+        "directory of the specified derivatives path, or an output "
+        "directory or glob in which to summarize every callback.log "
+        "per node type",
     )
     parser.add_argument(
         "--filter_field",
@@ -137,7 +1200,74 @@ def set_args(parser):
         choices=["lowest", "highest"],
         default="lowest",
     )
-    parser.add_argument("--filter_count", "-n", action="store", type=int, default=10)
+    parser.add_argument(
+        "--filter_count",
+        "-n",
+        action="store",
+        type=int,
+        default=10,
+        help="number of tasks (or, when summarizing, node types) to show",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help="number of processes parsing logs in parallel when summarizing "
+        "(default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--timeline",
+        action="store_true",
+        help="summarize concurrency, requested vs. used threads, memory over "
+        "time, idle gaps and the longest serial stretch of a callback.log",
+    )
+    parser.add_argument(
+        "--recalibrate",
+        metavar="OVERLAY",
+        help="write a pipeline configuration overlay to OVERLAY that replaces "
+        "memory estimates with observed memory usage",
+    )
+    parser.add_argument(
+        "--quantile",
+        type=float,
+        default=0.95,
+        help="quantile of each node's observed memory to use with "
+        "--recalibrate (default: 0.95)",
+    )
+    parser.add_argument(
+        "--buffer",
+        type=float,
+        default=10,
+        metavar="PERCENT",
+        help="percentage C-PAC adds to recalibrated memory (default: 10)",
+    )
+    parser.add_argument(
+        "--from",
+        dest="base",
+        metavar="PIPELINE",
+        help="preconfig or pipeline configuration for the --recalibrate "
+        "overlay to import",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="keep reading a growing callback.log, like 'tail -f', and refresh "
+        "the table as nodes finish",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+        help="how often to check for new lines with --follow (default: 2)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help=f"neither read nor write the parsed-column cache ('{CACHE_SUFFIX}' "
+        "next to each callback.log)",
+    )
     return parser
 
 
@@ -1,8 +1,10 @@
 from .checks import check_version_at_least
+from .configuration import ResolvedConfig
 from .utils import (
     INTERVAL_CHECKS,
     LocalsToBind,
     PermissionMode,
+    reduce_bind_roots,
     version_tuple,
     Volume,
     Volumes,
@@ -13,6 +15,8 @@ __all__ = [
     "INTERVAL_CHECKS",
     "LocalsToBind",
     "PermissionMode",
+    "reduce_bind_roots",
+    "ResolvedConfig",
     "version_tuple",
     "Volume",
     "Volumes",
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 """Wrap another Python package without any modifications."""
 
+from __future__ import annotations
+
 from argparse import _SubParsersAction, ArgumentParser, HelpFormatter, REMAINDER
 from dataclasses import dataclass
 from importlib.metadata import requires
@@ -9,21 +11,24 @@ from logging import ERROR, log
 from shutil import which
 from subprocess import call as sub_call, CalledProcessError
 from sys import exit as sys_exit, version_info
-from typing import cast, ClassVar, Optional, TypedDict
-
-from packaging.requirements import Requirement
+from typing import Callable, ClassVar, Optional, TYPE_CHECKING, TypedDict
 
-try:
-    from tsconcat.utils import build_bidsapp_group_parser
-except (ImportError, ModuleNotFoundError):
-    tsconcat_parser = build_bidsapp_group_parser = None
+if TYPE_CHECKING:
+    from packaging.requirements import Requirement
 
 from cpac.utils import INTERVAL_CHECKS, version_tuple
 
-if build_bidsapp_group_parser is not None:
+
+def _tsconcat_parser() -> Optional[ArgumentParser]:
+    """Build the ``ba-tsconcat`` parser to generate the usage string for the wrapper.
+
+    This parser is built in the main function of the wrapped package https://github.com/cmi-dair/tsconcat/blob/a7e31880431621fe47f48664df4736eb7a455859/src/tsconcat/cli.py#L78C14-L104 , so we recreate it here to generate the usage string for the wrapper.
     """
-    This parser is built in the main function of the wrapped package https://github.com/cmi-dair/tsconcat/blob/a7e31880431621fe47f48664df4736eb7a455859/src/tsconcat/cli.py#L78C14-L104 , so we recreate it here to generate the usage string for the wrapper."""
-    from tsconcat.cli import REDUCE_COLUMNS_ALIAS
+    try:
+        from tsconcat.cli import REDUCE_COLUMNS_ALIAS
+        from tsconcat.utils import build_bidsapp_group_parser
+    except (ImportError, ModuleNotFoundError):
+        return None
 
     tsconcat_parser = build_bidsapp_group_parser(
         prog="ba-tsconcat", description="Concatenate MRI timeseries."
@@ -59,11 +64,13 @@ if build_bidsapp_group_parser is not None:
         help="Number of workers for bids2table. Default is 1.",
         default=1,
     )
+    return tsconcat_parser
+
 
-_PARSERS = {
-    "tsconcat": tsconcat_parser,
+_PARSERS: dict[str, Callable[[], Optional[ArgumentParser]]] = {
+    "tsconcat": _tsconcat_parser,
 }
-"""CLI parsers for wrapped packages"""
+"""Functions that build CLI parsers for wrapped packages, only called when needed"""
 WRAPPED = {}
 """memoization of wrapped packages"""
 
@@ -122,6 +129,8 @@ class WrappedBare:
     @property
     def helpstring(self):
         """Get the helpstring."""
+        if self._helpstring is None:
+            self._helpstring = _collect_usage_string(self.name)
         if self._helpstring is None:
             if not self.supported_python:
                 self._helpstring = f"Extra command '{self.name}' not supported on Python {f'{version_info.major}.{version_info.minor}.{ version_info.micro}'}; supported Python versions range is {self.supported_python_range}.\n\nSee {self.url} for more information and system requirements."
@@ -140,6 +149,8 @@ class WrappedBare:
         _reqs: Optional[dict[str, Requirement]] = getattr(cls, "_requirements", None)
         if _reqs is not None:
             return _reqs
+        from packaging.requirements import Requirement
+
         cpac_requires = requires("cpac") or []
         _requirements: list[Requirement] = [Requirement(req) for req in cpac_requires]
         requirements: dict[str, Requirement] = {req.name: req for req in _requirements}
@@ -203,7 +214,7 @@ def add_bare_wrapper(parser: _SubParsersAction, command: str) -> None:
         command,
         formatter_class=WrappedHelpFormatter,
         help=f"Run {wrapped.command} ({wrapped.version})",
-        usage=wrapped.helpstring,
+        usage=_LazyUsage(wrapped),  # type: ignore[arg-type]
     )
     bare_parser.add_argument("args", nargs=REMAINDER)
     bare_parser.register("action", "extend", ExtendAction)
@@ -246,14 +257,27 @@ def check_for_package(package_name: str) -> bool:
     return which(package_name) is not None
 
 
-def _collect_usage_string(name: str) -> None:
+def _collect_usage_string(name: str) -> Optional[str]:
     """Collect a usage string from a wrapped package to use in the helpstring."""
-    if isinstance(_PARSERS[name], ArgumentParser):
-        _parser = cast(ArgumentParser, _PARSERS[name])
-        try:
-            _SCRIPTS[name]["helpstring"] = _parser.format_help()
-        except AttributeError:
-            print(name)
+    if _SCRIPTS[name]["helpstring"] is None and name in _PARSERS:
+        _parser = _PARSERS[name]()
+        if isinstance(_parser, ArgumentParser):
+            try:
+                _SCRIPTS[name]["helpstring"] = _parser.format_help()
+            except AttributeError:
+                print(name)
+    return _SCRIPTS[name]["helpstring"]
+
+
+class _LazyUsage:
+    """Usage string that is only generated when argparse formats it."""
+
+    def __init__(self, wrapped: WrappedBare) -> None:
+        self.wrapped = wrapped
+
+    def __mod__(self, other: dict) -> str:
+        """Format the usage string like argparse formats a ``str`` usage."""
+        return self.wrapped.helpstring % other
 
 
 def get_wrapped(name: str) -> WrappedBare:
@@ -270,7 +294,6 @@ def get_wrapped(name: str) -> WrappedBare:
         The name of the script to run
     """
     if name not in WRAPPED:
-        _collect_usage_string(name)
         if name in _SCRIPTS:
             WRAPPED[name] = WrappedBare(
                 name,
@@ -0,0 +1,185 @@
+"""On-disk cache of metadata read from C-PAC images."""
+
+from __future__ import annotations
+
+from hashlib import sha256
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+
+from cpac.utils.configuration import PRECONFIG_DIR
+
+CACHE_DIR = os.environ.get(
+    "CPAC_CACHE_DIR",
+    os.path.join(
+        os.environ.get(
+            "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+        ),
+        "cpac",
+    ),
+)
+"""root of the cpac cache; set ``CPAC_CACHE_DIR`` to override"""
+VERSION_PATH = "/code/version"
+"""in-container path of the C-PAC version file"""
+
+
+def file_key(path: str) -> str:
+    """Return a cache key for a local image file.
+
+    Hashing a multi-gigabyte image on every invocation would cost more than
+    the container start we are trying to avoid, so the key is a digest of
+    the file's real path, size and modification time.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    str
+    """
+    stat = os.stat(path)
+    return sha256(
+        f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()
+
+
+class ImageMetadataCache:
+    """Content-addressed cache of one image's version and pipeline configs.
+
+    Parameters
+    ----------
+    key : str
+        digest identifying the image, e.g. a Docker image ID or
+        :py:func:`file_key` of an image file
+
+    root : str, optional
+        cache root directory
+    """
+
+    def __init__(self, key: str, root: Optional[str] = None) -> None:
+        self.key = key.split(":", 1)[-1]
+        self.path = os.path.join(root or CACHE_DIR, "images", self.key)
+        self._version: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"ImageMetadataCache({self.key!r})"
+
+    @property
+    def complete(self) -> bool:
+        """Whether this image's metadata has been cached."""
+        return os.path.exists(os.path.join(self.path, "metadata.json"))
+
+    def config(self, path: str) -> Optional[str]:
+        """Return the cached text of an in-container pipeline configuration.
+
+        Parameters
+        ----------
+        path : str
+            in-container path under ``/code/CPAC/resources/configs``
+
+        Returns
+        -------
+        str or None
+        """
+        if not path.startswith(f"{PRECONFIG_DIR}/"):
+            return None
+        relative = os.path.normpath(path[len(PRECONFIG_DIR) + 1 :])
+        if relative.startswith(".."):
+            return None
+        try:
+            with open(
+                os.path.join(self.path, "configs", relative), encoding="utf-8"
+            ) as config_file:
+                return config_file.read()
+        except OSError:
+            return None
+
+    @property
+    def default_config(self) -> Optional[str]:
+        """The cached default pipeline configuration."""
+        for name in ("pipeline_config_default.yml", "default_pipeline.yml"):
+            config = self.config(f"{PRECONFIG_DIR}/{name}")
+            if config is not None:
+                return config
+        return None
+
+    @property
+    def version(self) -> Optional[str]:
+        """The cached C-PAC version."""
+        if self._version is None:
+            try:
+                with open(
+                    os.path.join(self.path, "metadata.json"), encoding="utf-8"
+                ) as metadata:
+                    self._version = json.load(metadata).get("version")
+            except (OSError, ValueError):
+                return None
+        return self._version
+
+    def store(self, version: str, configs: Dict[str, str]) -> None:
+        """Write an image's metadata to the cache.
+
+        The entry is written to a temporary directory and moved into place
+        so concurrent invocations never see a partial entry.
+
+        Parameters
+        ----------
+        version : str
+            C-PAC version
+
+        configs : dict
+            pipeline configuration text keyed by path relative to
+            ``/code/CPAC/resources/configs``
+        """
+        parent = os.path.dirname(self.path)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{self.key}.", dir=parent)
+        try:
+            for name, text in configs.items():
+                relative = os.path.normpath(name)
+                if relative.startswith(".."):
+                    continue
+                config_path = os.path.join(staging, "configs", relative)
+                os.makedirs(os.path.dirname(config_path), exist_ok=True)
+                with open(config_path, "w", encoding="utf-8") as config_file:
+                    config_file.write(text)
+            with open(
+                os.path.join(staging, "metadata.json"), "w", encoding="utf-8"
+            ) as metadata:
+                json.dump({"version": version.strip()}, metadata)
+            try:
+                os.replace(staging, self.path)
+            except OSError:
+                # another invocation finished warming this image first
+                if not self.complete:
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self._version = version.strip()
+
+
+DUMP_METADATA_SCRIPT = (
+    "import json, os\n"
+    f"root = {PRECONFIG_DIR!r}\n"
+    "configs = {}\n"
+    "for d, _, files in os.walk(root):\n"
+    "    for f in files:\n"
+    "        if f.endswith(('.yml', '.yaml')):\n"
+    "            p = os.path.join(d, f)\n"
+    "            configs[os.path.relpath(p, root)] = open(p).read()\n"
+    f"print(json.dumps({{'version': open({VERSION_PATH!r}).read(), "
+    "'configs': configs}))\n"
+)
+"""Python run inside an image to dump its metadata as one JSON document"""
+
+
+__all__ = [
+    "CACHE_DIR",
+    "DUMP_METADATA_SCRIPT",
+    "file_key",
+    "ImageMetadataCache",
+    "VERSION_PATH",
+]
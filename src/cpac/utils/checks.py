@@ -1,8 +1,4 @@
 """Functions to check things like the in-container C-PAC version."""
-from packaging.version import Version
-from semver import VersionInfo
-
-from cpac.backends import Backends
 
 
 def check_version_at_least(min_version, platform, image=None, tag=None):
@@ -24,6 +20,11 @@ def check_version_at_least(min_version, platform, image=None, tag=None):
     bool
         Is the version at least the minimum version?
     """
+    from packaging.version import Version
+    from semver import VersionInfo
+
+    from cpac.backends import Backends
+
     if platform is None:
         platform = "docker"
     arg_vars = {"platform": platform, "image": image, "tag": tag, "command": "version"}
@@ -0,0 +1,332 @@
+"""Pipeline configurations resolved once per invocation."""
+
+from __future__ import annotations
+
+from copy import deepcopy
+from dataclasses import dataclass
+from math import ceil
+import os
+from typing import Any, Callable, Optional, Union
+
+PRECONFIG_DIR = "/code/CPAC/resources/configs"
+"""in-container directory of preconfigured pipelines"""
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS",
+    "MKL_NUM_THREADS",
+)
+"""environment variables that cap the threads of C-PAC's numerical libraries"""
+
+
+def preconfig_path(name: str) -> str:
+    """Return the in-container path of a preconfigured pipeline.
+
+    Parameters
+    ----------
+    name : str
+        name of the preconfig, or a path to a pipeline configuration
+
+    Returns
+    -------
+    str
+
+    Examples
+    --------
+    >>> preconfig_path("fmriprep-options")
+    '/code/CPAC/resources/configs/pipeline_config_fmriprep-options.yml'
+    >>> preconfig_path("/configs/pipeline.yml")
+    '/configs/pipeline.yml'
+    """
+    if "/" in name or name.endswith((".yml", ".yaml")):
+        return name
+    return f"{PRECONFIG_DIR}/pipeline_config_{name}.yml"
+
+
+def update_nested_dict(base: dict, new: dict) -> dict:
+    """Recursively update ``base`` with the values in ``new``.
+
+    Parameters
+    ----------
+    base : dict
+
+    new : dict
+
+    Returns
+    -------
+    dict
+        a copy of ``base`` updated with ``new``
+
+    Examples
+    --------
+    >>> update_nested_dict({"a": {"b": 1, "c": 2}, "d": 3}, {"a": {"c": 4}})
+    {'a': {'b': 1, 'c': 4}, 'd': 3}
+    """
+    updated = deepcopy(base)
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(updated.get(key), dict):
+            updated[key] = update_nested_dict(updated[key], value)
+        else:
+            updated[key] = deepcopy(value)
+    return updated
+
+
+class ResolvedConfig:
+    r"""A pipeline configuration loaded, merged and dumped at most once.
+
+    Parameters
+    ----------
+    config : str, dict or None
+        YAML text or already-loaded pipeline configuration
+
+    fetch : callable, optional
+        function that takes a path (local or in-container) and returns
+        the YAML text at that path, used to resolve ``FROM:`` inheritance
+
+    Examples
+    --------
+    >>> parents = {
+    ...     "/code/CPAC/resources/configs/pipeline_config_default.yml":
+    ...         "pipeline_setup:\n  log_directory:\n    path: /logs\n"
+    ...         "  output_directory:\n    path: /outputs\n",
+    ... }
+    >>> config = ResolvedConfig(
+    ...     "FROM: default\npipeline_setup:\n  output_directory:\n"
+    ...     "    path: /my/outputs\n", fetch=parents.get)
+    >>> config.directory_path("output_directory")
+    '/my/outputs'
+    >>> config.directory_path("log_directory")
+    '/logs'
+    >>> config.directory_path("working_directory") is None
+    True
+    >>> config.minimal
+    False
+    """
+
+    def __init__(
+        self,
+        config: Optional[Union[str, dict]],
+        fetch: Optional[Callable[[str], Optional[str]]] = None,
+    ) -> None:
+        self._raw = config
+        self._fetch = fetch
+        self._dict: Optional[dict] = None
+        self._dump: Optional[str] = None
+        self._minimal = False
+
+    def __bool__(self) -> bool:
+        return bool(self.dict)
+
+    def __repr__(self) -> str:
+        return f"ResolvedConfig({self._raw!r})"
+
+    @property
+    def dict(self) -> dict:
+        """The fully merged configuration."""
+        if self._dict is None:
+            self._dict = self._resolve(self._raw, set())
+        return self._dict
+
+    @property
+    def minimal(self) -> bool:
+        """Whether any ``FROM:`` ancestor could not be resolved."""
+        if self._dict is None:
+            self._dict = self._resolve(self._raw, set())
+        return self._minimal
+
+    def _load(self, config: Optional[Union[str, dict]]) -> dict:
+        if isinstance(config, str):
+            import yaml
+
+            config = yaml.safe_load(config)
+        return config if isinstance(config, dict) else {}
+
+    def _resolve(self, config: Optional[Union[str, dict]], seen: set) -> dict:
+        """Load a configuration and merge it onto its ``FROM:`` ancestors."""
+        config = self._load(config)
+        parent = config.get("FROM")
+        if not parent:
+            return config
+        config = {key: value for key, value in config.items() if key != "FROM"}
+        path = preconfig_path(str(parent))
+        parent_text = None
+        if path not in seen and self._fetch is not None:
+            seen.add(path)
+            parent_text = self._fetch(path)
+        if not parent_text:
+            self._minimal = True
+            return config
+        return update_nested_dict(self._resolve(parent_text, seen), config)
+
+    def dump(self) -> str:
+        """Return the merged configuration as YAML."""
+        if self._dump is None:
+            import yaml
+
+            self._dump = yaml.safe_dump(self.dict, sort_keys=False)
+        return self._dump
+
+    def get(self, *keys: str, default: Any = None) -> Any:
+        """Look up a nested key in the merged configuration.
+
+        Parameters
+        ----------
+        keys : str
+            path of keys, e.g. ``"pipeline_setup", "system_config"``
+
+        default : any
+            value to return if the key is not set
+
+        Returns
+        -------
+        any
+        """
+        value: Any = self.dict
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                return default
+            value = value[key]
+        return value
+
+    def directory_path(self, key: str) -> Optional[str]:
+        """Return ``pipeline_setup.<key>.path`` if it is set.
+
+        Parameters
+        ----------
+        key : str
+            e.g., ``"output_directory"``
+
+        Returns
+        -------
+        str or None
+        """
+        path = self.get("pipeline_setup", key, "path")
+        return path if isinstance(path, str) and path else None
+
+
+@dataclass
+class ContainerLimits:
+    r"""CPU, memory and thread limits for a C-PAC container.
+
+    Examples
+    --------
+    >>> limits = ContainerLimits.from_config(ResolvedConfig(
+    ...     "pipeline_setup:\n  system_config:\n"
+    ...     "    maximum_memory_per_participant: 1.5\n"
+    ...     "    max_cores_per_participant: 2\n"
+    ...     "    num_participants_at_once: 3\n"))
+    >>> limits
+    ContainerLimits(memory_gb=4.5, cpus=6, threads=2)
+    >>> limits.memory_mb
+    4608
+    >>> limits.environment["OMP_NUM_THREADS"]
+    '2'
+    >>> ContainerLimits.from_config(ResolvedConfig({}))
+    ContainerLimits(memory_gb=None, cpus=None, threads=None)
+    """
+
+    memory_gb: Optional[float]
+    """memory the container may use"""
+    cpus: Optional[int]
+    """CPUs the container may use"""
+    threads: Optional[int]
+    """threads each process in the container may use"""
+
+    @classmethod
+    def from_config(
+        cls, config: ResolvedConfig, participants: Optional[int] = None
+    ) -> "ContainerLimits":
+        """Read limits from ``pipeline_setup.system_config``.
+
+        C-PAC runs ``num_participants_at_once`` participants in a container,
+        each with ``maximum_memory_per_participant`` GB and
+        ``max_cores_per_participant`` CPUs; a container gets enough for all
+        of them, and each process gets one participant's CPUs.
+
+        Parameters
+        ----------
+        config : ResolvedConfig
+
+        participants : int, optional
+            participants the container runs at once, if not the configured
+            ``num_participants_at_once``
+
+        Returns
+        -------
+        ContainerLimits
+        """
+
+        def positive(key: str) -> Optional[float]:
+            value = config.get("pipeline_setup", "system_config", key)
+            try:
+                return float(value) if float(value) > 0 else None
+            except (TypeError, ValueError):
+                return None
+
+        participants = participants or int(positive("num_participants_at_once") or 1)
+        memory_gb = positive("maximum_memory_per_participant")
+        cores = positive("max_cores_per_participant")
+        return cls(
+            memory_gb * participants if memory_gb else None,
+            int(cores) * participants if cores else None,
+            int(cores) if cores else None,
+        )
+
+    @property
+    def memory_mb(self) -> Optional[int]:
+        """Memory limit in whole MB."""
+        return ceil(self.memory_gb * 1024) if self.memory_gb else None
+
+    @property
+    def environment(self) -> dict[str, str]:
+        """Thread-count environment variables for the container."""
+        if not self.threads:
+            return {}
+        return {variable: str(self.threads) for variable in THREAD_ENV_VARS}
+
+
+def memory_mb(limit: Union[int, float, str]) -> int:
+    """Convert a container memory limit to whole MB.
+
+    Parameters
+    ----------
+    limit : int, float or str
+        bytes, or a number with a ``b``, ``k``, ``m`` or ``g`` unit as Docker
+        and Apptainer/Singularity take
+
+    Returns
+    -------
+    int
+
+    Examples
+    --------
+    >>> memory_mb("4608m"), memory_mb("4.5G"), memory_mb("1gb"), memory_mb(2**30)
+    (4608, 4608, 1024, 1024)
+    """
+    units = {"b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+    if isinstance(limit, str):
+        limit = limit.strip().lower()
+        if len(limit) > 1 and limit[-1] == "b" and limit[-2] in units:
+            limit = limit[:-1]
+        if limit[-1:] in units:
+            limit = float(limit[:-1]) * units[limit[-1]]
+    return ceil(float(limit) / 1024**2)
+
+
+def read_local_config(path: str) -> Optional[str]:
+    """Return the text of a local configuration file, if it exists."""
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as config_file:
+            return config_file.read()
+    return None
+
+
+__all__ = [
+    "ContainerLimits",
+    "memory_mb",
+    "PRECONFIG_DIR",
+    "preconfig_path",
+    "read_local_config",
+    "ResolvedConfig",
+    "THREAD_ENV_VARS",
+    "update_nested_dict",
+]
@@ -0,0 +1,289 @@
+"""Buffered writing of container output to the terminal and a log file."""
+
+from __future__ import annotations
+
+import codecs
+import gzip
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import Iterable, Optional, TextIO, Tuple, Union
+
+BUFFER_SIZE = 64 * 1024
+"""characters of output to collect before writing them out"""
+FLUSH_INTERVAL = 0.5
+"""most seconds output is held back"""
+MAX_LOG_BYTES = 100 * 1024**2
+"""default size at which a tee'd log file is rotated"""
+LOG_BACKUPS = 5
+"""default number of gzipped rotated log files kept"""
+
+
+class RotatingLog:
+    """Append-only log file, gzipped and rotated when it grows too large.
+
+    Rotated files are named ``<path>.1.gz`` (newest) to ``<path>.<backups>.gz``.
+
+    Parameters
+    ----------
+    path : str
+
+    max_bytes : int
+
+    backups : int
+    """
+
+    def __init__(
+        self, path: str, max_bytes: int = MAX_LOG_BYTES, backups: int = LOG_BACKUPS
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "ab")
+
+    def write(self, data: bytes) -> None:
+        """Append ``data``, rotating first if it would overflow the file."""
+        if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+            self.rotate()
+        self._file.write(data)
+
+    def rotate(self) -> None:
+        """Gzip the current file to ``<path>.1.gz`` and start a new one."""
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}.gz"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}.gz")
+        if self.backups > 0:
+            with open(self.path, "rb") as current, gzip.open(
+                f"{self.path}.1.gz", "wb"
+            ) as rotated:
+                shutil.copyfileobj(current, rotated)
+        self._file = open(self.path, "wb")
+
+    def flush(self) -> None:
+        """Flush the file."""
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+def _thread_stream(stream: TextIO) -> TextIO:
+    """Return the stream that ``stream`` sends this thread's writes to.
+
+    While participants run in parallel, :py:data:`sys.stdout` sends each
+    thread's writes to that participant's log.
+    """
+    from cpac.utils.scheduler import _ThreadOutput
+
+    return stream.stream if isinstance(stream, _ThreadOutput) else stream
+
+
+class LogSink:
+    r"""Decode, batch and write container output.
+
+    Output is decoded incrementally, so multi-byte characters split across
+    chunks survive, and written in large batches rather than chunk by chunk.
+    A batch is written once it reaches ``buffer_size`` characters or has
+    waited ``flush_interval`` seconds, and when the sink is closed. The wait
+    is timed in the background, so output from a container that has gone
+    quiet is not held back.
+
+    Parameters
+    ----------
+    stdout : TextIO, optional
+        defaults to :py:data:`sys.stdout` when the sink is created, so that
+        batches flushed in the background reach the same stream
+
+    stderr : TextIO, optional
+        where to write the container's standard error when ``demultiplex``;
+        defaults to :py:data:`sys.stderr` when the sink is created
+
+    log : RotatingLog, optional
+        file to also write all output to
+
+    demultiplex : bool
+        write standard error separately and prefix each line with a
+        timestamp and, for standard error, ``[stderr]``
+
+    buffer_size : int
+
+    flush_interval : float
+
+    Examples
+    --------
+    >>> import io
+    >>> stdout = io.StringIO()
+    >>> with LogSink(stdout) as sink:
+    ...     sink.write("snowman: ".encode())
+    ...     sink.write("☃\n".encode()[:2])
+    ...     sink.write("☃\n".encode()[2:])
+    ...     stdout.getvalue()
+    ''
+    >>> stdout.getvalue()
+    'snowman: ☃\n'
+    """
+
+    def __init__(
+        self,
+        stdout: Optional[TextIO] = None,
+        stderr: Optional[TextIO] = None,
+        log: Optional[RotatingLog] = None,
+        demultiplex: bool = False,
+        buffer_size: int = BUFFER_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ) -> None:
+        self.stdout = _thread_stream(stdout if stdout is not None else sys.stdout)
+        self.stderr = _thread_stream(stderr if stderr is not None else sys.stderr)
+        self.log = log
+        self.demultiplex = demultiplex
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._decoders = {
+            source: codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for source in ("stdout", "stderr")
+        }
+        self._pending = {"stdout": [], "stderr": []}
+        self._partial = {"stdout": "", "stderr": ""}
+        self._size = 0
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+
+    @classmethod
+    def from_options(cls, **kwargs) -> "LogSink":
+        """Make a sink from cpac's commandline options.
+
+        Parameters
+        ----------
+        kwargs : dict
+            ``tee_log``, ``tee_log_max_mb`` and ``log_timestamps``
+
+        Returns
+        -------
+        LogSink
+        """
+        log = None
+        if kwargs.get("tee_log"):
+            log = RotatingLog(
+                kwargs["tee_log"],
+                int(
+                    (kwargs.get("tee_log_max_mb") or MAX_LOG_BYTES / 1024**2) * 1024**2
+                ),
+            )
+        return cls(log=log, demultiplex=bool(kwargs.get("log_timestamps")))
+
+    def _stamp(self, text: str, source: str) -> str:
+        """Prefix each complete line of ``text`` with a timestamp."""
+        text = self._partial[source] + text
+        lines = text.split("\n")
+        self._partial[source] = lines.pop()
+        if not lines:
+            return ""
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+        tag = " [stderr]" if source == "stderr" else ""
+        return "".join(f"{stamp}{tag} {line}\n" for line in lines)
+
+    def write(self, data: Union[bytes, str], source: str = "stdout") -> None:
+        """Add output from the container.
+
+        Parameters
+        ----------
+        data : bytes or str
+
+        source : str
+            ``"stdout"`` or ``"stderr"``
+        """
+        if not data:
+            return
+        if not self.demultiplex:
+            source = "stdout"
+        with self._lock:
+            text = (
+                self._decoders[source].decode(data) if isinstance(data, bytes) else data
+            )
+            if self.demultiplex:
+                text = self._stamp(text, source)
+            if not text:
+                return
+            self._pending[source].append(text)
+            self._size += len(text)
+            if self._size >= self.buffer_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def write_all(
+        self,
+        chunks: Iterable[Union[bytes, str, Tuple[Optional[bytes], Optional[bytes]]]],
+    ) -> None:
+        """Write every chunk of a stream, e.g. from ``container.attach``.
+
+        Parameters
+        ----------
+        chunks : iterable
+            bytes or text, or ``(stdout, stderr)`` pairs from a demultiplexed
+            Docker stream
+        """
+        for chunk in chunks:
+            if isinstance(chunk, tuple):
+                self.write(chunk[0], "stdout")
+                self.write(chunk[1], "stderr")
+            else:
+                self.write(chunk)
+
+    def flush(self) -> None:
+        """Write out everything collected so far."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            for source in ("stdout", "stderr"):
+                if not self._pending[source]:
+                    continue
+                text = "".join(self._pending[source])
+                self._pending[source] = []
+                stream = self.stderr if source == "stderr" else self.stdout
+                stream.write(text)
+                stream.flush()
+                if self.log is not None:
+                    self.log.write(text.encode("utf-8"))
+            if self.log is not None:
+                self.log.flush()
+            self._size = 0
+
+    def close(self) -> None:
+        """Write out any remaining output, including incomplete lines."""
+        with self._lock:
+            for source, decoder in self._decoders.items():
+                if not self.demultiplex and source == "stderr":
+                    continue
+                tail = decoder.decode(b"", final=True)
+                if self.demultiplex:
+                    tail = (
+                        self._stamp(tail + "\n", source)
+                        if (tail or self._partial[source])
+                        else ""
+                    )
+                if tail:
+                    self._pending[source].append(tail)
+            self.flush()
+            if self.log is not None:
+                self.log.close()
+
+    def __enter__(self) -> "LogSink":
+        """Return the sink."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the sink."""
+        self.close()
+
+
+__all__ = ["LogSink", "RotatingLog"]
@@ -0,0 +1,196 @@
+"""Wrapper and container metrics, served in the OpenMetrics text format."""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+METRICS = {
+    "cpac_running_containers": ("gauge", "C-PAC containers running"),
+    "cpac_queued_participants": ("gauge", "participants waiting to start"),
+    "cpac_container_cpu_percent": (
+        "gauge",
+        "CPU use of a running container; 100 is one CPU fully used",
+    ),
+    "cpac_container_memory_bytes": ("gauge", "resident memory of a running container"),
+    "cpac_participants_completed": ("counter", "participants that passed"),
+    "cpac_participants_failed": ("counter", "participants that failed"),
+    "cpac_phase_seconds": ("counter", "seconds cpac spent in each phase"),
+}
+"""name: (type, help) of every metric cpac reports"""
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Current values of cpac's metrics, safe to update from any thread.
+
+    Parameters
+    ----------
+    metrics : dict, optional
+        name: (type, help); defaults to :py:data:`METRICS`
+
+    Examples
+    --------
+    >>> registry = MetricsRegistry()
+    >>> registry.add("cpac_phase_seconds", 1.5, phase="setup")
+    >>> registry.set("cpac_running_containers", 2)
+    >>> print(registry.render(), end="")  # doctest: +ELLIPSIS
+    # HELP cpac_running_containers C-PAC containers running
+    # TYPE cpac_running_containers gauge
+    cpac_running_containers 2
+    ...
+    # TYPE cpac_phase_seconds counter
+    cpac_phase_seconds_total{phase="setup"} 1.5
+    # EOF
+    """
+
+    def __init__(self, metrics: Optional[Dict[str, Tuple[str, str]]] = None) -> None:
+        self.metrics = dict(METRICS if metrics is None else metrics)
+        self._values: Dict[str, Dict[_Labels, float]] = {
+            name: {} for name in self.metrics
+        }
+        self._lock = threading.Lock()
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Set a metric's value."""
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def add(self, name: str, amount: float = 1, **labels: str) -> None:
+        """Add to a metric's value."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[name][key] = self._values[name].get(key, 0) + amount
+
+    def remove(self, name: str, **labels: str) -> None:
+        """Stop reporting a metric with these labels, e.g. for a stopped container."""
+        with self._lock:
+            self._values[name].pop(tuple(sorted(labels.items())), None)
+
+    def get(self, name: str, **labels: str) -> Optional[float]:
+        """Return a metric's value, if set."""
+        with self._lock:
+            return self._values[name].get(tuple(sorted(labels.items())))
+
+    @contextmanager
+    def timed(self, phase: str) -> Iterator[None]:
+        """Add the seconds the block takes to ``cpac_phase_seconds``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add("cpac_phase_seconds", time.perf_counter() - start, phase=phase)
+
+    def render(self) -> str:
+        """Return every metric in the OpenMetrics text format."""
+        lines = []
+        with self._lock:
+            for name, (kind, description) in self.metrics.items():
+                lines.extend([f"# HELP {name} {description}", f"# TYPE {name} {kind}"])
+                sample = f"{name}_total" if kind == "counter" else name
+                for labels, value in sorted(self._values[name].items()):
+                    label_text = ",".join(
+                        f'{key}="{_escape(str(label))}"' for key, label in labels
+                    )
+                    lines.append(
+                        f"{sample}{{{label_text}}} {value:g}"
+                        if label_text
+                        else f"{sample} {value:g}"
+                    )
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+"""metrics of this cpac invocation"""
+for _name in (
+    "cpac_running_containers",
+    "cpac_queued_participants",
+    "cpac_participants_completed",
+    "cpac_participants_failed",
+):
+    REGISTRY.set(_name, 0)
+
+
+class MetricsServer:
+    """Serve a registry at ``/metrics`` from a background thread.
+
+    Parameters
+    ----------
+    port : int
+        0 picks a free port
+
+    registry : MetricsRegistry, optional
+        defaults to :py:data:`REGISTRY`
+
+    address : str
+        interface to listen on; by default, only this host can scrape
+
+    Raises
+    ------
+    OSError
+        if the port cannot be bound
+    """
+
+    def __init__(
+        self,
+        port: int,
+        registry: Optional[MetricsRegistry] = None,
+        address: str = "127.0.0.1",
+    ) -> None:
+        from tornado.netutil import bind_sockets
+
+        self.registry = registry if registry is not None else REGISTRY
+        # bound here so that a port in use is reported to the caller
+        self._sockets = bind_sockets(port, address)
+        self.port = self._sockets[0].getsockname()[1]
+        self._loop = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._serve, name="cpac-metrics", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+
+    def _serve(self) -> None:
+        import asyncio
+
+        from tornado.httpserver import HTTPServer
+        from tornado.ioloop import IOLoop
+        from tornado.web import Application, RequestHandler
+
+        registry = self.registry
+
+        class MetricsHandler(RequestHandler):
+            def get(self) -> None:
+                self.set_header("Content-Type", CONTENT_TYPE)
+                self.write(registry.render())
+
+        try:
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            self._loop = IOLoop.current()
+            HTTPServer(Application([(r"/metrics", MetricsHandler)])).add_sockets(
+                self._sockets
+            )
+        finally:
+            self._ready.set()
+        self._loop.start()
+        self._loop.close(all_fds=True)
+
+    def stop(self) -> None:
+        """Stop serving."""
+        if self._loop is not None:
+            self._loop.add_callback(self._loop.stop)
+            self._thread.join(5)
+
+
+__all__ = ["CONTENT_TYPE", "METRICS", "MetricsRegistry", "MetricsServer", "REGISTRY"]
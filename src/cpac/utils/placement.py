@@ -0,0 +1,234 @@
+"""Give concurrently running containers disjoint CPUs, within a NUMA node if possible."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+NODE_DIR = "/sys/devices/system/node"
+"""sysfs directory listing this host's NUMA nodes"""
+
+
+def parse_cpulist(cpulist: str) -> List[int]:
+    r"""Parse a kernel CPU list.
+
+    Parameters
+    ----------
+    cpulist : str
+        e.g., the contents of ``/sys/devices/system/node/node0/cpulist``
+
+    Returns
+    -------
+    list of int
+
+    Examples
+    --------
+    >>> parse_cpulist("0-3,8,10-11\n")
+    [0, 1, 2, 3, 8, 10, 11]
+    >>> parse_cpulist("")
+    []
+    """
+    cpus = []
+    for part in cpulist.strip().split(","):
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def format_cpulist(cpus: List[int]) -> str:
+    """Format CPUs as a kernel CPU list, as Docker, taskset and numactl take.
+
+    Parameters
+    ----------
+    cpus : list of int
+
+    Returns
+    -------
+    str
+
+    Examples
+    --------
+    >>> format_cpulist([8, 0, 1, 2, 3, 11, 10])
+    '0-3,8,10-11'
+    """
+    ranges: List[List[int]] = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(
+        str(first) if first == last else f"{first}-{last}" for first, last in ranges
+    )
+
+
+def numa_nodes(node_dir: str = NODE_DIR) -> Dict[int, List[int]]:
+    """Return the CPUs of each NUMA node that this process may run on.
+
+    Parameters
+    ----------
+    node_dir : str
+
+    Returns
+    -------
+    dict
+        NUMA node: CPUs; without NUMA information, every allowed CPU
+        is in node ``-1``
+    """
+    try:
+        allowed = os.sched_getaffinity(0)
+    except AttributeError:  # pragma: no cover
+        allowed = set(range(os.cpu_count() or 1))
+    nodes = {}
+    try:
+        entries = os.listdir(node_dir)
+    except OSError:
+        entries = []
+    for entry in entries:
+        if not (entry.startswith("node") and entry[4:].isdigit()):
+            continue
+        try:
+            with open(
+                os.path.join(node_dir, entry, "cpulist"), encoding="utf-8"
+            ) as cpulist:
+                cpus = [cpu for cpu in parse_cpulist(cpulist.read()) if cpu in allowed]
+        except OSError:
+            continue
+        if cpus:
+            nodes[int(entry[4:])] = cpus
+    return nodes or {-1: sorted(allowed)}
+
+
+@dataclass
+class Placement:
+    """CPUs and NUMA nodes assigned to one container."""
+
+    cpus: List[int]
+    """CPUs the container runs on"""
+    nodes: List[int]
+    """NUMA nodes of those CPUs, or ``[-1]`` if unknown"""
+
+    @property
+    def cpuset_cpus(self) -> str:
+        """CPUs as Docker's ``cpuset_cpus``."""
+        return format_cpulist(self.cpus)
+
+    @property
+    def cpuset_mems(self) -> Optional[str]:
+        """NUMA nodes as Docker's ``cpuset_mems``, if known."""
+        if -1 in self.nodes:
+            return None
+        return format_cpulist(self.nodes)
+
+    def command_prefix(self) -> List[str]:
+        """Return a command that runs the rest of a command line on these CPUs.
+
+        ``numactl`` also keeps memory on the placement's NUMA nodes;
+        ``taskset`` only sets CPU affinity.
+
+        Returns
+        -------
+        list of str
+            empty if neither ``numactl`` nor ``taskset`` is installed
+        """
+        if self.cpuset_mems is not None and shutil.which("numactl"):
+            return [
+                "numactl",
+                f"--physcpubind={self.cpuset_cpus}",
+                f"--membind={self.cpuset_mems}",
+            ]
+        if shutil.which("taskset"):
+            return ["taskset", "--cpu-list", self.cpuset_cpus]
+        return []
+
+
+class CpuPlacer:
+    """Hand out disjoint sets of CPUs, each within one NUMA node if possible.
+
+    Parameters
+    ----------
+    nodes : dict, optional
+        NUMA node: CPUs; defaults to :py:func:`numa_nodes`
+
+    Examples
+    --------
+    >>> placer = CpuPlacer({0: [0, 1, 2, 3], 1: [4, 5, 6, 7]})
+    >>> first = placer.acquire(3)
+    >>> first
+    Placement(cpus=[0, 1, 2], nodes=[0])
+    >>> placer.acquire(2)
+    Placement(cpus=[4, 5], nodes=[1])
+    >>> placer.acquire(3)
+    Placement(cpus=[6, 7, 3], nodes=[1, 0])
+    >>> placer.acquire(1) is None
+    True
+    >>> placer.release(first)
+    >>> placer.acquire(1)
+    Placement(cpus=[0], nodes=[0])
+    """
+
+    def __init__(self, nodes: Optional[Dict[int, List[int]]] = None) -> None:
+        self.nodes = nodes if nodes is not None else numa_nodes()
+        self._free = {node: list(cpus) for node, cpus in self.nodes.items()}
+        self._lock = threading.Lock()
+
+    def acquire(self, n_cpus: int) -> Optional[Placement]:
+        """Reserve ``n_cpus`` CPUs.
+
+        The node with the fewest free CPUs that still fits them all is used,
+        leaving larger gaps for larger requests. Otherwise, the CPUs are taken
+        from the nodes with the most free CPUs.
+
+        Parameters
+        ----------
+        n_cpus : int
+
+        Returns
+        -------
+        Placement or None
+            None if fewer than ``n_cpus`` CPUs are free
+        """
+        n_cpus = max(n_cpus, 1)
+        with self._lock:
+            fitting = [node for node, free in self._free.items() if len(free) >= n_cpus]
+            if fitting:
+                node = min(fitting, key=lambda node: (len(self._free[node]), node))
+                cpus = self._free[node][:n_cpus]
+                del self._free[node][:n_cpus]
+                return Placement(cpus, [node])
+            if sum(len(free) for free in self._free.values()) < n_cpus:
+                return None
+            cpus, nodes = [], []
+            for node in sorted(self._free, key=lambda node: -len(self._free[node])):
+                taken = self._free[node][: n_cpus - len(cpus)]
+                del self._free[node][: len(taken)]
+                cpus.extend(taken)
+                nodes.append(node)
+                if len(cpus) == n_cpus:
+                    break
+            return Placement(cpus, nodes)
+
+    def release(self, placement: Optional[Placement]) -> None:
+        """Return a placement's CPUs to the pool."""
+        if placement is None:
+            return
+        with self._lock:
+            for cpu in placement.cpus:
+                node = next(node for node, cpus in self.nodes.items() if cpu in cpus)
+                self._free[node].append(cpu)
+                self._free[node].sort()
+
+
+__all__ = [
+    "CpuPlacer",
+    "format_cpulist",
+    "numa_nodes",
+    "parse_cpulist",
+    "Placement",
+]
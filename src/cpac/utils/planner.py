@@ -0,0 +1,303 @@
+"""Plan participant runs from the resource usage of earlier runs."""
+
+from __future__ import annotations
+
+import os
+from statistics import median
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from cpac.helpers import drop_extra_arg
+from cpac.utils.scheduler import ParticipantJob
+
+HEADROOM = 0.2
+"""fraction added to predicted peak memory to size a participant's container"""
+SCALE_LIMITS = (0.5, 2.0)
+"""bounds on scaling cohort-wide predictions by relative input size"""
+MEMORY_QUANTILE = 0.95
+"""quantile of earlier runs' peak memory used for participants without history"""
+
+
+def participant_key(label: str) -> Tuple[str, ...]:
+    """Return a participant's identifiers without BIDS entity prefixes.
+
+    Parameters
+    ----------
+    label : str
+        e.g., a participant label or the name of a C-PAC log directory
+
+    Returns
+    -------
+    tuple of str
+
+    Examples
+    --------
+    >>> participant_key("sub-0025427_ses-1")
+    ('0025427', '1')
+    >>> participant_key("0025427_1") == participant_key("sub-0025427_ses-1")
+    True
+    """
+    return tuple(
+        part.split("-", 1)[1] if part.startswith(("sub-", "ses-")) else part
+        for part in label.split("_")
+        if part
+    )
+
+
+def _tree_bytes(path: str) -> int:
+    """Return the total size of the files under ``path``."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    total += entry.stat().st_size
+    return total
+
+
+def input_bytes_from_data_config(path: str) -> List[int]:
+    """Return the size on disk of each data configuration entry's inputs.
+
+    Parameters
+    ----------
+    path : str
+        local path to a data configuration YAML file
+
+    Returns
+    -------
+    list of int
+        in data configuration order; inputs not on this host count as 0
+    """
+    import yaml
+
+    with open(path, "r", encoding="utf-8") as data_config:
+        entries = yaml.safe_load(data_config) or []
+    sizes = []
+    for entry in entries:
+        total = 0
+        stack = [entry]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                stack.extend(value.values())
+            elif isinstance(value, list):
+                stack.extend(value)
+            elif isinstance(value, str) and os.path.isfile(value):
+                total += os.path.getsize(value)
+        sizes.append(total)
+    return sizes
+
+
+def input_bytes_from_bids(bids_dir: str, labels: Iterable[str]) -> List[int]:
+    """Return the size on disk of each participant's BIDS directory.
+
+    Parameters
+    ----------
+    bids_dir : str
+
+    labels : iterable of str
+        from :py:func:`~cpac.utils.scheduler.participants_from_bids`
+
+    Returns
+    -------
+    list of int
+    """
+    return [
+        _tree_bytes(os.path.join(bids_dir, *label.split("_", 1))) for label in labels
+    ]
+
+
+def _run_label(callback: str) -> str:
+    """Return the participant label of the run that wrote ``callback``."""
+    directory = os.path.dirname(os.path.abspath(callback))
+    while os.path.basename(directory):
+        if os.path.basename(directory).startswith("sub-"):
+            return os.path.basename(directory)
+        directory = os.path.dirname(directory)
+    return os.path.basename(os.path.dirname(os.path.abspath(callback)))
+
+
+class RunHistory:
+    """Peak memory and wall time of earlier participant runs.
+
+    Parameters
+    ----------
+    runs : iterable of tuple
+        ``(participant label, peak memory in GB, wall time in seconds)``
+    """
+
+    def __init__(self, runs: Iterable[Tuple[str, float, float]]) -> None:
+        self.runs = [
+            (label, memory, wall_time)
+            for label, memory, wall_time in runs
+            if memory > 0 and wall_time > 0
+        ]
+        self.by_participant: Dict[Tuple[str, ...], Tuple[float, float]] = {
+            participant_key(label): (memory, wall_time)
+            for label, memory, wall_time in self.runs
+        }
+
+    @classmethod
+    def from_callback_logs(
+        cls, callbacks: Iterable[str], cache: bool = True
+    ) -> "RunHistory":
+        """Read earlier runs from their ``callback.log`` files.
+
+        C-PAC writes each participant's log under a directory named for the
+        participant, which is used to match runs to participants.
+
+        Parameters
+        ----------
+        callbacks : iterable of str
+
+        cache : bool
+            use the parsed-column caches next to the logs
+
+        Returns
+        -------
+        RunHistory
+        """
+        import numpy as np
+
+        from cpac.helpers.cpac_parse_resources import summarize_run
+
+        runs = []
+        for callback in callbacks:
+            try:
+                summary = summarize_run(callback, cache)
+            except (OSError, UnicodeDecodeError):
+                continue
+            runs.append(
+                (
+                    _run_label(callback),
+                    summary.get("peak_memory_gb", 0.0),
+                    summary["wall_time"] / np.timedelta64(1, "s"),
+                )
+            )
+        return cls(runs)
+
+    def predict(
+        self, label: str, relative_size: float = 1.0
+    ) -> Optional[Tuple[float, float]]:
+        """Predict a participant's peak memory in GB and wall time in seconds.
+
+        A participant with an earlier run is predicted to repeat it. Any
+        other participant gets a high quantile of every earlier run's peak
+        memory and their median wall time, scaled by the participant's
+        input size relative to the cohort's.
+
+        Parameters
+        ----------
+        label : str
+
+        relative_size : float
+            participant's input size divided by the cohort's median
+
+        Returns
+        -------
+        tuple of float, or None if there is no history
+        """
+        if participant_key(label) in self.by_participant:
+            return self.by_participant[participant_key(label)]
+        if not self.runs:
+            return None
+        import numpy as np
+
+        scale = min(max(relative_size, SCALE_LIMITS[0]), SCALE_LIMITS[1])
+        memory = float(np.quantile([run[1] for run in self.runs], MEMORY_QUANTILE))
+        wall_time = median(run[2] for run in self.runs)
+        return memory * scale, wall_time * scale
+
+
+def plan(
+    jobs: Sequence[ParticipantJob],
+    history: RunHistory,
+    input_bytes: Optional[Sequence[int]] = None,
+    headroom: float = HEADROOM,
+) -> List[ParticipantJob]:
+    """Size and order participant jobs from earlier runs.
+
+    Each predicted job's memory (used to pack jobs within the memory budget,
+    as its container's memory limit and as C-PAC's ``--mem_gb``; see
+    :py:func:`planned_flags`) becomes its predicted peak memory plus
+    ``headroom``. Jobs are returned longest first, so the longest runs
+    do not start last and leave the host idle while they finish.
+
+    Parameters
+    ----------
+    jobs : sequence of ParticipantJob
+
+    history : RunHistory
+
+    input_bytes : sequence of int, optional
+        size of each job's inputs on disk
+
+    headroom : float
+
+    Returns
+    -------
+    list of ParticipantJob
+    """
+    sizes = [size for size in (input_bytes or []) if size > 0]
+    cohort_size = median(sizes) if sizes else 0
+    for index, job in enumerate(jobs):
+        size = input_bytes[index] if input_bytes else 0
+        prediction = history.predict(
+            job.label, size / cohort_size if size and cohort_size else 1.0
+        )
+        if prediction is None:
+            continue
+        memory, job.predicted_wall_time = prediction
+        job.memory_gb = job.memory_limit_gb = round(memory * (1 + headroom), 2)
+    return sorted(jobs, key=lambda job: job.predicted_wall_time or 0, reverse=True)
+
+
+def planned_flags(job: ParticipantJob, flags: Sequence[str]) -> List[str]:
+    """Tell C-PAC the memory planned for a job.
+
+    C-PAC sizes its own scheduling by ``--mem_gb``, so a planned memory
+    limit replaces any ``--mem_gb`` given; otherwise C-PAC would plan for
+    more memory than its container has.
+
+    Parameters
+    ----------
+    job : ParticipantJob
+
+    flags : sequence of str
+        arguments passed through to C-PAC
+
+    Returns
+    -------
+    list of str
+
+    Examples
+    --------
+    >>> job = ParticipantJob(0, "sub-01", 8.0, 1)
+    >>> planned_flags(job, ["--mem_gb", "16"])
+    ['--mem_gb', '16']
+    >>> job.memory_limit_gb = 4.5
+    >>> planned_flags(job, ["--mem_gb=16", "--n_cpus", "2"])
+    ['--n_cpus', '2', '--mem_gb', '4.5']
+    """
+    if not job.memory_limit_gb:
+        return list(flags)
+    return [*drop_extra_arg(flags, "mem_gb"), "--mem_gb", f"{job.memory_limit_gb:g}"]
+
+
+__all__ = [
+    "HEADROOM",
+    "input_bytes_from_bids",
+    "input_bytes_from_data_config",
+    "participant_key",
+    "plan",
+    "planned_flags",
+    "RunHistory",
+]
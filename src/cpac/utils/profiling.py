@@ -0,0 +1,164 @@
+"""Time the phases of a cpac invocation as a tree of spans.
+
+Spans are always recorded; they cost a clock read and a dictionary lookup
+each. ``--profile`` prints the tree and ``--profile_json`` writes it.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from functools import wraps
+import json
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+
+_F = TypeVar("_F", bound=Callable)
+
+
+class Span:
+    """Total time spent in a phase, within its parent phase.
+
+    Parameters
+    ----------
+    name : str
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.children: Dict[str, Span] = {}
+
+    def child(self, name: str) -> "Span":
+        """Return the child span called ``name``, creating it if needed."""
+        if name not in self.children:
+            self.children[name] = Span(name)
+        return self.children[name]
+
+    def sorted_children(self) -> List["Span"]:
+        """Return the child spans, longest first."""
+        return sorted(self.children.values(), key=lambda span: -span.seconds)
+
+    def to_dict(self) -> dict:
+        """Return the span and its children as JSON-serializable data."""
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "calls": self.calls,
+            "children": [child.to_dict() for child in self.sorted_children()],
+        }
+
+
+class Profiler:
+    """Record nested spans from any thread.
+
+    Spans opened in a thread without an open span are children of the root.
+
+    Examples
+    --------
+    >>> profiler = Profiler()
+    >>> with profiler.span("setup"):
+    ...     with profiler.span("bindings"):
+    ...         pass
+    ...     with profiler.span("bindings"):
+    ...         pass
+    >>> setup = profiler.root.children["setup"]
+    >>> setup.calls, setup.children["bindings"].calls
+    (1, 2)
+    """
+
+    def __init__(self) -> None:
+        self.root = Span("cpac")
+        self._started = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        """Time the block as a child of the innermost open span.
+
+        Parameters
+        ----------
+        name : str
+
+        Yields
+        ------
+        Span
+        """
+        stack = self._stack()
+        with self._lock:
+            node = (stack[-1] if stack else self.root).child(name)
+        stack.append(node)
+        start = time.perf_counter()
+        try:
+            yield node
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                node.seconds += elapsed
+                node.calls += 1
+
+    def profiled(self, name: Optional[str] = None) -> Callable[[_F], _F]:
+        """Decorate a function to time each call as a span.
+
+        Parameters
+        ----------
+        name : str, optional
+            defaults to the function's qualified name
+        """
+
+        def decorator(function: _F) -> _F:
+            span_name = name or function.__qualname__
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return function(*args, **kwargs)
+
+            return wrapper  # type: ignore[return-value]
+
+        return decorator
+
+    def tree(self) -> Span:
+        """Return the root span, timed from when the profiler was created."""
+        with self._lock:
+            self.root.seconds = time.perf_counter() - self._started
+            self.root.calls = 1
+            return self.root
+
+    def render(self) -> str:
+        """Return the span tree as a table, longest spans first."""
+        lines = [f"{'seconds':>10} {'%':>6} {'calls':>6}  phase"]
+
+        def add(span: Span, parent_seconds: float, depth: int) -> None:
+            share = 100 * span.seconds / parent_seconds if parent_seconds else 100
+            lines.append(
+                f"{span.seconds:10.3f} {share:6.1f} {span.calls:6d}  "
+                f"{'  ' * depth}{span.name}"
+            )
+            for child in span.sorted_children():
+                add(child, span.seconds, depth + 1)
+
+        root = self.tree()
+        add(root, root.seconds, 0)
+        return "\n".join(lines)
+
+    def write_json(self, path: str) -> None:
+        """Write the span tree to a JSON file."""
+        with open(path, "w", encoding="utf-8") as json_file:
+            json.dump(self.tree().to_dict(), json_file, indent=2)
+
+
+PROFILER = Profiler()
+"""spans of this cpac invocation"""
+span = PROFILER.span
+profiled = PROFILER.profiled
+
+__all__ = ["PROFILER", "profiled", "Profiler", "span", "Span"]
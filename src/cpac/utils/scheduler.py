@@ -0,0 +1,347 @@
+"""Run many participants at once, one container per participant."""
+
+from __future__ import annotations
+
+import io
+import os
+import sys
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, TextIO
+
+from cpac.utils.metrics import REGISTRY
+
+
+def host_memory_gb() -> float:
+    """Return the total physical memory of this host in GB."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**3
+
+
+def host_cpus() -> int:
+    """Return the number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def participants_from_data_config(path: str) -> List[str]:
+    """Return a label for each entry of a C-PAC data configuration.
+
+    Parameters
+    ----------
+    path : str
+        local path to a data configuration YAML file
+
+    Returns
+    -------
+    list of str
+        in data configuration order, so index ``i`` is the participant
+        C-PAC runs for ``--participant_ndx i``
+    """
+    import yaml
+
+    with open(path, "r", encoding="utf-8") as data_config:
+        entries = yaml.safe_load(data_config) or []
+    labels = []
+    for index, entry in enumerate(entries):
+        participant = entry if isinstance(entry, dict) else {}
+        label = "_".join(
+            value if value.startswith(f"{prefix}-") else f"{prefix}-{value}"
+            for prefix, value in (
+                ("sub", str(participant.get("subject_id") or "")),
+                ("ses", str(participant.get("unique_id") or "")),
+            )
+            if value
+        )
+        labels.append(label or str(index))
+    return labels
+
+
+def participants_from_bids(bids_dir: str) -> List[str]:
+    """Return a label for each subject and session in a BIDS directory.
+
+    C-PAC builds its participant list from the same ``sub-*/ses-*``
+    directories in sorted order; a data configuration is more reliable
+    when some sessions lack data C-PAC needs.
+
+    Parameters
+    ----------
+    bids_dir : str
+
+    Returns
+    -------
+    list of str
+    """
+    labels = []
+    with os.scandir(bids_dir) as subjects:
+        for subject in sorted(subjects, key=lambda entry: entry.name):
+            if not (subject.name.startswith("sub-") and subject.is_dir()):
+                continue
+            with os.scandir(subject.path) as entries:
+                sessions = sorted(
+                    entry.name
+                    for entry in entries
+                    if entry.name.startswith("ses-") and entry.is_dir()
+                )
+            labels.extend(
+                [f"{subject.name}_{session}" for session in sessions] or [subject.name]
+            )
+    return labels
+
+
+class ParticipantJob:
+    """One participant to run in its own container.
+
+    Parameters
+    ----------
+    index : int
+        ``--participant_ndx`` of the participant
+
+    label : str
+
+    memory_gb : float
+        memory the participant's container may use
+
+    cpus : int
+        CPUs the participant's container may use
+
+    log_path : str, optional
+        file to write the participant's output to
+
+    Attributes
+    ----------
+    memory_limit_gb : float or None
+        memory limit to put on the participant's container, if any
+
+    predicted_wall_time : float or None
+        seconds the participant is expected to run
+    """
+
+    def __init__(
+        self,
+        index: int,
+        label: str,
+        memory_gb: float,
+        cpus: int,
+        log_path: Optional[str] = None,
+    ) -> None:
+        self.index = index
+        self.label = label
+        self.memory_gb = memory_gb
+        self.cpus = cpus
+        self.log_path = log_path
+        self.memory_limit_gb: Optional[float] = None
+        self.predicted_wall_time: Optional[float] = None
+        self.exit_code: Optional[int] = None
+        self.error: Optional[BaseException] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def status(self) -> str:
+        """One of "pending", "running", "passed" or "failed"."""
+        if self.started is None:
+            return "pending"
+        if self.finished is None:
+            return "running"
+        return "passed" if self.exit_code == 0 and self.error is None else "failed"
+
+    @property
+    def wall_time(self) -> Optional[float]:
+        """Seconds the participant ran, once finished."""
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class _ThreadOutput(io.TextIOBase):
+    """Text stream that sends each thread's writes to that thread's stream."""
+
+    def __init__(self, default: TextIO) -> None:
+        self.default = default
+        self._local = threading.local()
+
+    @property
+    def stream(self) -> TextIO:
+        return getattr(self._local, "stream", None) or self.default
+
+    @stream.setter
+    def stream(self, stream: Optional[TextIO]) -> None:
+        self._local.stream = stream
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        return self.stream.write(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+class ParticipantScheduler:
+    """Run participant jobs concurrently within CPU and memory budgets.
+
+    A job starts as soon as fewer than ``max_parallel`` jobs are running and
+    its memory and CPUs fit in what the running jobs leave of the budgets.
+    Jobs are considered in order, but a job that does not fit does not hold
+    back later jobs that do. A job larger than a whole budget runs alone.
+
+    Parameters
+    ----------
+    jobs : iterable of ParticipantJob
+
+    launch : callable
+        takes a :py:class:`ParticipantJob`, runs it and returns its exit code;
+        anything it prints goes to the job's ``log_path``
+
+    max_parallel : int
+
+    memory_budget_gb : float, optional
+        defaults to the host's physical memory
+
+    cpu_budget : int, optional
+        defaults to the CPUs this process may run on
+    """
+
+    def __init__(
+        self,
+        jobs: Iterable[ParticipantJob],
+        launch: Callable[[ParticipantJob], Optional[int]],
+        max_parallel: int,
+        memory_budget_gb: Optional[float] = None,
+        cpu_budget: Optional[int] = None,
+    ) -> None:
+        self.jobs = list(jobs)
+        self.launch = launch
+        self.max_parallel = max(max_parallel, 1)
+        self.memory_budget_gb = (
+            memory_budget_gb if memory_budget_gb is not None else host_memory_gb()
+        )
+        self.cpu_budget = cpu_budget if cpu_budget is not None else host_cpus()
+        self._changed = threading.Condition()
+
+    def _running(self) -> List[ParticipantJob]:
+        return [job for job in self.jobs if job.status == "running"]
+
+    def _fits(self, job: ParticipantJob, running: List[ParticipantJob]) -> bool:
+        if not running:
+            return True
+        return (
+            len(running) < self.max_parallel
+            and sum(other.memory_gb for other in running) + job.memory_gb
+            <= self.memory_budget_gb
+            and sum(other.cpus for other in running) + job.cpus <= self.cpu_budget
+        )
+
+    def _next_job(self) -> Optional[ParticipantJob]:
+        running = self._running()
+        return next(
+            (
+                job
+                for job in self.jobs
+                if job.status == "pending" and self._fits(job, running)
+            ),
+            None,
+        )
+
+    def _run_job(self, job: ParticipantJob, output: _ThreadOutput) -> None:
+        log = None
+        try:
+            if job.log_path is not None:
+                os.makedirs(os.path.dirname(job.log_path) or ".", exist_ok=True)
+                log = open(job.log_path, "w", encoding="utf-8")
+                output.stream = log
+            job.exit_code = self.launch(job)
+        except Exception as exception:
+            job.error = exception
+            if log is not None:
+                print(f"{type(exception).__name__}: {exception}", file=log)
+        finally:
+            output.stream = None
+            if log is not None:
+                log.close()
+            with self._changed:
+                job.finished = time.time()
+                REGISTRY.add(
+                    "cpac_participants_completed"
+                    if job.status == "passed"
+                    else "cpac_participants_failed"
+                )
+                self._changed.notify_all()
+
+    def run(self) -> List[ParticipantJob]:
+        """Run every job and return them once all have finished."""
+        stdout, stderr = sys.stdout, sys.stderr
+        output = _ThreadOutput(stdout)
+        sys.stdout = sys.stderr = output
+        REGISTRY.set("cpac_queued_participants", len(self.jobs))
+        threads = []
+        try:
+            with self._changed:
+                while any(job.status in ("pending", "running") for job in self.jobs):
+                    job = self._next_job()
+                    if job is None:
+                        if not self._running():
+                            break
+                        self._changed.wait()
+                        continue
+                    job.started = time.time()
+                    REGISTRY.set(
+                        "cpac_queued_participants",
+                        sum(other.status == "pending" for other in self.jobs),
+                    )
+                    print(
+                        f"Starting {job.label} (participant {job.index})",
+                        file=stdout,
+                    )
+                    thread = threading.Thread(
+                        target=self._run_job,
+                        args=(job, output),
+                        name=f"participant-{job.index}",
+                        daemon=True,
+                    )
+                    threads.append(thread)
+                    thread.start()
+        finally:
+            for thread in threads:
+                thread.join()
+            sys.stdout, sys.stderr = stdout, stderr
+        return self.jobs
+
+    @property
+    def passed(self) -> bool:
+        """Whether every job passed."""
+        return all(job.status == "passed" for job in self.jobs)
+
+    def summary(self) -> str:
+        """Return a pass/fail table of every job."""
+        from tabulate import tabulate
+
+        return tabulate(
+            [
+                [
+                    job.index,
+                    job.label,
+                    job.status,
+                    job.exit_code if job.error is None else type(job.error).__name__,
+                    ""
+                    if job.wall_time is None
+                    else time.strftime("%H:%M:%S", time.gmtime(job.wall_time)),
+                    job.log_path or "",
+                ]
+                for job in self.jobs
+            ],
+            headers=["ndx", "participant", "status", "exit", "wall time", "log"],
+        )
+
+
+__all__ = [
+    "host_cpus",
+    "host_memory_gb",
+    "ParticipantJob",
+    "participants_from_bids",
+    "participants_from_data_config",
+    "ParticipantScheduler",
+]
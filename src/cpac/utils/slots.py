@@ -0,0 +1,293 @@
+"""Share a host's memory and CPUs among independent cpac invocations.
+
+Each container holds a lease file in a shared directory for as long as it
+runs, locked with :py:func:`fcntl.flock` so that a lease whose process has
+died is recognized and swept. Invocations wait in first-come, first-served
+order until the memory and CPUs they need are free.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+import uuid
+
+from cpac.utils.scheduler import host_cpus, host_memory_gb
+
+SLOT_DIR = os.environ.get("CPAC_SLOT_DIR", "/var/tmp/cpac-slots")
+"""directory shared by every cpac invocation on this host"""
+POLL_INTERVAL = 2.0
+"""seconds between checks for free memory and CPUs while waiting"""
+
+
+def _lock_nonblocking(fd: int) -> bool:
+    """Return whether an exclusive lock on ``fd`` was taken without waiting."""
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+class Lease:
+    """Memory and CPUs held by (or waited for by) one container.
+
+    Parameters
+    ----------
+    path : str
+        lease file, locked for the lease's lifetime
+
+    memory_gb : float
+
+    cpus : int
+
+    label : str
+        shown to other invocations that are waiting
+    """
+
+    def __init__(self, path: str, memory_gb: float, cpus: int, label: str) -> None:
+        self.path = path
+        self.memory_gb = memory_gb
+        self.cpus = cpus
+        self.label = label
+        self.state = "waiting"
+        self._fd: Optional[int] = None
+
+    def open(self) -> None:
+        """Create and lock the lease file."""
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._write()
+
+    def admit(self) -> None:
+        """Mark the lease as holding its memory and CPUs."""
+        self.state = "running"
+        self._write()
+
+    def close(self) -> None:
+        """Give the lease's memory and CPUs back."""
+        if self._fd is None:
+            return
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        os.close(self._fd)
+        self._fd = None
+
+    def _write(self) -> None:
+        if self._fd is None:
+            return
+        record = json.dumps(
+            {
+                "memory_gb": self.memory_gb,
+                "cpus": self.cpus,
+                "label": self.label,
+                "pid": os.getpid(),
+                "state": self.state,
+            }
+        ).encode()
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, record, 0)
+
+
+class HostSlots:
+    """Memory and CPU tokens shared through lock files.
+
+    Parameters
+    ----------
+    directory : str, optional
+        defaults to :py:data:`SLOT_DIR`
+
+    memory_gb : float, optional
+        memory shared among containers; defaults to the host's
+
+    cpus : int, optional
+        CPUs shared among containers; defaults to the host's
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        memory_gb: Optional[float] = None,
+        cpus: Optional[int] = None,
+    ) -> None:
+        self.directory = directory or SLOT_DIR
+        self.memory_gb = memory_gb if memory_gb is not None else host_memory_gb()
+        self.cpus = cpus if cpus is not None else host_cpus()
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            # shared by every user on the host, like /tmp
+            os.chmod(self.directory, 0o1777)
+        except PermissionError:
+            pass
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the pool lock, serializing changes to leases."""
+        fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT)
+        try:
+            try:
+                os.fchmod(fd, 0o666)
+            except PermissionError:
+                pass
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _leases(self) -> List[Tuple[str, dict]]:
+        """Return every live lease in queue order, sweeping dead ones.
+
+        Call while holding the pool lock.
+        """
+        leases = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".lease"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                if _lock_nonblocking(fd):
+                    # nobody holds the lease any more
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                    continue
+                with os.fdopen(os.dup(fd), "r", encoding="utf-8") as lease:
+                    record = json.loads(lease.read() or "{}")
+            except ValueError:
+                continue
+            finally:
+                os.close(fd)
+            leases.append((path, record))
+        return leases
+
+    def usage(self) -> Dict[str, float]:
+        """Return the memory and CPUs in use and the number of waiting leases."""
+        with self._locked():
+            return self._usage(self._leases())
+
+    @staticmethod
+    def _usage(leases: List[Tuple[str, dict]]) -> Dict[str, float]:
+        running = [record for _, record in leases if record.get("state") == "running"]
+        return {
+            "memory_gb": sum(record.get("memory_gb", 0) for record in running),
+            "cpus": sum(record.get("cpus", 0) for record in running),
+            "running": len(running),
+            "waiting": len(leases) - len(running),
+        }
+
+    def _try_admit(self, lease: Lease) -> Tuple[bool, int, Dict[str, float]]:
+        """Admit ``lease`` if it is first in line and fits.
+
+        Returns
+        -------
+        admitted : bool
+
+        position : int
+            leases waiting ahead of ``lease``
+
+        usage : dict
+        """
+        with self._locked():
+            leases = self._leases()
+            usage = self._usage(leases)
+            waiting = [
+                path for path, record in leases if record.get("state") != "running"
+            ]
+            position = waiting.index(lease.path) if lease.path in waiting else 0
+            fits = (
+                usage["memory_gb"] + lease.memory_gb <= self.memory_gb
+                and usage["cpus"] + lease.cpus <= self.cpus
+            )
+            # a lease larger than the whole host runs alone rather than never
+            if position == 0 and (fits or usage["running"] == 0):
+                lease.admit()
+                return True, 0, usage
+            return False, position, usage
+
+    @contextmanager
+    def acquire(
+        self,
+        memory_gb: float,
+        cpus: int,
+        label: str = "",
+        status: Optional[Callable[[str], None]] = None,
+        poll_interval: float = POLL_INTERVAL,
+    ) -> Iterator[Lease]:
+        """Wait for and hold memory and CPUs while the block runs.
+
+        Parameters
+        ----------
+        memory_gb : float
+
+        cpus : int
+
+        label : str
+
+        status : callable, optional
+            called with a message whenever the wait status changes;
+            defaults to printing to stderr
+
+        poll_interval : float
+
+        Yields
+        ------
+        Lease
+        """
+        if status is None:
+            status = _print_status(sys.stderr)
+        lease = Lease(
+            os.path.join(
+                self.directory,
+                f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.lease",
+            ),
+            memory_gb,
+            cpus,
+            label,
+        )
+        with self._locked():
+            lease.open()
+        try:
+            last_message = None
+            while True:
+                admitted, position, usage = self._try_admit(lease)
+                if admitted:
+                    break
+                message = (
+                    f"Waiting for {memory_gb:g} GB and {cpus} CPUs "
+                    f"({position} ahead in queue; {usage['memory_gb']:g}/"
+                    f"{self.memory_gb:g} GB and {usage['cpus']:g}/{self.cpus} "
+                    f"CPUs in use by {usage['running']:g} containers)"
+                )
+                if message != last_message:
+                    status(message)
+                    last_message = message
+                time.sleep(poll_interval)
+            if last_message is not None:
+                status(f"Starting after waiting for {memory_gb:g} GB and {cpus} CPUs")
+            yield lease
+        finally:
+            lease.close()
+
+
+def _print_status(stream: TextIO) -> Callable[[str], None]:
+    """Return a function that prints wait status to ``stream``."""
+
+    def status(message: str) -> None:
+        print(message, file=stream, flush=True)
+
+    return status
+
+
+__all__ = ["HostSlots", "Lease", "POLL_INTERVAL", "SLOT_DIR"]
@@ -0,0 +1,408 @@
+"""Sample a running container's CPU, memory, block I/O and processes."""
+
+from __future__ import annotations
+
+import csv
+from dataclasses import astuple, dataclass, fields
+import os
+import threading
+import time
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Union,
+)
+
+INTERVAL = 5.0
+"""default seconds between samples"""
+PROC_DIR = "/proc"
+
+
+@dataclass
+class Sample:
+    """Resource use of one container at one time."""
+
+    time: float
+    """Unix time of the sample"""
+    cpu_percent: float
+    """CPU use since the previous sample; 100 is one CPU fully used"""
+    memory_bytes: int
+    """resident memory, excluding Docker's reclaimable page cache"""
+    block_read_bytes: int
+    """bytes read from block devices since the container started"""
+    block_write_bytes: int
+    """bytes written to block devices since the container started"""
+    pids: int
+    """number of processes"""
+
+
+def _format_bytes(n_bytes: float) -> str:
+    """Format a byte count for people.
+
+    Examples
+    --------
+    >>> _format_bytes(3.5 * 1024**3)
+    '3.5 GB'
+    >>> _format_bytes(12)
+    '12 B'
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n_bytes) < 1024:  # noqa: PLR2004
+            return f"{n_bytes:.3g} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.3g} TB"
+
+
+def docker_sample(stats: dict) -> Sample:
+    """Make a sample from one of Docker's container stats records.
+
+    Parameters
+    ----------
+    stats : dict
+        decoded record from ``container.stats(stream=True, decode=True)``
+
+    Returns
+    -------
+    Sample
+
+    Examples
+    --------
+    >>> docker_sample({
+    ...     "cpu_stats": {"cpu_usage": {"total_usage": 3_000_000_000},
+    ...                   "system_cpu_usage": 20_000_000_000, "online_cpus": 4},
+    ...     "precpu_stats": {"cpu_usage": {"total_usage": 1_000_000_000},
+    ...                      "system_cpu_usage": 16_000_000_000},
+    ...     "memory_stats": {"usage": 3000, "stats": {"inactive_file": 1000}},
+    ...     "blkio_stats": {"io_service_bytes_recursive": [
+    ...         {"op": "read", "value": 10}, {"op": "write", "value": 20},
+    ...         {"op": "Read", "value": 1}]},
+    ...     "pids_stats": {"current": 7},
+    ... }).cpu_percent
+    200.0
+    """
+    cpu, precpu = stats.get("cpu_stats") or {}, stats.get("precpu_stats") or {}
+    cpu_delta = (cpu.get("cpu_usage") or {}).get("total_usage", 0) - (
+        precpu.get("cpu_usage") or {}
+    ).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    online_cpus = cpu.get("online_cpus") or len(
+        (cpu.get("cpu_usage") or {}).get("percpu_usage") or [None]
+    )
+    memory = stats.get("memory_stats") or {}
+    memory_detail = memory.get("stats") or {}
+    cache = memory_detail.get(
+        "inactive_file", memory_detail.get("total_inactive_file", 0)
+    )
+    io = {"read": 0, "write": 0}
+    for entry in (stats.get("blkio_stats") or {}).get(
+        "io_service_bytes_recursive"
+    ) or []:
+        op = str(entry.get("op", "")).lower()
+        if op in io:
+            io[op] += entry.get("value", 0)
+    return Sample(
+        time.time(),
+        100.0 * cpu_delta / system_delta * online_cpus
+        if cpu_delta > 0 and system_delta > 0
+        else 0.0,
+        max(memory.get("usage", 0) - cache, 0),
+        io["read"],
+        io["write"],
+        (stats.get("pids_stats") or {}).get("current", 0),
+    )
+
+
+def docker_samples(container) -> Iterator[Sample]:
+    """Yield samples of a Docker container until it stops.
+
+    Parameters
+    ----------
+    container : docker.models.containers.Container
+    """
+    for stats in container.stats(stream=True, decode=True):
+        yield docker_sample(stats)
+
+
+def record_pid(path: str) -> List[str]:
+    """Return a command prefix that writes the command's PID to a file.
+
+    The command replaces the shell that writes the file, so the PID is the
+    command's own, whatever the command later calls itself.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    list of str
+    """
+    return ["sh", "-c", 'echo $$ > "$0" && exec "$@"', path]
+
+
+def read_pid(path: str) -> Optional[int]:
+    """Return the PID written by :py:func:`record_pid`, once it is written."""
+    try:
+        with open(path, encoding="utf-8") as pid_file:
+            return int(pid_file.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class ProcessTreeSampler:
+    """Sample a tree of processes, e.g. an Apptainer container.
+
+    Parameters
+    ----------
+    root_pid : int or callable, optional
+        process to sample along with its descendants, or a function that
+        returns that process once it has started (e.g., ``read_pid`` of a
+        :py:func:`record_pid` file); by default, this process's children
+        and their descendants are sampled
+
+    proc_dir : str
+    """
+
+    def __init__(
+        self,
+        root_pid: Union[int, Callable[[], Optional[int]], None] = None,
+        proc_dir: str = PROC_DIR,
+    ) -> None:
+        self.root_pid = root_pid
+        self.proc_dir = proc_dir
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._previous: Optional[tuple] = None
+
+    def _read(self, pid: int, name: str) -> str:
+        with open(
+            os.path.join(self.proc_dir, str(pid), name), encoding="utf-8"
+        ) as proc_file:
+            return proc_file.read()
+
+    def _tree(self) -> List[int]:
+        """Return the sampled processes."""
+        root_pid = self.root_pid() if callable(self.root_pid) else self.root_pid
+        children: Dict[int, List[int]] = {}
+        for entry in os.listdir(self.proc_dir):
+            if not entry.isdigit():
+                continue
+            try:
+                stat = self._read(int(entry), "stat")
+            except OSError:
+                continue
+            # the command name in parentheses may contain spaces
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        if root_pid is not None:
+            roots = [root_pid]
+        elif callable(self.root_pid):
+            # not started yet
+            roots = []
+        else:
+            roots = children.get(os.getpid(), [])
+        tree, stack = [], list(roots)
+        while stack:
+            pid = stack.pop()
+            tree.append(pid)
+            stack.extend(children.get(pid, []))
+        return tree
+
+    def __call__(self) -> Sample:
+        """Sample the process tree."""
+        cpu_ticks = memory = read = write = pids = 0
+        for pid in self._tree():
+            try:
+                stat = self._read(pid, "stat").rsplit(")", 1)[1].split()
+                status = self._read(pid, "status")
+            except OSError:
+                continue
+            pids += 1
+            # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+            cpu_ticks += int(stat[11]) + int(stat[12])
+            for line in status.splitlines():
+                if line.startswith("VmRSS:"):
+                    memory += int(line.split()[1]) * 1024
+            try:
+                io = dict(
+                    line.split(": ", 1)
+                    for line in self._read(pid, "io").splitlines()
+                    if ": " in line
+                )
+            except OSError:
+                continue
+            read += int(io.get("read_bytes", 0))
+            write += int(io.get("write_bytes", 0))
+        now = time.time()
+        cpu_percent = 0.0
+        if self._previous is not None:
+            previous_time, previous_ticks = self._previous
+            if now > previous_time:
+                cpu_percent = max(
+                    100.0
+                    * (cpu_ticks - previous_ticks)
+                    / self._ticks
+                    / (now - previous_time),
+                    0.0,
+                )
+        self._previous = (now, cpu_ticks)
+        return Sample(now, cpu_percent, memory, read, write, pids)
+
+
+class TelemetryRecorder:
+    """Record samples to a CSV file in a background thread.
+
+    Parameters
+    ----------
+    source : callable or iterable
+        a function polled every ``interval`` seconds for a :py:class:`Sample`,
+        or an iterable of samples (of which one per ``interval`` is kept)
+
+    path : str or None
+        CSV file to write, if any
+
+    interval : float
+
+    listener : callable, optional
+        called with each recorded sample, e.g. to update metrics
+    """
+
+    def __init__(
+        self,
+        source: Union[Callable[[], Sample], Iterable[Sample]],
+        path: Optional[str],
+        interval: float = INTERVAL,
+        listener: Optional[Callable[[Sample], None]] = None,
+    ) -> None:
+        self.source = source
+        self.path = path
+        self.interval = interval
+        self.listener = listener
+        self.peak: Optional[Sample] = None
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _samples(self) -> Iterator[Sample]:
+        if callable(self.source):
+            while not self._stopped.is_set():
+                yield self.source()
+                self._stopped.wait(self.interval)
+            return
+        last = None
+        for sample in self.source:
+            if self._stopped.is_set():
+                return
+            if last is None or sample.time - last >= self.interval:
+                last = sample.time
+                yield sample
+
+    def _record(self, csv_file: Optional[TextIO]) -> None:
+        writer = None
+        if csv_file is not None:
+            writer = csv.writer(csv_file)
+            writer.writerow(field.name for field in fields(Sample))
+        try:
+            for sample in self._samples():
+                if writer is not None:
+                    writer.writerow(
+                        f"{value:.1f}" if isinstance(value, float) else value
+                        for value in astuple(sample)
+                    )
+                    csv_file.flush()
+                self._update_peak(sample)
+                if self.listener is not None:
+                    self.listener(sample)
+        except Exception:
+            # e.g., the container was removed mid-stream
+            pass
+        finally:
+            if csv_file is not None:
+                csv_file.close()
+
+    def _update_peak(self, sample: Sample) -> None:
+        self.samples += 1
+        if self.peak is None:
+            self.peak = sample
+            return
+        self.peak = Sample(
+            *(
+                max(peak, value)
+                for peak, value in zip(astuple(self.peak), astuple(sample))
+            )
+        )
+
+    def start(self) -> None:
+        """Create the CSV file, if any, and start sampling.
+
+        Raises
+        ------
+        OSError
+            if the CSV file cannot be created
+        """
+        csv_file = None
+        if self.path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            csv_file = open(self.path, "w", encoding="utf-8", newline="")
+        self._thread = threading.Thread(
+            target=self._record,
+            args=(csv_file,),
+            name="cpac-telemetry",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """Stop sampling, waiting up to ``timeout`` seconds for the thread."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def summary(self, label: str = "") -> str:
+        """Describe peak resource use.
+
+        Parameters
+        ----------
+        label : str
+            what was sampled, e.g. a participant
+
+        Returns
+        -------
+        str
+        """
+        subject = f" of {label}" if label else ""
+        if self.peak is None:
+            return f"No resource telemetry recorded{subject}."
+        return (
+            f"Peak resource use{subject}: {self.peak.cpu_percent:.0f}% CPU, "
+            f"{_format_bytes(self.peak.memory_bytes)} memory, "
+            f"{_format_bytes(self.peak.block_read_bytes)} read, "
+            f"{_format_bytes(self.peak.block_write_bytes)} written, "
+            f"{self.peak.pids} processes ({self.samples} samples"
+            + (f" in {self.path})" if self.path is not None else ")")
+        )
+
+    def __enter__(self) -> "TelemetryRecorder":
+        """Start sampling."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Stop sampling."""
+        self.stop()
+
+
+__all__ = [
+    "docker_sample",
+    "docker_samples",
+    "INTERVAL",
+    "ProcessTreeSampler",
+    "read_pid",
+    "record_pid",
+    "Sample",
+    "TelemetryRecorder",
+]
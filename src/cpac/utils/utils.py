@@ -1,22 +1,128 @@
 from __future__ import annotations
 
-from itertools import permutations
 import os
-from typing import ClassVar, Iterator, Optional, Set, Union
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 from warnings import warn
 
-import yaml
-
 from cpac import DIST_NAME
+from cpac.utils.profiling import profiled
 
 INTERVAL_CHECKS = {"[": "__ge__", "]": "__le__", "(": "__gt__", ")": "__lt__"}
 
 
+class _PathTrie:
+    """Prefix trie of path components."""
+
+    __slots__ = ("children", "terminal")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _PathTrie] = {}
+        self.terminal = False
+
+    def insert(self, parts: Sequence[str]) -> None:
+        """Insert a path, given as a sequence of components."""
+        node = self
+        for part in parts:
+            if node.terminal:
+                # an ancestor is already bound, so this path is covered
+                return
+            node = node.children.setdefault(part, _PathTrie())
+        node.terminal = True
+        node.children.clear()
+
+
+def reduce_bind_roots(
+    paths: Iterable[str], max_depth: Optional[int] = None, min_fanout: int = 2
+) -> Set[str]:
+    """Reduce a collection of paths to a small set of covering paths.
+
+    Builds a prefix trie of path components and walks it once, so the
+    cost is linear in the total length of the given paths.
+
+    Parameters
+    ----------
+    paths : iterable of str
+        local paths to cover
+
+    max_depth : int, optional
+        deepest number of path components a covering path may have;
+        deeper paths are covered by their ancestor at this depth
+
+    min_fanout : int
+        a directory replaces its descendants as a covering path only if
+        at least this many of its children lead to given paths
+
+    Returns
+    -------
+    set of str
+
+    Examples
+    --------
+    >>> sorted(reduce_bind_roots([
+    ...     "/data/sub-1/anat.nii", "/data/sub-2/anat.nii", "/home/me/config.yml"
+    ... ]))
+    ['/data', '/home/me/config.yml']
+    >>> sorted(reduce_bind_roots(["/data/sub-1/anat.nii", "/home/me/x.yml"],
+    ...                          max_depth=1))
+    ['/data', '/home']
+    >>> sorted(reduce_bind_roots(["/a/b/c", "/a/b/d", "/a/b/e", "/a/f/g", "/a/f/h"],
+    ...                          min_fanout=3))
+    ['/a/b', '/a/f/g', '/a/f/h']
+    """
+    trie = _PathTrie()
+    for path in paths:
+        parts = [part for part in os.path.abspath(path).split(os.sep) if part]
+        if max_depth is not None:
+            parts = parts[: max(max_depth, 1)]
+        if parts:
+            trie.insert(parts)
+    # iterative pre-order walk, then resolve covering paths bottom-up
+    order: List[Tuple[_PathTrie, Tuple[str, ...]]] = []
+    stack: List[Tuple[_PathTrie, Tuple[str, ...]]] = [(trie, ())]
+    while stack:
+        node, parts = stack.pop()
+        order.append((node, parts))
+        stack.extend((child, (*parts, name)) for name, child in node.children.items())
+    covering: Dict[int, Set[str]] = {}
+    for node, parts in reversed(order):
+        path = os.sep + os.sep.join(parts)
+        if node.terminal or (parts and len(node.children) >= min_fanout):
+            # never collapse all the way to the filesystem root
+            covering[id(node)] = {path}
+        else:
+            below = [covering.pop(id(child)) for child in node.children.values()]
+            covering[id(node)] = below[0] if len(below) == 1 else set().union(*below)
+    return covering[id(trie)]
+
+
 class LocalsToBind:
-    """Class to collect local directories to bind to containers."""
+    """Class to collect local directories to bind to containers.
+
+    Parameters
+    ----------
+    max_depth : int, optional
+        see :py:func:`reduce_bind_roots`
 
-    def __init__(self):
-        self.locals = set()
+    min_fanout : int
+        see :py:func:`reduce_bind_roots`
+    """
+
+    def __init__(self, max_depth: Optional[int] = None, min_fanout: int = 2):
+        self.locals: Set[str] = set()
+        self.max_depth = max_depth
+        self.min_fanout = min_fanout
 
     def __repr__(self):
         return str(self)
@@ -24,6 +130,7 @@ class LocalsToBind:
     def __str__(self):
         return str(self.locals)
 
+    @profiled()
     def from_config_file(self, config_path):
         """
         Add local bindings from a configuration file.
@@ -33,52 +140,37 @@ class LocalsToBind:
         config_path : str
             path to data config file
         """
+        import yaml
+
         with open(config_path, "r") as config_yml:
             config_dict = yaml.safe_load(config_yml)
-        self._add_locals(config_dict)
+        found: Set[str] = set()
+        self._add_locals(config_dict, found)
+        self.locals = reduce_bind_roots(
+            self.locals | found, max_depth=self.max_depth, min_fanout=self.min_fanout
+        )
 
-    def _add_locals(self, local: str) -> None:
+    def _add_locals(self, local: Any, found: Set[str]) -> None:
         """
-        Add local paths to bindings.
+        Collect local paths to bind.
 
-        Parameter.
-        ---------
+        Parameters
+        ----------
         local : any
             object to search for local paths
+
+        found : set of str
+            paths collected so far; updated in place
         """
-        # pylint: disable=expression-not-assigned
         if isinstance(local, dict):
-            for k in local:
-                self._add_locals(local[k])
+            for value in local.values():
+                self._add_locals(value, found)
         elif isinstance(local, (list, tuple)):
-            for i in local:
-                self._add_locals(i)
+            for item in local:
+                self._add_locals(item, found)
         elif isinstance(local, str):
-            if os.path.exists(local):
-                self.locals.add(local)
-        self._local_common_paths()
-
-    def _local_common_paths(self):
-        new_locals = set()
-        stragglers = set()
-
-        def common_path(paths):
-            x = os.path.commonprefix(list(paths))
-            while not x.endswith("/"):
-                x = x[:-2]
-            x
-            return x
-
-        for i in list(permutations(self.locals, 3)):
-            c = common_path(i)
-            if len(c) > 1:
-                new_locals.add(c)
-            else:
-                for f in i:
-                    stragglers.add(f)
-        self.locals = new_locals | {
-            s for s in stragglers if not any(s.startswith(n) for n in new_locals)
-        }
+            if local not in found and os.path.exists(local):
+                found.add(local)
 
 
 class PermissionMode:
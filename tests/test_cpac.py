@@ -52,3 +52,36 @@ def test_pull(argsep, capsys, image, platform, tag):
 
     # test args after command
     run_test(f"cpac pull {args}".split(" "))
+
+
+def test_switch_before_positional_arguments():
+    """Test that an option without a value leaves the next argument alone."""
+    argv = "cpac run --limit_resources /bids /outputs participant --platform docker"
+    with mock.patch.object(sys, "argv", argv.split(" ")), mock.patch(
+        "cpac.__main__.main"
+    ) as main:
+        run()
+    parsed = main.call_args.args[0]
+    assert parsed.limit_resources
+    assert parsed.platform == "docker"
+    assert [parsed.bids_dir, parsed.output_dir, parsed.level_of_analysis] == [
+        "/bids",
+        "/outputs",
+        "participant",
+    ]
+
+
+@pytest.mark.parametrize("fanout", ["0", "1"])
+def test_bind_min_fanout(capsys, fanout):
+    """Test that an explicit fanout is kept and values below 1 are rejected."""
+    argv = f"cpac --bind_min_fanout {fanout} run /bids /outputs participant"
+    with mock.patch.object(sys, "argv", argv.split(" ")), mock.patch(
+        "cpac.__main__.main"
+    ) as main:
+        if fanout == "0":
+            with pytest.raises(SystemExit):
+                run()
+            assert "must be at least 1, not 0" in capsys.readouterr().err
+            return
+        run()
+    assert main.call_args.args[0].bind_min_fanout == 1
@@ -0,0 +1,249 @@
+"""Tests for parsing resource usage from callback.log files."""
+
+from argparse import ArgumentParser
+import json
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from cpac.helpers import cpac_parse_resources as parse_resources
+
+
+def write_callback_log(path, n_nodes, prefix="wf"):
+    """Write a callback.log with a start and a finish stamp for each node."""
+    with open(path, "w", encoding="utf-8") as callback:
+        for i in range(n_nodes):
+            node = {
+                "name": f"node_{i % 5}",
+                "id": f"{prefix}.node_{i % 5}_{i}",
+                "start": f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}.000000",
+                "estimated_memory_gb": 2.0,
+                "num_threads": 2,
+            }
+            callback.write(json.dumps(node) + "\n")
+            callback.write(
+                json.dumps(
+                    {
+                        **node,
+                        "finish": f"2024-01-01T01:{i // 60 % 60:02d}:{i % 60:02d}",
+                        "runtime_memory_gb": (i % 10) / 10,
+                        "runtime_threads": 1.5,
+                    }
+                )
+                + "\n"
+            )
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_iter_runtime_stats(chunk_size, tmp_path):
+    """Test that chunks are bounded and typed."""
+    callback = write_callback_log(tmp_path / "callback.log", 50)
+    with open(callback, "a", encoding="utf-8") as _f:
+        _f.write('{"id": "still-writing", "runtime_memory_gb": 1')
+    with open(callback, encoding="utf-8") as _f:
+        chunks = list(parse_resources.iter_runtime_stats(_f, chunk_size))
+    assert all(len(chunk["id"]) <= chunk_size for chunk in chunks)
+    assert sum(len(chunk["id"]) for chunk in chunks) == 50  # noqa: PLR2004
+    assert chunks[0]["start"].dtype == np.dtype("datetime64[us]")
+    assert chunks[0][parse_resources.runti].dtype == np.float64
+
+
+def test_load_runtime_stats(tmp_path):
+    """Test that efficiency is computed for every completed node."""
+    usage = parse_resources.load_runtime_stats(
+        write_callback_log(tmp_path / "callback.log", 20), chunk_size=3
+    )
+    assert list(usage.columns) == list(parse_resources.COLUMNS)
+    assert len(usage) == 20  # noqa: PLR2004
+    np.testing.assert_allclose(
+        usage["efficiency"],
+        usage[parse_resources.runti] / usage[parse_resources.estim] * 100,
+    )
+    assert (usage["num_threads"] == 2).all()  # noqa: PLR2004
+
+
+@pytest.mark.parametrize("group", ["highest", "lowest"])
+@pytest.mark.parametrize("filter_field", ["runtime", "estimate", "efficiency"])
+def test_top_k_matches_query(filter_field, group, tmp_path):
+    """Test that streaming top-k selects the same values as a full sort."""
+    callback = write_callback_log(tmp_path / "callback.log", 40)
+    expected = parse_resources.query(
+        parse_resources.load_runtime_stats(callback), filter_field, group, 6
+    )
+    top = parse_resources.TopK(
+        parse_resources.field[filter_field], 6, highest=group == "highest"
+    )
+    with open(callback, encoding="utf-8") as _f:
+        for chunk in parse_resources.iter_runtime_stats(_f, chunk_size=4):
+            top.update(chunk)
+    result = top.result()
+    assert len(result["id"]) == 6  # noqa: PLR2004
+    np.testing.assert_array_equal(
+        result[parse_resources.field[filter_field]],
+        expected[parse_resources.field[filter_field]],
+    )
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_aggregate_runtime_stats(jobs, tmp_path):
+    """Test that node types are summarized across every discovered log."""
+    for participant in range(3):
+        log_dir = tmp_path / f"sub-{participant}" / "log"
+        log_dir.mkdir(parents=True)
+        write_callback_log(log_dir / "callback.log", 10, prefix=f"sub-{participant}")
+    (tmp_path / "sub-0" / "log" / "pypeline.log").write_text("not a callback log")
+    callbacks = list(parse_resources.find_callback_logs(str(tmp_path)))
+    assert len(callbacks) == 3  # noqa: PLR2004
+    assert sorted(
+        parse_resources.find_callback_logs(str(tmp_path / "sub-*" / "log"))
+    ) == sorted(callbacks)
+    summary = parse_resources.aggregate_runtime_stats(callbacks, jobs=jobs)
+    assert list(summary["name"]) == [f"node_{i}" for i in range(5)]
+    assert list(summary["count"]) == [6] * 5
+    # node_1 runs at 0.1 and 0.6 GB in each participant
+    assert summary[f"{parse_resources.runti}_mean"][1] == pytest.approx(0.35)
+    assert summary[f"{parse_resources.runti}_max"][1] == pytest.approx(0.6)
+    assert summary[f"{parse_resources.runti}_p50"][1] == pytest.approx(0.35)
+    assert summary["efficiency_p95"][1] == pytest.approx(30.0)
+
+
+def test_cached_runtime_stats(tmp_path, monkeypatch):
+    """Test that a log is parsed once until its size or mtime changes."""
+    callback = write_callback_log(tmp_path / "callback.log", 20)
+    parsed = []
+    iter_runtime_stats = parse_resources.iter_runtime_stats
+
+    def counting_iter_runtime_stats(*args, **kwargs):
+        parsed.append(args)
+        return iter_runtime_stats(*args, **kwargs)
+
+    monkeypatch.setattr(
+        parse_resources, "iter_runtime_stats", counting_iter_runtime_stats
+    )
+    first = parse_resources.load_runtime_stats(callback, chunk_size=3)
+    assert os.path.exists(f"{callback}{parse_resources.CACHE_SUFFIX}")
+    second = parse_resources.load_runtime_stats(callback)
+    assert len(parsed) == 1
+    cached = list(parse_resources.iter_cached_runtime_stats(callback))
+    assert all(chunk["id"].dtype == object for chunk in cached)
+    for column in parse_resources.COLUMNS:
+        np.testing.assert_array_equal(first[column], second[column])
+    write_callback_log(callback, 21)
+    assert len(parse_resources.load_runtime_stats(callback)) == 21  # noqa: PLR2004
+    assert len(parsed) == 2  # noqa: PLR2004
+    parse_resources.load_runtime_stats(callback, cache=False)
+    assert len(parsed) == 3  # noqa: PLR2004
+
+
+def test_cached_runtime_stats_chunks(tmp_path):
+    """Test that the cache is written and read one chunk at a time."""
+    callback = write_callback_log(tmp_path / "callback.log", 50)
+    sidecar = f"{callback}{parse_resources.CACHE_SUFFIX}"
+    parsed = parse_resources.iter_cached_runtime_stats(callback, chunk_size=7)
+    first = next(parsed)
+    assert len(first["id"]) == 7  # noqa: PLR2004
+    parsed.close()
+    # an abandoned parse leaves no partial cache behind
+    assert not os.path.exists(sidecar)
+    assert os.listdir(tmp_path) == ["callback.log"]
+    parsed = list(parse_resources.iter_cached_runtime_stats(callback, chunk_size=7))
+    assert os.path.exists(sidecar)
+    cached = list(parse_resources.iter_cached_runtime_stats(callback))
+    assert [len(chunk["id"]) for chunk in cached] == [7] * 7 + [1]
+    for column in parse_resources.COLUMNS:
+        np.testing.assert_array_equal(
+            parse_resources._concatenate_columns(parsed)[column],
+            parse_resources._concatenate_columns(cached)[column],
+        )
+
+
+def test_log_follower(tmp_path):
+    """Test that only complete, newly appended lines are read."""
+    callback = tmp_path / "callback.log"
+    follower = parse_resources.LogFollower(str(callback))
+    assert not list(follower.lines())
+    callback.write_text('{"id": "a"}\n{"id": ')
+    assert list(follower.lines(block_size=4)) == ['{"id": "a"}']
+    with open(callback, "a", encoding="utf-8") as _f:
+        _f.write('"b"}\n')
+    assert list(follower.lines()) == ['{"id": "b"}']
+    assert not list(follower.lines())
+    callback.write_text('{"id": "c"}\n')
+    assert list(follower.lines()) == ['{"id": "c"}']
+
+
+def test_timeline():
+    """Test concurrency, idle gaps and serial stretches from a sweep."""
+
+    def stamp(seconds):
+        return np.datetime64("2024-01-01T00:00:00", "us") + np.timedelta64(seconds, "s")
+
+    # a: 0-10 s, b: 5-10 s, c: 10-20 s, gap, d: 30-40 s
+    columns = {
+        "start": np.array([stamp(0), stamp(5), stamp(10), stamp(30)]),
+        "finish": np.array([stamp(10), stamp(10), stamp(20), stamp(40)]),
+        "num_threads": np.array([1.0, 2.0, 1.0, 4.0]),
+        "runtime_threads": np.array([1.0, 1.0, 0.5, 2.0]),
+        parse_resources.runti: np.array([1.0, 2.0, 1.0, np.nan]),
+    }
+    steps = parse_resources.timeline(columns)
+    assert steps["concurrency"].tolist() == [1, 2, 1, 0, 1, 0]
+    assert steps["memory_gb"].tolist() == [1.0, 3.0, 1.0, 0.0, 0.0, 0.0]
+    summary = parse_resources.summarize_timeline(steps)
+    assert summary["wall_time"] == np.timedelta64(40, "s")
+    assert summary["peak_concurrency"] == 2  # noqa: PLR2004
+    assert summary["peak_requested_threads"] == 4  # noqa: PLR2004
+    assert summary["mean_concurrency"] == pytest.approx(35 / 40)
+    assert summary["idle_gaps"] == 1
+    assert summary["idle_time"] == np.timedelta64(10, "s")
+    assert summary["longest_serial"] == np.timedelta64(10, "s")
+    assert summary["longest_serial_start"] == stamp(10)
+
+
+def test_recalibrate(tmp_path):
+    """Test that observed memory quantiles are written as a config overlay."""
+    callbacks = [
+        write_callback_log(
+            tmp_path / f"{participant}.log", 10, f"cpac_sub-0{participant}_ses-1"
+        )
+        for participant in range(3)
+    ]
+    observed = parse_resources.observed_memory(callbacks, quantile=1.0, jobs=1)
+    # each node is pooled across the three participants
+    assert len(observed["id"]) == 10  # noqa: PLR2004
+    assert observed["count"].tolist() == [3] * 10
+    assert observed["id"][0] == "node_0_0"
+    assert observed["ids"][0] == [
+        f"cpac_sub-0{participant}_ses-1.node_0_0" for participant in range(3)
+    ]
+    assert observed[parse_resources.runti].max() == pytest.approx(0.9)
+    overlay = tmp_path / "overlay.yml"
+    observed_log = parse_resources.write_memory_overlay(
+        observed, str(overlay), buffer=20, base="default"
+    )
+    config = yaml.safe_load(overlay.read_text())
+    assert config["FROM"] == "default"
+    assert config["pipeline_setup"]["system_config"]["observed_usage"] == {
+        "callback_log": observed_log,
+        "buffer": 20,
+    }
+    with open(observed_log, encoding="utf-8") as _f:
+        (recalibrated,) = parse_resources.iter_runtime_stats(_f)
+    assert len(recalibrated["id"]) == 40  # noqa: PLR2004
+    assert set(recalibrated["id"]) >= {
+        "node_0_0",
+        "cpac_sub-00_ses-1.node_0_0",
+        "cpac_sub-02_ses-1.node_4_9",
+    }
+
+
+@pytest.mark.parametrize("options", [[], ["--recalibrate", "overlay.yml"]])
+def test_missing_callback_log(options, tmp_path):
+    """Test that a path without callback.log files is an error naming it."""
+    missing = str(tmp_path / "calback.log")
+    args = parse_resources.set_args(ArgumentParser()).parse_args([missing, *options])
+    with pytest.raises(FileNotFoundError, match=missing):
+        parse_resources.main(args)
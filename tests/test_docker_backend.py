@@ -0,0 +1,407 @@
+"""Tests for the Docker backend that do not need a Docker daemon."""
+
+import io
+import os
+import socket
+import subprocess
+import tarfile
+
+import docker
+import pytest
+
+from cpac.backends.docker import (
+    _read_tar,
+    Docker,
+    DockerRun,
+    DockerSession,
+    LABEL_PREFIX,
+    parse_since,
+)
+from cpac.utils import cache
+from cpac.utils.configuration import ContainerLimits
+from cpac.utils.placement import Placement
+
+
+class _FakeContainer:
+    """Container that records the commands run in it."""
+
+    def __init__(self, labels, files=None):
+        self.labels = labels
+        self.files = files or {}
+        self.commands = []
+        self.archives = []
+        self.status = "created"
+
+    def get_archive(self, path):
+        """Stream a tar of ``path`` in small chunks, like the Docker API."""
+        self.archives.append(path)
+        names = [name for name in self.files if name.startswith(f"{path}/")]
+        if path in self.files:
+            names.append(path)
+        if not names:
+            raise docker.errors.NotFound(path)
+        archive = _tar(
+            {
+                os.path.join(os.path.basename(path), os.path.relpath(name, path))
+                if name != path
+                else os.path.basename(path): self.files[name]
+                for name in names
+            }
+        )
+        return (archive[i : i + 7] for i in range(0, len(archive), 7)), {}
+
+    def remove(self):
+        self.status = "removed"
+
+    def start(self):
+        self.status = "running"
+
+    def exec_run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+        return None, iter([b"ok"])
+
+    def kill(self):
+        self.status = "exited"
+
+
+class _FakeContainers:
+    """Enough of ``docker.models.containers.ContainerCollection``."""
+
+    def __init__(self, files=None):
+        self.created = []
+        self.files = files
+
+    def create(self, **kwargs):
+        container = _FakeContainer(kwargs.get("labels", {}), self.files)
+        self.created.append(container)
+        return container
+
+    def list(self, filters=None, **kwargs):
+        labels = dict(label.split("=", 1) for label in filters["label"])
+        return [
+            container
+            for container in self.created
+            if container.status == "running"
+            and labels.items() <= container.labels.items()
+        ]
+
+
+class _FakeClient:
+    """Docker client with only a container collection."""
+
+    def __init__(self, files=None):
+        self.containers = _FakeContainers(files)
+
+
+def _tar(files):
+    """Return a tar archive of ``files``' text keyed by member name."""
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name, text in files.items():
+            data = text.encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return archive.getvalue()
+
+
+def _docker(client, helper_ttl=0):
+    """Return a Docker backend wired to a fake client."""
+    backend = Docker.__new__(Docker)
+    backend.client = client
+    backend.container = None
+    backend.helper_ttl = helper_ttl
+    backend.image = "fcpindi/c-pac:latest"
+    backend._helper = None
+    return backend
+
+
+SHARED_KWARGS = {"image": "fcpindi/c-pac:latest", "user": "1000"}
+
+
+@pytest.mark.parametrize("helper_ttl", [0, 60])
+def test_helper_container_is_reused(helper_ttl):
+    """Test that one helper serves every exec call in an invocation."""
+    client = _FakeClient()
+    backend = _docker(client, helper_ttl)
+    for command in ("cat /code/version", ["ls", "/"]):
+        assert list(backend._exec(command, SHARED_KWARGS)) == [b"ok"]
+    (helper,) = client.containers.created
+    assert helper.labels[f"{LABEL_PREFIX}.role"] == "helper"
+    assert [command[4:] for command in helper.commands] == [
+        ["cat", "/code/version"],
+        ["ls", "/"],
+    ]
+    backend._cleanup()
+    assert helper.status == ("running" if helper_ttl else "exited")
+    # a later invocation reuses a helper only if it was kept alive
+    _docker(client, helper_ttl)._exec("true", SHARED_KWARGS)
+    assert len(client.containers.created) == (1 if helper_ttl else 2)
+
+
+def test_read_tar_streams_selected_members():
+    """Test that only wanted members are extracted from a chunked archive."""
+    archive = _tar({"configs/a.yml": "a: 1\n", "configs/b.txt": "b", "c.yml": "c"})
+    chunks = (archive[i : i + 5] for i in range(0, len(archive), 5))
+    assert _read_tar(chunks, lambda name: name.endswith(".yml")) == {
+        "configs/a.yml": "a: 1\n",
+        "c.yml": "c",
+    }
+
+
+def test_read_container_files_in_one_request():
+    """Test that several files are read through a single archive request."""
+    client = _FakeClient(
+        {
+            "/code/CPAC/resources/configs/pipeline_config_default.yml": "default",
+            "/code/CPAC/resources/configs/data_config_S3-BIDS-ABIDE.yml": "data",
+            "/code/CPAC/resources/configs/1.7-1.8-nesting-mappings.yml": "map",
+        }
+    )
+    backend = _docker(client)
+    paths = [
+        "/code/CPAC/resources/configs/pipeline_config_default.yml",
+        "/code/CPAC/resources/configs/1.7-1.8-nesting-mappings.yml",
+        "/code/CPAC/resources/configs/missing.yml",
+    ]
+    assert backend._read_container_files(paths) == {
+        paths[0]: "default",
+        paths[1]: "map",
+        paths[2]: None,
+    }
+    (container,) = client.containers.created
+    assert container.archives == ["/code/CPAC/resources/configs"]
+    assert container.status == "removed"
+    assert backend._read_container_file(paths[0]) == "default"
+    assert backend._read_container_file("/nonexistent") is None
+
+
+def test_limits_keep_container_options():
+    """Test that limits fill in what --container_option did not set."""
+    backend = _docker(_FakeClient())
+    backend.docker_kwargs = {"init": True, "environment": "OMP_NUM_THREADS=1"}
+    backend._set_limits(ContainerLimits(4.5, 6, 2))
+    assert backend.docker_kwargs == {
+        "init": True,
+        "mem_limit": "4608m",
+        "nano_cpus": 6_000_000_000,
+        "environment": [
+            "OMP_NUM_THREADS=1",
+            "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS=2",
+            "MKL_NUM_THREADS=2",
+        ],
+    }
+
+
+def test_pin_sets_cpusets():
+    """Test that a placement becomes the container's cpusets."""
+    backend = _docker(_FakeClient())
+    backend.docker_kwargs = {"init": True}
+    backend.pin(Placement([4, 5, 6, 8], [1]))
+    assert backend.docker_kwargs == {
+        "init": True,
+        "cpuset_cpus": "4-6,8",
+        "cpuset_mems": "1",
+    }
+    backend.pin(Placement([0], [-1]))
+    assert backend.docker_kwargs == {"init": True, "cpuset_cpus": "0"}
+
+
+class _FinishedContainer:
+    """Container that has already exited."""
+
+    def __init__(self, status_code, oom_killed):
+        self.status_code = status_code
+        self.attrs = {"State": {"OOMKilled": oom_killed}}
+
+    def attach(self, **kwargs):
+        return iter([b"done\n"])
+
+    def wait(self):
+        return {"StatusCode": self.status_code}
+
+    def reload(self):
+        pass
+
+
+@pytest.mark.parametrize(
+    ("status_code", "oom_killed"), [(0, False), (137, True), (1, True)]
+)
+def test_docker_run_detects_oom(status_code, oom_killed, capsys):
+    """Test that an OOM kill is read from the exited container's state."""
+    run = DockerRun(_FinishedContainer(status_code, oom_killed))
+    assert (run.exit_code, run.oom_killed) == (status_code, oom_killed)
+    assert capsys.readouterr().out == "done\n"
+
+
+def test_scale_memory_limit():
+    """Test that a retry raises the container's memory limit."""
+    backend = _docker(_FakeClient())
+    backend.docker_kwargs = {"init": True}
+    backend._scale_memory_limit(1.5)
+    assert "mem_limit" not in backend.docker_kwargs
+    backend.docker_kwargs["mem_limit"] = "4g"
+    backend._scale_memory_limit(1.5)
+    assert backend.docker_kwargs["mem_limit"] == "6144m"
+
+
+class _FakeAPI:
+    """Low-level client that lists containers from canned summaries."""
+
+    def __init__(self, summaries):
+        self.summaries = summaries
+        self.calls = 0
+        self.removed = []
+
+    def containers(self, all=False, filters=None):  # noqa: A002
+        self.calls += 1
+        key, _, value = filters["label"].partition("=")
+        return [
+            summary
+            for summary in self.summaries
+            if key in summary["Labels"] and value in ("", summary["Labels"][key])
+        ]
+
+    def remove_container(self, container, force=False):
+        self.removed.append(container)
+
+
+def _summary(name, state, role="run", status="Up 2 hours", **labels):
+    """Return a container as listed by the Docker API."""
+    return {
+        "Id": f"{name}-id",
+        "Names": [f"/{name}"],
+        "State": state,
+        "Status": status,
+        "Labels": {
+            f"{LABEL_PREFIX}.role": role,
+            **{f"{LABEL_PREFIX}.{key}": value for key, value in labels.items()},
+        },
+    }
+
+
+@pytest.fixture
+def runs():
+    """Return a Docker backend with a mix of cpac containers."""
+    gone = subprocess.Popen(["true"])
+    gone.wait()
+    host = socket.gethostname()
+    client = _FakeClient()
+    client.api = _FakeAPI(
+        [
+            _summary("attached", "running", host=host, pid=str(os.getpid())),
+            _summary("orphan", "running", host=host, pid=str(gone.pid)),
+            _summary("elsewhere", "running", host="other", pid=str(gone.pid)),
+            _summary(
+                "detached", "running", host=host, pid=str(gone.pid), detached="true"
+            ),
+            _summary("done", "exited", status="Exited (137) 1 minute ago"),
+            _summary("helper", "exited", role="helper", status="Exited (0) now"),
+        ]
+    )
+    return _docker(client)
+
+
+def test_status_lists_runs_in_one_call(runs, capsys):
+    """Test that run containers are listed with one filtered API call."""
+    records = {record["name"]: record for record in runs.list_runs()}
+    assert runs.client.api.calls == 1
+    assert sorted(records) == ["attached", "detached", "done", "elsewhere", "orphan"]
+    assert [name for name, record in records.items() if record["orphaned"]] == [
+        "orphan"
+    ]
+    assert records["done"]["exit_code"] == 137  # noqa: PLR2004
+    runs.status(["done"])
+    table = capsys.readouterr().out
+    assert "done" in table
+    assert "orphan" not in table
+
+
+@pytest.mark.parametrize("dry_run", [True, False])
+def test_collect_garbage(runs, dry_run):
+    """Test that exited containers and orphaned runs are removed."""
+    assert runs.collect_garbage(dry_run) == ["orphan", "done", "helper"]
+    assert runs.client.api.removed == (
+        [] if dry_run else ["orphan-id", "done-id", "helper-id"]
+    )
+
+
+def test_run_labels():
+    """Test that run containers are labelled with their participant."""
+    backend = _docker(_FakeClient())
+    backend.config = None
+    labels = backend._run_labels(
+        ["/bids", "/out", "participant", "--participant_ndx", "3"],
+        output_dir="/out",
+        detach=True,
+    )
+    assert labels[f"{LABEL_PREFIX}.participant"] == "ndx-3"
+    assert labels[f"{LABEL_PREFIX}.detached"] == "true"
+    assert labels[f"{LABEL_PREFIX}.output_dir"] == "/out"
+    assert labels[f"{LABEL_PREFIX}.pid"] == str(os.getpid())
+    assert parse_since("2h", 10_000) == 10_000 - 7200
+
+
+class _FakeImages:
+    """Image collection that counts lookups."""
+
+    def __init__(self):
+        self.lookups = 0
+
+    def get(self, name):
+        self.lookups += 1
+        if name.startswith("missing"):
+            raise docker.errors.ImageNotFound(name)
+        return type("Image", (), {"id": "sha256:abc", "attrs": {}})()
+
+
+class _FakeDaemon:
+    """Stands in for ``docker.from_env``, counting handshakes."""
+
+    def __init__(self):
+        self.handshakes = 0
+        self.images = _FakeImages()
+
+    def __call__(self, version=None):
+        client = _FakeClient()
+        client.images = self.images
+        client.api_version = version
+        client.version = self.version
+        client.close = lambda: None
+        return client
+
+    def version(self, api_version=True):
+        self.handshakes += 1
+        return {"Version": "27.0.0", "ApiVersion": "1.46"}
+
+
+@pytest.fixture
+def daemon(monkeypatch, tmp_path):
+    """Replace the Docker daemon and the cpac cache directory."""
+    fake_daemon = _FakeDaemon()
+    monkeypatch.setattr(docker, "from_env", fake_daemon)
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    return fake_daemon
+
+
+@pytest.mark.parametrize("version_ttl", [0, 60])
+def test_session_handshakes_once(daemon, version_ttl):
+    """Test that one handshake serves a session and, with a TTL, the next."""
+    session = DockerSession(version_ttl)
+    assert session.version == "27.0.0"
+    assert session.client.api_version == "1.46"
+    assert daemon.handshakes == 1
+    DockerSession(version_ttl)
+    assert daemon.handshakes == (1 if version_ttl else 2)
+
+
+def test_session_memoizes_images(daemon):
+    """Test that image lookups hit the daemon once until forgotten."""
+    session = DockerSession(0)
+    for _ in range(3):
+        assert session.image("fcpindi/c-pac:latest").id == "sha256:abc"
+        assert session.image("missing:latest") is None
+    assert daemon.images.lookups == 2  # noqa: PLR2004
+    session.forget_image("missing:latest")
+    session.image("missing:latest")
+    assert daemon.images.lookups == 3  # noqa: PLR2004
@@ -0,0 +1,72 @@
+"""Tests for the on-disk image metadata cache."""
+
+import pytest
+
+from cpac.backends.platform import Backend, CpacVersion, PlatformMeta
+from cpac.utils import cache
+from cpac.utils.configuration import preconfig_path
+
+IMAGE_METADATA = (
+    "v1.8.7\n",
+    {
+        "pipeline_config_default.yml": "pipeline_setup:\n  pipeline_name: default\n",
+        "pipeline_config_fmriprep-options.yml": "FROM: default\n",
+    },
+)
+
+
+class _CachedBackend(Backend):
+    """Backend that counts how often it reads from its image."""
+
+    dumps = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.platform = PlatformMeta("Mock", "M")
+
+    def _dump_image_metadata(self):
+        _CachedBackend.dumps += 1
+        return IMAGE_METADATA
+
+    def _image_key(self):
+        return "sha256:0123456789abcdef"
+
+    def _read_container_file(self, path):
+        raise AssertionError(f"{path} should have been read from the cache")
+
+    def get_response(self, command, **kwargs):
+        raise AssertionError(f"`{command}` should not start a container")
+
+
+@pytest.fixture
+def cache_dir(monkeypatch, tmp_path):
+    """Use a temporary cache directory."""
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    _CachedBackend.dumps = 0
+    return tmp_path
+
+
+def test_warm_once(cache_dir, tmp_path):
+    """Test that image metadata is read from the image only once."""
+    for _ in range(3):
+        backend = _CachedBackend(working_dir=str(tmp_path))
+        assert CpacVersion(backend).versions.CPAC == "v1.8.7"
+        config = backend.resolve_config(
+            backend._read_config_file(preconfig_path("fmriprep-options"))
+        )
+        assert config.get("pipeline_setup", "pipeline_name") == "default"
+    assert _CachedBackend.dumps == 1
+    assert (cache_dir / "images" / "0123456789abcdef" / "metadata.json").exists()
+
+
+def test_default_config(cache_dir):
+    """Test reading the cached default pipeline configuration."""
+    metadata = cache.ImageMetadataCache("abc")
+    assert not metadata.complete
+    assert metadata.version is None
+    metadata.store(*IMAGE_METADATA)
+    assert metadata.complete
+    assert metadata.version == "v1.8.7"
+    assert "pipeline_name: default" in metadata.default_config
+    assert metadata.config("/etc/passwd") is None
+    assert metadata.config(preconfig_path("../../../../etc/passwd")) is None
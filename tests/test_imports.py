@@ -0,0 +1,96 @@
+"""Test that lightweight commands do not import heavy dependencies."""
+
+import json
+import os
+from shutil import which
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = {"docker", "pandas", "semver", "spython", "tabulate", "tsconcat"}
+"""modules that only container commands should need"""
+STARTUP_MODULES = {"docker", "numpy", "pandas", "rich", "spython"}
+"""modules ``cpac --help`` must not spend startup time importing"""
+
+
+def _run_cpac(argv, cwd=None, python_args=()):
+    """Run ``cpac`` with ``argv`` in a fresh interpreter."""
+    code = "\n".join(
+        [
+            "import json, sys",
+            f"sys.argv = {['cpac', *argv]!r}",
+            "from cpac.__main__ import run",
+            "try:",
+            "    run()",
+            "except SystemExit:",
+            "    pass",
+            "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules})))",
+        ]
+    )
+    return subprocess.run(
+        [sys.executable, *python_args, "-c", code],
+        capture_output=True,
+        check=True,
+        cwd=cwd,
+        text=True,
+    )
+
+
+def _imported_modules(argv, cwd=None):
+    """Return the top-level modules imported by running ``cpac`` with ``argv``."""
+    completed = _run_cpac(argv, cwd)
+    return set(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        [],
+        ["--help"],
+        ["--version"],
+        ["run", "--help", "--platform", "nonexistent"],
+        ["parse-resources", "--help"],
+        pytest.param(
+            ["tsconcat", "--help"],
+            marks=pytest.mark.skipif(
+                which("ba-tsconcat") is None, reason="ba-tsconcat is not installed"
+            ),
+        ),
+    ],
+)
+def test_help_imports(argv):
+    """Test that helpstrings load without heavy dependencies."""
+    assert not _imported_modules(argv) & HEAVY_MODULES
+
+
+def test_help_import_time():
+    """Test that ``cpac --help`` starts without importing heavy dependencies.
+
+    ``-X importtime`` lists every module actually imported, including any
+    imported and then removed from :py:data:`sys.modules`.
+    """
+    completed = _run_cpac(["--help"], python_args=["-X", "importtime"])
+    imported = {
+        line.rsplit("|", 1)[-1].strip().split(".")[0]
+        for line in completed.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+    assert "cpac" in imported
+    assert not imported & STARTUP_MODULES
+
+
+def test_parse_resources_imports(tmp_path):
+    """Test that parsing resources loads neither a backend nor pandas."""
+    callback = os.path.join(tmp_path, "callback.log")
+    with open(callback, "w", encoding="utf-8") as _f:
+        _f.write(
+            json.dumps(
+                {
+                    "id": "node",
+                    "runtime_memory_gb": 1.0,
+                    "estimated_memory_gb": 2.0,
+                }
+            )
+        )
+    assert not _imported_modules(["parse-resources", callback]) & HEAVY_MODULES
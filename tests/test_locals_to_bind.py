@@ -0,0 +1,60 @@
+"""Tests for collecting local paths to bind from a data configuration."""
+
+import os
+
+import pytest
+import yaml
+
+from cpac.utils import LocalsToBind, reduce_bind_roots
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as _f:
+        _f.write("")
+    return str(path)
+
+
+@pytest.mark.parametrize("n_participants", [1, 3, 2000])
+def test_from_config_file(n_participants, tmp_path):
+    """Test that a data config collapses to its common data directory."""
+    data_dir = tmp_path / "data"
+    data_config = [
+        {
+            "subject_id": f"{i:04d}",
+            "anat": _touch(data_dir / f"sub-{i:04d}" / "anat" / "T1w.nii.gz"),
+            "func": {
+                "rest": {
+                    "scan": _touch(data_dir / f"sub-{i:04d}" / "func" / "bold.nii.gz")
+                }
+            },
+            "site": "not a path",
+        }
+        for i in range(n_participants)
+    ]
+    config_file = tmp_path / "data_config.yml"
+    with open(config_file, "w", encoding="utf-8") as _f:
+        yaml.safe_dump(data_config, _f)
+    locals_to_bind = LocalsToBind()
+    locals_to_bind.from_config_file(str(config_file))
+    if n_participants == 1:
+        assert locals_to_bind.locals == {str(data_dir / "sub-0000")}
+    else:
+        assert locals_to_bind.locals == {str(data_dir)}
+
+
+def test_max_depth():
+    """Test that ``max_depth`` bounds how deep covering paths are."""
+    paths = ["/data/a/b/c/one.nii", "/scratch/x/y/two.nii"]
+    assert reduce_bind_roots(paths) == set(paths)
+    assert reduce_bind_roots(paths, max_depth=2) == {"/data/a", "/scratch/x"}
+
+
+def test_never_root():
+    """Test that unrelated paths never collapse to ``/``."""
+    assert reduce_bind_roots(["/data/one.nii", "/home/two.nii"]) == {
+        "/data/one.nii",
+        "/home/two.nii",
+    }
+    assert reduce_bind_roots(["/data/one.nii", "/data"]) == {"/data"}
+    assert reduce_bind_roots([]) == set()
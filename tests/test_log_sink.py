@@ -0,0 +1,86 @@
+"""Tests for buffered writing of container output."""
+
+import gzip
+import io
+import re
+import time
+
+from cpac.utils.log_sink import LogSink, RotatingLog
+from cpac.utils.scheduler import ParticipantJob, ParticipantScheduler
+
+
+def test_sink_batches_writes():
+    """Test that output is held back until the buffer fills or the sink closes."""
+    stdout = io.StringIO()
+    sink = LogSink(stdout, buffer_size=10, flush_interval=3600)
+    sink.write(b"12345")
+    assert stdout.getvalue() == ""
+    sink.write(b"67890")
+    assert stdout.getvalue() == "1234567890"
+    sink.write(b"\xe2\x98")
+    sink.write(b"\x83 and \xff")
+    sink.close()
+    assert stdout.getvalue() == "1234567890☃ and \ufffd"
+
+
+def test_sink_flushes_quiet_output():
+    """Test that held-back output is written once the container goes quiet."""
+    stdout = io.StringIO()
+    with LogSink(stdout, flush_interval=0.05) as sink:
+        sink.write(b"quiet\n")
+        assert stdout.getvalue() == ""
+        deadline = time.monotonic() + 5
+        while not stdout.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stdout.getvalue() == "quiet\n"
+
+
+def test_sink_flushes_to_participant_logs(capsys, tmp_path):
+    """Test that batches flushed in the background reach the participant's log."""
+
+    def launch(job):
+        with LogSink(flush_interval=0.05) as sink:
+            sink.write(f"{job.label} started\n".encode())
+            time.sleep(0.3)
+            sink.write(f"{job.label} finished\n".encode())
+        return 0
+
+    jobs = [
+        ParticipantJob(index, f"sub-0{index}", 1, 1, str(tmp_path / f"{index}.log"))
+        for index in range(2)
+    ]
+    ParticipantScheduler(jobs, launch, 2, 10, 2).run()
+    for job in jobs:
+        with open(job.log_path, encoding="utf-8") as log:
+            assert log.read() == f"{job.label} started\n{job.label} finished\n"
+    assert "started" not in capsys.readouterr().out
+
+
+def test_sink_demultiplexes_with_timestamps():
+    """Test that demultiplexed output is stamped line by line."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with LogSink(stdout, stderr, demultiplex=True, flush_interval=3600) as sink:
+        sink.write_all([(b"one\ntw", None), (None, b"oops\n"), (b"o\nthree", None)])
+    stamp = r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d"
+    assert re.fullmatch(f"{stamp} one\n{stamp} two\n{stamp} three\n", stdout.getvalue())
+    assert re.fullmatch(f"{stamp} \\[stderr\\] oops\n", stderr.getvalue())
+
+
+def test_sink_tees_to_rotating_log(tmp_path):
+    """Test that output is also written to a log that is rotated and gzipped."""
+    path = tmp_path / "logs" / "run.log"
+    stdout = io.StringIO()
+    with LogSink(
+        stdout, log=RotatingLog(str(path), max_bytes=10, backups=2), buffer_size=1
+    ) as sink:
+        for line in ("first\n", "second\n", "third\n", "fourth\n"):
+            sink.write(line.encode())
+    assert stdout.getvalue() == "first\nsecond\nthird\nfourth\n"
+    assert path.read_text() == "fourth\n"
+    assert gzip.decompress((tmp_path / "logs" / "run.log.1.gz").read_bytes()) == (
+        b"third\n"
+    )
+    assert gzip.decompress((tmp_path / "logs" / "run.log.2.gz").read_bytes()) == (
+        b"second\n"
+    )
+    assert not (tmp_path / "logs" / "run.log.3.gz").exists()
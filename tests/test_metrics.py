@@ -0,0 +1,87 @@
+"""Tests for serving wrapper and container metrics."""
+
+import time
+from urllib.request import urlopen
+
+from cpac.utils.metrics import (
+    CONTENT_TYPE,
+    MetricsRegistry,
+    MetricsServer,
+    REGISTRY,
+)
+from cpac.utils.scheduler import ParticipantJob, ParticipantScheduler
+from cpac.utils.telemetry import Sample
+from .test_docker_backend import _docker, _FakeClient
+
+
+def test_render_labels_and_counters():
+    """Test that label values are escaped and counters end in _total."""
+    registry = MetricsRegistry()
+    registry.set("cpac_container_memory_bytes", 2048, participant='sub-"01"')
+    registry.add("cpac_participants_failed")
+    registry.add("cpac_participants_failed")
+    registry.remove("cpac_container_memory_bytes", participant="sub-02")
+    text = registry.render()
+    assert 'cpac_container_memory_bytes{participant="sub-\\"01\\""} 2048\n' in text
+    assert "cpac_participants_failed_total 2\n" in text
+    assert text.endswith("# EOF\n")
+
+
+def test_server_serves_registry():
+    """Test that /metrics serves the registry's current values."""
+    registry = MetricsRegistry()
+    server = MetricsServer(0, registry)
+    try:
+        registry.set("cpac_running_containers", 3)
+        with urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            assert "cpac_running_containers 3\n" in response.read().decode()
+    finally:
+        server.stop()
+
+
+def test_scheduler_counts_participants():
+    """Test that finished participants are counted as passed or failed."""
+    completed = REGISTRY.get("cpac_participants_completed")
+    failed = REGISTRY.get("cpac_participants_failed")
+    ParticipantScheduler(
+        [ParticipantJob(index, str(index), 1, 1) for index in range(3)],
+        lambda job: job.index,
+        3,
+        10,
+        3,
+    ).run()
+    assert REGISTRY.get("cpac_participants_completed") == completed + 1
+    assert REGISTRY.get("cpac_participants_failed") == failed + 2
+    assert REGISTRY.get("cpac_queued_participants") == 0
+
+
+def test_running_container_metrics():
+    """Test that a running container is counted and its samples reported."""
+    backend = _docker(_FakeClient())
+    running = REGISTRY.get("cpac_running_containers")
+    with backend._telemetry(
+        iter([]), ["--participant_label", "sub-01"], metrics_port=9100
+    ):
+        assert REGISTRY.get("cpac_running_containers") == running + 1
+    assert REGISTRY.get("cpac_running_containers") == running
+    assert REGISTRY.get("cpac_phase_seconds", phase="container") > 0
+    assert REGISTRY.get("cpac_container_memory_bytes", participant="sub-01") is None
+
+
+def test_metrics_port_zero_reports_samples():
+    """Test that a server on a free port (0) still gets container samples."""
+    backend = _docker(_FakeClient())
+    sample = Sample(0.0, 150.0, 2048, 0, 0, 3)
+    with backend._telemetry(
+        iter([sample]), ["--participant_label", "sub-02"], metrics_port=0
+    ):
+        deadline = time.monotonic() + 5
+        while (
+            REGISTRY.get("cpac_container_memory_bytes", participant="sub-02") is None
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
+        assert (
+            REGISTRY.get("cpac_container_memory_bytes", participant="sub-02") == 2048  # noqa: PLR2004
+        )
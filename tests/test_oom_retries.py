@@ -0,0 +1,85 @@
+"""Tests for running C-PAC again when it runs out of memory."""
+
+from subprocess import CalledProcessError
+
+import pytest
+
+from cpac.backends.platform import Backend, OOM_EXIT_CODE
+from cpac.utils import ResolvedConfig
+from cpac.utils.placement import Placement
+
+
+class _OutOfMemoryBackend(Backend):
+    """Backend that runs out of memory until C-PAC is given enough."""
+
+    def __init__(self, needs_gb, raises=False):
+        # skip Backend.__init__'s tracking configuration and bindings
+        self.config = ResolvedConfig(
+            {"pipeline_setup": {"system_config": {"maximum_memory_per_participant": 4}}}
+        )
+        self.needs_gb = needs_gb
+        self.raises = raises
+        self.runs = []
+        self.scaled = []
+        self.exit_code = None
+        self.out_of_memory = False
+
+    def run(self, flags=None, **kwargs):
+        self.runs.append(flags)
+        memory_gb = float(flags[flags.index("--mem_gb") + 1]) if flags else 4
+        self.out_of_memory = memory_gb < self.needs_gb
+        self.exit_code = OOM_EXIT_CODE if self.out_of_memory else 0
+        if self.out_of_memory and self.raises:
+            raise CalledProcessError(self.exit_code, "singularity")
+
+    def _scale_memory_limit(self, factor):
+        self.scaled.append(factor)
+
+    def _cleanup(self):
+        pass
+
+
+@pytest.mark.parametrize("raises", [False, True])
+def test_retries_with_scaled_memory(raises):
+    """Test that memory is scaled until the run fits."""
+    backend = _OutOfMemoryBackend(needs_gb=8, raises=raises)
+    backend.run_with_retries(flags=[], oom_retries=3, oom_memory_factor=1.5)
+    assert backend.runs == [[], ["--mem_gb", "6"], ["--mem_gb", "9"]]
+    assert backend.scaled == [1.5, 1.5]
+    assert backend.exit_code == 0
+
+
+@pytest.mark.parametrize("raises", [False, True])
+def test_retries_are_capped(raises):
+    """Test that a run that never fits stops after the last retry."""
+    backend = _OutOfMemoryBackend(needs_gb=100, raises=raises)
+    if raises:
+        with pytest.raises(CalledProcessError):
+            backend.run_with_retries(flags=[], oom_retries=1)
+    else:
+        backend.run_with_retries(flags=[], oom_retries=1)
+    assert len(backend.runs) == 2  # noqa: PLR2004
+    assert backend.exit_code == OOM_EXIT_CODE
+
+
+def test_flags_memory_takes_precedence():
+    """Test that --mem_gb given to C-PAC is scaled rather than the config's."""
+    backend = _OutOfMemoryBackend(needs_gb=3)
+    backend.run_with_retries(
+        flags=["--mem_gb", "1", "--n_cpus", "2"], oom_retries=2, oom_memory_factor=2
+    )
+    assert backend.runs[-1] == ["--n_cpus", "2", "--mem_gb", "4"]
+
+
+def test_backend_defaults():
+    """Test that a backend without limits or pinning still runs and retries."""
+
+    class _UnlimitedBackend(_OutOfMemoryBackend):
+        _scale_memory_limit = Backend._scale_memory_limit
+
+    backend = _UnlimitedBackend(needs_gb=5)
+    backend.run_with_retries(flags=[], oom_retries=1)
+    assert backend.exit_code == 0
+    assert backend._read_container_file("/code/version") is None
+    with pytest.warns(UserWarning, match="cannot be pinned to CPUs 0-1"):
+        backend.pin(Placement([0, 1], [0]))
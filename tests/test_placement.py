@@ -0,0 +1,92 @@
+"""Tests for placing containers on CPUs and NUMA nodes."""
+
+import os
+import threading
+
+import pytest
+
+from cpac.backends.singularity import _COMMAND_PREFIX, _prefixed
+from cpac.utils import placement
+from cpac.utils.placement import CpuPlacer, numa_nodes, Placement
+
+
+def test_numa_nodes_reads_sysfs(tmp_path):
+    """Test that NUMA nodes only list CPUs this process may run on."""
+    allowed = sorted(os.sched_getaffinity(0))
+    for node, cpus in ((0, allowed[:1]), (1, allowed[1:]), (2, [max(allowed) + 1])):
+        (tmp_path / f"node{node}").mkdir()
+        (tmp_path / f"node{node}" / "cpulist").write_text(
+            ",".join(str(cpu) for cpu in cpus) + "\n"
+        )
+    (tmp_path / "possible").write_text("0-2\n")
+    expected = {0: allowed[:1], 1: allowed[1:]}
+    assert numa_nodes(str(tmp_path)) == {
+        node: cpus for node, cpus in expected.items() if cpus
+    }
+    assert numa_nodes(str(tmp_path / "missing")) == {-1: allowed}
+
+
+@pytest.mark.parametrize(
+    ("installed", "expected"),
+    [
+        ({"numactl", "taskset"}, ["numactl", "--physcpubind=2-3", "--membind=1"]),
+        ({"taskset"}, ["taskset", "--cpu-list", "2-3"]),
+        (set(), []),
+    ],
+)
+def test_command_prefix(installed, expected, monkeypatch):
+    """Test that numactl is preferred over taskset."""
+    monkeypatch.setattr(
+        placement.shutil, "which", lambda name: name if name in installed else None
+    )
+    assert Placement([2, 3], [1]).command_prefix() == expected
+
+
+def test_placements_are_disjoint():
+    """Test that concurrent acquisitions never share a CPU."""
+    placer = CpuPlacer({0: list(range(8)), 1: list(range(8, 16))})
+    placements = []
+    lock = threading.Lock()
+
+    def acquire():
+        acquired = placer.acquire(3)
+        with lock:
+            placements.append(acquired)
+
+    threads = [threading.Thread(target=acquire) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    granted = [acquired for acquired in placements if acquired is not None]
+    assert len(granted) == 5  # noqa: PLR2004
+    cpus = [cpu for acquired in granted for cpu in acquired.cpus]
+    assert len(cpus) == len(set(cpus))
+    assert sum(len(acquired.nodes) == 1 for acquired in granted) == 4  # noqa: PLR2004
+    for acquired in granted:
+        placer.release(acquired)
+    assert placer.acquire(8) == Placement(list(range(8)), [0])
+
+
+def test_singularity_command_prefix():
+    """Test that only the pinned thread's Singularity commands are prefixed."""
+    init_command = _prefixed(lambda self, action, flags=None: ["singularity", action])
+    assert _prefixed(init_command) is init_command
+    _COMMAND_PREFIX.command = ["taskset", "--cpu-list", "0-1"]
+    try:
+        assert init_command(None, "run") == [
+            "taskset",
+            "--cpu-list",
+            "0-1",
+            "singularity",
+            "run",
+        ]
+        other = []
+        thread = threading.Thread(
+            target=lambda: other.extend(init_command(None, "run"))
+        )
+        thread.start()
+        thread.join()
+        assert other == ["singularity", "run"]
+    finally:
+        _COMMAND_PREFIX.command = []
@@ -0,0 +1,99 @@
+"""Tests for planning participant runs from earlier runs."""
+
+import pytest
+
+from cpac.utils.planner import (
+    input_bytes_from_bids,
+    input_bytes_from_data_config,
+    plan,
+    planned_flags,
+    RunHistory,
+)
+from cpac.utils.scheduler import ParticipantJob
+from .test_cpac_parse_resources import write_callback_log
+
+
+def _jobs(labels):
+    return [ParticipantJob(index, label, 1.0, 1) for index, label in enumerate(labels)]
+
+
+def test_plan_orders_longest_first():
+    """Test that known participants repeat their runs and jobs run longest first."""
+    history = RunHistory(
+        [("sub-01_ses-1", 4.0, 100.0), ("sub-02_ses-1", 8.0, 300.0), ("x", 0, 10)]
+    )
+    assert len(history.runs) == 2  # noqa: PLR2004
+    jobs = plan(_jobs(["sub-01_ses-1", "02_1"]), history, headroom=0.5)
+    assert [job.label for job in jobs] == ["02_1", "sub-01_ses-1"]
+    assert [job.memory_limit_gb for job in jobs] == [12.0, 6.0]
+    assert [job.memory_gb for job in jobs] == [12.0, 6.0]
+
+
+def test_plan_scales_unknown_participants_by_input_size():
+    """Test that participants without history scale the cohort by input size."""
+    history = RunHistory([("sub-01", 4.0, 100.0), ("sub-02", 4.0, 300.0)])
+    jobs = plan(_jobs(["sub-03", "sub-04", "sub-05"]), history, [10, 20, 1000], 0)
+    by_label = {job.label: job for job in jobs}
+    assert by_label["sub-03"].predicted_wall_time == pytest.approx(100.0)
+    assert by_label["sub-04"].predicted_wall_time == pytest.approx(200.0)
+    # clamped to twice the cohort
+    assert by_label["sub-05"].memory_gb == pytest.approx(8.0)
+    assert jobs[0].label == "sub-05"
+
+
+def test_plan_without_history_keeps_jobs():
+    """Test that an empty history leaves jobs as configured."""
+    jobs = plan(_jobs(["sub-01", "sub-02"]), RunHistory([]))
+    assert [(job.label, job.memory_gb, job.memory_limit_gb) for job in jobs] == [
+        ("sub-01", 1.0, None),
+        ("sub-02", 1.0, None),
+    ]
+
+
+def test_history_from_callback_logs(tmp_path):
+    """Test that runs are read from callback.log files under participant dirs."""
+    for participant, n_nodes in (("sub-01_ses-1", 10), ("sub-02_ses-1", 40)):
+        log_dir = tmp_path / "log" / "pipeline_cpac" / participant
+        log_dir.mkdir(parents=True)
+        write_callback_log(log_dir / "callback.log", n_nodes)
+    history = RunHistory.from_callback_logs(
+        str(path) for path in sorted(tmp_path.glob("log/*/*/callback.log"))
+    )
+    assert sorted(history.by_participant) == [("01", "1"), ("02", "1")]
+    assert (
+        history.by_participant[("02", "1")][1] > history.by_participant[("01", "1")][1]
+    )
+
+
+def test_input_bytes(tmp_path):
+    """Test that input sizes come from data configuration paths and BIDS trees."""
+    (tmp_path / "sub-01" / "anat").mkdir(parents=True)
+    (tmp_path / "sub-01" / "anat" / "T1w.nii.gz").write_bytes(b"x" * 10)
+    (tmp_path / "sub-02").mkdir()
+    (tmp_path / "sub-02" / "T1w.nii.gz").write_bytes(b"x" * 3)
+    assert input_bytes_from_bids(str(tmp_path), ["sub-01", "sub-02", "sub-03"]) == [
+        10,
+        3,
+        0,
+    ]
+    data_config = tmp_path / "data_config.yml"
+    data_config.write_text(
+        f"- subject_id: '01'\n  anat: {tmp_path}/sub-01/anat/T1w.nii.gz\n"
+        f"  func:\n    rest:\n      scan: {tmp_path}/sub-02/T1w.nii.gz\n"
+        "- subject_id: '02'\n  anat: s3://bucket/T1w.nii.gz\n"
+    )
+    assert input_bytes_from_data_config(str(data_config)) == [13, 0]
+
+
+def test_planned_flags_set_mem_gb():
+    """Test that C-PAC is told the planned memory instead of the configured one."""
+    planned, unplanned = _jobs(["sub-01_ses-1", "sub-02_ses-1"])
+    planned.memory_limit_gb = 6.0
+    flags = ["--mem_gb", "16", "--participant_ndx", "0"]
+    assert planned_flags(planned, flags) == [
+        "--participant_ndx",
+        "0",
+        "--mem_gb",
+        "6",
+    ]
+    assert planned_flags(unplanned, flags) == flags
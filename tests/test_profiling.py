@@ -0,0 +1,70 @@
+"""Tests for timing cpac's phases."""
+
+import json
+import threading
+import time
+
+from cpac.utils.profiling import Profiler
+
+
+def test_profiled_functions_nest():
+    """Test that decorated calls are children of the span they run in."""
+    profiler = Profiler()
+
+    @profiler.profiled()
+    def prep_binding():
+        time.sleep(0.01)
+
+    @profiler.profiled("set bindings")
+    def set_bindings():
+        prep_binding()
+        prep_binding()
+
+    with profiler.span("setup"):
+        set_bindings()
+        with profiler.span("load logging"):
+            pass
+    setup = profiler.tree().children["setup"]
+    bindings = setup.children["set bindings"]
+    assert [span.name for span in setup.sorted_children()] == [
+        "set bindings",
+        "load logging",
+    ]
+    name = "test_profiled_functions_nest.<locals>.prep_binding"
+    assert bindings.children[name].calls == 2  # noqa: PLR2004
+    assert setup.seconds >= bindings.seconds >= bindings.children[name].seconds > 0
+
+
+def test_threads_open_spans_at_root():
+    """Test that each thread keeps its own stack of open spans."""
+    profiler = Profiler()
+
+    def participant():
+        with profiler.span("setup"):
+            pass
+
+    with profiler.span("scheduler"):
+        threads = [threading.Thread(target=participant) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    root = profiler.tree()
+    assert root.children["setup"].calls == 3  # noqa: PLR2004
+    assert not root.children["scheduler"].children
+
+
+def test_render_and_json(tmp_path):
+    """Test that the tree is printed as a table and written as JSON."""
+    profiler = Profiler()
+    with profiler.span("Docker handshake"):
+        pass
+    lines = profiler.render().splitlines()
+    assert lines[0].split() == ["seconds", "%", "calls", "phase"]
+    assert lines[1].endswith("  cpac")
+    assert lines[2].endswith("    Docker handshake")
+    path = tmp_path / "profile.json"
+    profiler.write_json(str(path))
+    tree = json.loads(path.read_text())
+    assert tree["children"][0]["name"] == "Docker handshake"
+    assert tree["children"][0]["calls"] == 1
@@ -0,0 +1,94 @@
+"""Tests for resolving pipeline configurations once per invocation."""
+
+import os
+
+import pytest
+
+from cpac.backends.platform import Backend
+from cpac.utils import ResolvedConfig
+from cpac.utils.configuration import preconfig_path
+
+MINIMAL_CONFIG = os.path.join(os.path.dirname(__file__), "test_data", "minimal.min.yml")
+
+
+class _FileBackend(Backend):
+    """Backend that serves in-container files from a dictionary."""
+
+    def __init__(self, container_files, **kwargs):
+        super().__init__(**kwargs)
+        self.container_files = container_files
+        self.reads = []
+
+    def _read_container_file(self, path):
+        self.reads.append(path)
+        return self.container_files.get(path)
+
+    def clarg(self, clcommand, flags=None, **kwargs):
+        raise AssertionError("collecting bindings should not launch a container")
+
+
+def test_collect_config_bindings_reads_once(tmp_path):
+    """Test that each ``FROM:`` ancestor is read exactly once."""
+    default = preconfig_path("default")
+    backend = _FileBackend(
+        {
+            default: "\n".join(
+                [
+                    "pipeline_setup:",
+                    *[
+                        f"  {key}:\n    path: {tmp_path / key}"
+                        for key in [
+                            "log_directory",
+                            "working_directory",
+                            "crash_log_directory",
+                            "output_directory",
+                        ]
+                    ],
+                ]
+            )
+        },
+        working_dir=str(tmp_path),
+        extra_args=["--tracking_opt-out"],
+    )
+    config = backend.resolve_config(backend._read_config_file(MINIMAL_CONFIG))
+    kwargs = backend.collect_config_bindings(config, output_dir=str(tmp_path))
+    assert backend.reads == [default]
+    assert {volume.local for volume in kwargs["config_bindings"]} == {
+        str(tmp_path / "working_directory"),
+        str(tmp_path / "output_directory"),
+    }
+
+
+def test_unresolvable_from_warns_once(tmp_path):
+    """Test that an unreadable ``FROM:`` warns once instead of per binding."""
+    backend = _FileBackend({}, working_dir=str(tmp_path))
+    with pytest.warns(UserWarning) as warnings:
+        backend.collect_config_bindings(
+            ResolvedConfig("FROM: nonexistent", fetch=backend._read_config_file)
+        )
+    assert len([w for w in warnings if "minimal" in str(w.message)]) == 1
+
+
+def test_observed_usage_is_bound(tmp_path):
+    """Test that a local observed-usage log is bound read-only."""
+    observed_log = tmp_path / "observed_usage.log"
+    observed_log.write_text("")
+    backend = _FileBackend({}, working_dir=str(tmp_path))
+    kwargs = backend.collect_config_bindings(
+        ResolvedConfig(
+            {
+                "pipeline_setup": {
+                    "system_config": {
+                        "observed_usage": {"callback_log": str(observed_log)}
+                    }
+                }
+            }
+        ),
+        output_dir=str(tmp_path),
+    )
+    (volume,) = [
+        volume
+        for volume in kwargs["config_bindings"]
+        if volume.local == str(observed_log)
+    ]
+    assert str(volume.mode) == "ro"
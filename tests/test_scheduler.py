@@ -0,0 +1,100 @@
+"""Tests for running many participants at once."""
+
+import threading
+import time
+
+import pytest
+
+from cpac.utils.scheduler import (
+    ParticipantJob,
+    participants_from_bids,
+    participants_from_data_config,
+    ParticipantScheduler,
+)
+
+
+def test_participants_from_data_config(tmp_path):
+    """Test that data configuration entries are labelled in order."""
+    data_config = tmp_path / "data_config.yml"
+    data_config.write_text(
+        "- subject_id: '01'\n  unique_id: '1'\n"
+        "- subject_id: '02'\n"
+        "- anat: /anat.nii.gz\n"
+    )
+    assert participants_from_data_config(str(data_config)) == [
+        "sub-01_ses-1",
+        "sub-02",
+        "2",
+    ]
+
+
+def test_participants_from_bids(tmp_path):
+    """Test that each subject's sessions are listed in sorted order."""
+    for path in ("sub-02/ses-b", "sub-02/ses-a", "sub-01/anat", "derivatives"):
+        (tmp_path / path).mkdir(parents=True)
+    assert participants_from_bids(str(tmp_path)) == [
+        "sub-01",
+        "sub-02_ses-a",
+        "sub-02_ses-b",
+    ]
+
+
+@pytest.mark.parametrize(
+    ("max_parallel", "memory_budget_gb", "expected_peak"),
+    [(4, 100, 4), (2, 100, 2), (4, 6, 2), (4, 1, 1)],
+)
+def test_scheduler_respects_budgets(
+    max_parallel, memory_budget_gb, expected_peak, tmp_path
+):
+    """Test that concurrency stays within the job and memory limits."""
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def launch(job):
+        with lock:
+            running.append(job)
+            peak.append(len(running))
+        print(f"running {job.label}")
+        time.sleep(0.05)
+        with lock:
+            running.remove(job)
+        return 1 if job.index == 3 else 0  # noqa: PLR2004
+
+    scheduler = ParticipantScheduler(
+        [
+            ParticipantJob(index, f"sub-{index}", 3, 1, str(tmp_path / f"{index}.log"))
+            for index in range(6)
+        ],
+        launch,
+        max_parallel,
+        memory_budget_gb,
+        cpu_budget=64,
+    )
+    jobs = scheduler.run()
+    assert max(peak) == expected_peak
+    assert [job.status for job in jobs] == ["passed"] * 3 + ["failed"] + ["passed"] * 2
+    assert not scheduler.passed
+    assert (tmp_path / "4.log").read_text() == "running sub-4\n"
+    assert "failed" in scheduler.summary()
+
+
+def test_scheduler_records_errors(tmp_path):
+    """Test that a job that raises fails without stopping the others."""
+
+    def launch(job):
+        if job.index == 0:
+            raise RuntimeError("no container")
+        return 0
+
+    scheduler = ParticipantScheduler(
+        [ParticipantJob(index, str(index), 1, 1) for index in range(2)],
+        launch,
+        2,
+        10,
+        2,
+    )
+    first, second = scheduler.run()
+    assert first.status == "failed"
+    assert isinstance(first.error, RuntimeError)
+    assert second.status == "passed"
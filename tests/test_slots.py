@@ -0,0 +1,67 @@
+"""Tests for sharing a host among cpac invocations."""
+
+import json
+import threading
+import time
+
+from cpac.utils.slots import HostSlots
+
+
+def _wait_for(condition, timeout=5.0):
+    """Wait until ``condition()`` is true."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_leases_queue_in_order(tmp_path):
+    """Test that a lease that fits still waits behind an earlier one."""
+    slots = HostSlots(str(tmp_path), memory_gb=4, cpus=4)
+    order, messages = [], {"big": [], "small": []}
+
+    def hold(name, memory_gb):
+        with slots.acquire(
+            memory_gb, 1, name, messages[name].append, poll_interval=0.01
+        ):
+            order.append(name)
+
+    # "small" fits beside "first" but not beside "big"
+    with slots.acquire(2, 2, "first"):
+        assert slots.usage() == {
+            "memory_gb": 2,
+            "cpus": 2,
+            "running": 1,
+            "waiting": 0,
+        }
+        big = threading.Thread(target=hold, args=("big", 3))
+        big.start()
+        _wait_for(lambda: messages["big"])
+        small = threading.Thread(target=hold, args=("small", 2))
+        small.start()
+        _wait_for(lambda: messages["small"])
+        assert slots.usage()["waiting"] == 2  # noqa: PLR2004
+        assert "0 ahead in queue" in messages["big"][0]
+        assert "1 ahead in queue" in messages["small"][0]
+        assert not order
+    big.join()
+    small.join()
+    assert order == ["big", "small"]
+    assert messages["big"][-1].startswith("Starting")
+    assert not list(tmp_path.glob("*.lease"))
+
+
+def test_oversized_lease_runs_alone(tmp_path):
+    """Test that a lease larger than the host is admitted when it is idle."""
+    slots = HostSlots(str(tmp_path), memory_gb=1, cpus=1)
+    with slots.acquire(8, 4) as lease:
+        assert lease.state == "running"
+
+
+def test_dead_leases_are_swept(tmp_path):
+    """Test that a lease nobody holds a lock on is not counted."""
+    slots = HostSlots(str(tmp_path), memory_gb=4, cpus=4)
+    stale = tmp_path / "00000000000000000000-1-dead.lease"
+    stale.write_text(json.dumps({"memory_gb": 4, "cpus": 4, "state": "running"}))
+    assert slots.usage()["memory_gb"] == 0
+    assert not stale.exists()
@@ -0,0 +1,120 @@
+"""Tests for sampling containers' resource use."""
+
+import csv
+from functools import partial
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from cpac.utils.telemetry import (
+    docker_samples,
+    ProcessTreeSampler,
+    read_pid,
+    record_pid,
+    Sample,
+    TelemetryRecorder,
+)
+from .test_docker_backend import _docker, _FakeClient
+
+
+def _stats(total_usage, system_usage, memory):
+    """Return a Docker stats record."""
+    return {
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": total_usage},
+            "system_cpu_usage": system_usage,
+            "online_cpus": 2,
+        },
+        "precpu_stats": {
+            "cpu_usage": {"total_usage": total_usage - 500},
+            "system_cpu_usage": system_usage - 1000,
+        },
+        "memory_stats": {"usage": memory, "stats": {"inactive_file": 100}},
+        "blkio_stats": {"io_service_bytes_recursive": None},
+        "pids_stats": {"current": 3},
+    }
+
+
+class _StatsContainer:
+    """Container that streams canned stats."""
+
+    def stats(self, stream, decode):
+        return iter([_stats(500, 1000, 1100), _stats(1000, 2000, 2100)])
+
+
+def test_recorder_keeps_one_sample_per_interval(tmp_path):
+    """Test that streamed samples are thinned to the interval and peaks kept."""
+    samples = [
+        Sample(0.0, 10.0, 100, 0, 0, 1),
+        Sample(1.0, 90.0, 300, 5, 1, 4),
+        Sample(5.0, 50.0, 200, 10, 2, 2),
+    ]
+    recorder = TelemetryRecorder(samples, str(tmp_path / "t" / "sub-01.csv"), 5)
+    with recorder:
+        recorder._thread.join()
+    with open(tmp_path / "t" / "sub-01.csv", encoding="utf-8") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    assert [row["time"] for row in rows] == ["0.0", "5.0"]
+    assert recorder.peak == Sample(5.0, 50.0, 200, 10, 2, 2)
+    assert recorder.summary("sub-01").startswith(
+        "Peak resource use of sub-01: 50% CPU, 200 B memory, 10 B read, 2 B written"
+    )
+
+
+def test_process_tree_sampler(tmp_path):
+    """Test that only the root process's tree is summed."""
+    for pid, ppid, rss in ((2, 1, 1), (3, 2, 2), (4, 1, 8), (5, 9, 16)):
+        (tmp_path / str(pid)).mkdir()
+        (tmp_path / str(pid) / "stat").write_text(
+            f"{pid} (a (b) c) S {ppid} 0 0 0 0 0 0 0 0 0 100 50 0 0\n"
+        )
+        (tmp_path / str(pid) / "status").write_text(f"Name:\ta\nVmRSS:\t{rss} kB\n")
+        (tmp_path / str(pid) / "io").write_text("read_bytes: 7\nwrite_bytes: 3\n")
+    sample = ProcessTreeSampler(2, str(tmp_path))()
+    assert (sample.memory_bytes, sample.block_read_bytes, sample.pids) == (
+        3 * 1024,
+        14,
+        2,
+    )
+    assert ProcessTreeSampler(lambda: None, str(tmp_path))().pids == 0
+
+
+def test_process_tree_sampler_follows_recorded_pid(tmp_path):
+    """Test that a renamed process is found by the PID its command recorded."""
+    pid_file = str(tmp_path / "run.pid")
+    # like Apptainer's starter, the command renames itself and starts a child
+    script = (
+        "import subprocess, sys; sys.argv[0] = 'runtime parent'; "
+        "subprocess.run(['sleep', '5'])"
+    )
+    process = subprocess.Popen(
+        [*record_pid(pid_file), sys.executable, "-c", script], start_new_session=True
+    )
+    try:
+        sampler = ProcessTreeSampler(partial(read_pid, pid_file))
+        deadline = time.monotonic() + 5
+        while sampler().pids < 2 and time.monotonic() < deadline:  # noqa: PLR2004
+            time.sleep(0.05)
+        assert read_pid(pid_file) == process.pid
+        sample = sampler()
+        assert sample.pids == 2  # noqa: PLR2004
+        assert sample.memory_bytes > 0
+    finally:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def test_docker_telemetry(tmp_path, capsys):
+    """Test that a Docker run's stats are recorded next to its outputs."""
+    backend = _docker(_FakeClient())
+    with backend._telemetry(
+        docker_samples(_StatsContainer()),
+        ["--participant_label", "sub-01"],
+        output_dir=str(tmp_path),
+        telemetry_interval=0.001,
+    ):
+        time.sleep(0.5)
+    assert (tmp_path / "telemetry" / "sub-01.csv").exists()
+    assert capsys.readouterr().out.startswith("Peak resource use of sub-01:")